@@ -0,0 +1,9 @@
+"""Event bus for the ACC -> PDR -> ARL -> RCA pipeline (see event_bus.py)."""
+from .event_bus import (
+    TOPIC_ACC_DECISIONS, TOPIC_ARL_EXCEPTIONS, TOPIC_PDR_DISPATCH, PoisonEventError, dead_letter_topic, get_event_bus
+)
+
+__all__ = [
+    "TOPIC_ACC_DECISIONS", "TOPIC_ARL_EXCEPTIONS", "TOPIC_PDR_DISPATCH", "PoisonEventError", "dead_letter_topic",
+    "get_event_bus"
+]
@@ -0,0 +1,328 @@
+"""
+Event bus shared by the ACC -> PDR -> ARL -> RCA pipeline.
+
+Kafka is used when KAFKA_BOOTSTRAP_SERVERS is set (or EVENT_BUS_BACKEND=kafka).
+EVENT_BUS_BACKEND=memory selects an embedded, single-process broker with the
+same partitioning and consumer-group semantics, used for tests and local runs.
+Otherwise the bus is disabled and services keep their HTTP fallbacks.
+
+A handler error leaves the event uncommitted and its partition is retried in
+order with backoff. Events that can never be processed (malformed events, or
+a handler raising PoisonEventError), and events still failing after
+EVENT_BUS_MAX_ATTEMPTS, go to the topic's dead-letter topic and are committed.
+"""
+import json
+import os
+import threading
+import uuid
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+TOPIC_ACC_DECISIONS = "acc.decisions"
+TOPIC_PDR_DISPATCH = "pdr.dispatch"
+TOPIC_ARL_EXCEPTIONS = "arl.exceptions"
+
+DEFAULT_PARTITIONS = int(os.getenv("EVENT_BUS_PARTITIONS", "6"))
+MAX_ATTEMPTS = int(os.getenv("EVENT_BUS_MAX_ATTEMPTS", "8"))
+RETRY_BACKOFF_SECONDS = 0.5
+MAX_RETRY_BACKOFF_SECONDS = 30.0
+
+
+class PoisonEventError(Exception):
+    """Raised by a handler for an event that can never be processed; it is dead-lettered without retries"""
+
+
+# Malformed events fail the same way on every attempt
+PERMANENT_ERRORS = (PoisonEventError, KeyError, ValueError, TypeError)
+
+
+def dead_letter_topic(topic: str) -> str:
+    return f"{topic}.dead-letter"
+
+
+def partition_for(key: str, partitions: int) -> int:
+    """Stable key -> partition mapping so one batch/line always lands on the same partition"""
+    return zlib.crc32(key.encode("utf-8")) % partitions
+
+
+class InMemoryBroker:
+    """Partitioned append-only logs with committed offsets per consumer group"""
+
+    def __init__(self, partitions: int = DEFAULT_PARTITIONS):
+        self.partitions = partitions
+        self._logs: Dict[str, List[List[Tuple[str, Any]]]] = {}
+        self._offsets: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        self._members: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+        self._cond = threading.Condition()
+
+    def _log(self, topic: str) -> List[List[Tuple[str, Any]]]:
+        if topic not in self._logs:
+            self._logs[topic] = [[] for _ in range(self.partitions)]
+        return self._logs[topic]
+
+    def produce(self, topic: str, key: str, value: Any) -> Tuple[int, int]:
+        # Round-trip through JSON so consumers get the same shapes Kafka would deliver
+        value = json.loads(json.dumps(value, default=str))
+        with self._cond:
+            partition = partition_for(key, self.partitions)
+            log = self._log(topic)[partition]
+            log.append((key, value))
+            self._cond.notify_all()
+            return partition, len(log) - 1
+
+    def join(self, group: str, topic: str, member: str):
+        with self._cond:
+            self._members[(group, topic)].append(member)
+
+    def leave(self, group: str, topic: str, member: str):
+        with self._cond:
+            members = self._members[(group, topic)]
+            if member in members:
+                members.remove(member)
+
+    def assignment(self, group: str, topic: str, member: str) -> List[int]:
+        """Round-robin partition assignment across the live members of a group"""
+        members = sorted(self._members[(group, topic)])
+        if member not in members:
+            return []
+        index = members.index(member)
+        return [p for p in range(self.partitions) if p % len(members) == index]
+
+    def poll(self, group: str, topic: str, member: str, max_records: int = 100, timeout: float = 1.0) -> List[Tuple[int, int, str, Any]]:
+        with self._cond:
+            records = self._fetch(group, topic, member, max_records)
+            if not records:
+                self._cond.wait(timeout)
+                records = self._fetch(group, topic, member, max_records)
+            return records
+
+    def _fetch(self, group: str, topic: str, member: str, max_records: int) -> List[Tuple[int, int, str, Any]]:
+        records = []
+        log = self._log(topic)
+        for partition in self.assignment(group, topic, member):
+            offset = self._offsets[(group, topic, partition)]
+            for i, (key, value) in enumerate(log[partition][offset:offset + max_records - len(records)]):
+                records.append((partition, offset + i, key, value))
+            if len(records) >= max_records:
+                break
+        return records
+
+    def commit(self, group: str, topic: str, partition: int, offset: int):
+        with self._cond:
+            key = (group, topic, partition)
+            self._offsets[key] = max(self._offsets[key], offset + 1)
+
+    def lag(self, group: str, topic: str) -> int:
+        with self._cond:
+            log = self._log(topic)
+            return sum(len(log[p]) - self._offsets[(group, topic, p)] for p in range(self.partitions))
+
+
+class Subscription:
+    """A consumer thread; start several with the same group_id to scale out"""
+
+    def __init__(self, name: str, loop: Callable[[threading.Event], None]):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=loop, args=(self._stop,), name=name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._thread.join(timeout=timeout)
+
+
+class _Retries:
+    """Runs a subscription's handler and tracks delivery attempts of the events it failed"""
+
+    def __init__(self, topic: str, handler: Callable[[Dict[str, Any]], None],
+                 publish: Callable[[str, str, Dict[str, Any]], None]):
+        self.topic = topic
+        self.handler = handler
+        self.publish = publish
+        self._attempts: Dict[Tuple[int, int], int] = {}
+        self._backoff = 0.0
+
+    def handle(self, partition: int, offset: int, key: Optional[str], value: Dict[str, Any]) -> bool:
+        """True once the event may be committed: handled or dead-lettered; False to retry it"""
+        try:
+            self.handler(value)
+        except PERMANENT_ERRORS as e:
+            self._dead_letter(key, value, e, self._attempts.pop((partition, offset), 0) + 1)
+            return True
+        except Exception as e:
+            attempts = self._attempts.get((partition, offset), 0) + 1
+            if attempts >= MAX_ATTEMPTS:
+                del self._attempts[(partition, offset)]
+                self._dead_letter(key, value, e, attempts)
+                return True
+            self._attempts[(partition, offset)] = attempts
+            backoff = min(RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_RETRY_BACKOFF_SECONDS)
+            self._backoff = max(self._backoff, backoff)
+            print(f"⚠️  Error handling {self.topic} event (attempt {attempts}/{MAX_ATTEMPTS}), retrying: {e}")
+            return False
+        self._attempts.pop((partition, offset), None)
+        return True
+
+    def _dead_letter(self, key: Optional[str], value: Dict[str, Any], error: Exception, attempts: int):
+        print(f"❌ Dead-lettering {self.topic} event after {attempts} attempt(s): {error}")
+        self.publish(dead_letter_topic(self.topic), key or self.topic, {
+            "topic": self.topic,
+            "error": f"{type(error).__name__}: {error}",
+            "attempts": attempts,
+            "failed_at": datetime.utcnow().isoformat(),
+            "event": value
+        })
+
+    def wait(self, stop: threading.Event):
+        """Back off before polling again after a failure"""
+        if self._backoff:
+            stop.wait(self._backoff)
+            self._backoff = 0.0
+
+
+class NullBus:
+    enabled = False
+
+    def publish(self, topic: str, key: str, value: Dict[str, Any]):
+        pass
+
+    def subscribe(self, topic: str, group_id: str, handler: Callable[[Dict[str, Any]], None]):
+        return None
+
+    def close(self):
+        pass
+
+
+class InMemoryBus:
+    enabled = True
+
+    def __init__(self, broker: InMemoryBroker = None):
+        self.broker = broker or InMemoryBroker()
+        self._subscriptions: List[Subscription] = []
+
+    def publish(self, topic: str, key: str, value: Dict[str, Any]):
+        self.broker.produce(topic, str(key), value)
+
+    def subscribe(self, topic: str, group_id: str, handler: Callable[[Dict[str, Any]], None]) -> Subscription:
+        member = f"{group_id}-{uuid.uuid4().hex[:8]}"
+        self.broker.join(group_id, topic, member)
+
+        def loop(stop: threading.Event):
+            retries = _Retries(topic, handler, self.publish)
+            try:
+                while not stop.is_set():
+                    failed = set()
+                    for partition, offset, key, value in self.broker.poll(group_id, topic, member, timeout=0.5):
+                        if partition in failed:
+                            continue
+                        if retries.handle(partition, offset, key, value):
+                            self.broker.commit(group_id, topic, partition, offset)
+                        else:
+                            # Uncommitted, so the next poll starts the partition from this event again
+                            failed.add(partition)
+                    retries.wait(stop)
+            finally:
+                self.broker.leave(group_id, topic, member)
+
+        subscription = Subscription(f"{topic}-{member}", loop)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def close(self):
+        for subscription in self._subscriptions:
+            subscription.stop()
+        self._subscriptions = []
+
+
+class KafkaBus:
+    enabled = True
+
+    def __init__(self, bootstrap_servers: str):
+        from kafka import KafkaProducer
+
+        self.bootstrap_servers = bootstrap_servers
+        # Kafka's default partitioner hashes the key, which gives per-line/batch ordering
+        self.producer = KafkaProducer(
+            bootstrap_servers=bootstrap_servers,
+            key_serializer=lambda k: k.encode("utf-8"),
+            value_serializer=lambda v: json.dumps(v, default=str).encode("utf-8"),
+            acks="all",
+            linger_ms=5
+        )
+        self._subscriptions: List[Subscription] = []
+
+    def publish(self, topic: str, key: str, value: Dict[str, Any]):
+        try:
+            self.producer.send(topic, key=str(key), value=value)
+        except Exception as e:
+            print(f"⚠️  Failed to publish {topic} event: {e}")
+
+    def subscribe(self, topic: str, group_id: str, handler: Callable[[Dict[str, Any]], None]) -> Subscription:
+        from kafka import KafkaConsumer
+        from kafka.structs import OffsetAndMetadata
+
+        def loop(stop: threading.Event):
+            consumer = KafkaConsumer(
+                topic,
+                bootstrap_servers=self.bootstrap_servers,
+                group_id=group_id,
+                enable_auto_commit=False,
+                auto_offset_reset="earliest",
+                key_deserializer=lambda k: k.decode("utf-8") if k is not None else None,
+                value_deserializer=lambda v: json.loads(v.decode("utf-8"))
+            )
+            retries = _Retries(topic, handler, self.publish)
+            try:
+                while not stop.is_set():
+                    batch = consumer.poll(timeout_ms=500, max_records=500)
+                    offsets = {}
+                    for partition, records in batch.items():
+                        for record in records:
+                            if not retries.handle(partition.partition, record.offset, record.key, record.value):
+                                # Rewind so the next poll delivers this event and the rest of the partition again
+                                consumer.seek(partition, record.offset)
+                                break
+                            offsets[partition] = OffsetAndMetadata(record.offset + 1, "")
+                    if offsets:
+                        consumer.commit(offsets)
+                    retries.wait(stop)
+            finally:
+                consumer.close()
+
+        subscription = Subscription(f"{topic}-{group_id}", loop)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def close(self):
+        for subscription in self._subscriptions:
+            subscription.stop()
+        self._subscriptions = []
+        self.producer.flush(timeout=5)
+        self.producer.close()
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_event_bus():
+    """Process-wide bus selected from EVENT_BUS_BACKEND / KAFKA_BOOTSTRAP_SERVERS"""
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            bootstrap = os.getenv("KAFKA_BOOTSTRAP_SERVERS")
+            backend = os.getenv("EVENT_BUS_BACKEND") or ("kafka" if bootstrap else "none")
+            if backend == "kafka":
+                try:
+                    _bus = KafkaBus(bootstrap or "localhost:9092")
+                    print(f"✅ Event bus connected to Kafka at {_bus.bootstrap_servers}")
+                except Exception as e:
+                    print(f"⚠️  Kafka unavailable ({e}), event bus disabled")
+                    _bus = NullBus()
+            elif backend == "memory":
+                _bus = InMemoryBus()
+            else:
+                _bus = NullBus()
+        return _bus
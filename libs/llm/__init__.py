@@ -0,0 +1,5 @@
+"""LLM helpers shared by the CRRAK and RCA services."""
+from .cache import ResponseCache, cache_key, fingerprint, normalise_query
+from .client import LLMClient, get_llm_client
+
+__all__ = ["LLMClient", "ResponseCache", "cache_key", "fingerprint", "get_llm_client", "normalise_query"]
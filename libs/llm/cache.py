@@ -0,0 +1,189 @@
+"""
+LLM response cache with request coalescing.
+
+Prompts here are deterministic (temperature=0), so a response is keyed on
+the normalised query, a fingerprint of the data the prompt was built from
+and the prompt version: the same question about unchanged data is answered
+from memory, and any change to the data produces a new key. Entries expire
+after a TTL, are bounded by an LRU, and can be dropped by tag (e.g. a
+line_id) when the underlying data is known to have changed. Concurrent
+requests for a key that is already being computed wait for that one
+upstream call instead of issuing their own. In async code that call runs in
+its own task: a cancelled caller leaves it running for the others, and it is
+cancelled only once no caller is left waiting. Failures are never cached.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+DEFAULT_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalise_query(query: str) -> str:
+    return _SPACES.sub(" ", (query or "").strip().lower()).rstrip("?.! ")
+
+
+def fingerprint(data: Any) -> str:
+    """Stable hash of the data a prompt is built from"""
+    payload = json.dumps(data, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_key(kind: str, query: str, data: Any, prompt_version: str, model: str = "") -> str:
+    return f"{kind}:{prompt_version}:{model}:{fingerprint([normalise_query(query), data])}"
+
+
+class ResponseCache:
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[float, Any, Tuple[str, ...]]]" = OrderedDict()
+        self.tags: Dict[str, set] = {}
+        self.inflight: Dict[str, Future] = {}
+        self.ainflight: Dict[str, list] = {}  # key -> [task, callers waiting on it]
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "expired": 0, "invalidated": 0}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: str) -> Tuple[bool, Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self._drop(key)
+            self.counters["expired"] += 1
+            return False, None
+        self.entries.move_to_end(key)
+        return True, value
+
+    def _drop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            for tag in entry[2]:
+                keys = self.tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.tags[tag]
+
+    def _store(self, key: str, value: Any, tags: Iterable[str]):
+        tags = tuple(tags)
+        with self._lock:
+            self._drop(key)
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, value, tags)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            found, value = self._lookup(key)
+            self.counters["hits" if found else "misses"] += 1
+            return value
+
+    def put(self, key: str, value: Any, tags: Iterable[str] = ()):
+        """Store a value computed outside get_or_compute, e.g. a streamed response once complete"""
+        self._store(key, value, tags)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], tags: Iterable[str] = ()) -> Any:
+        """Cached value for key, computing it once however many threads ask at the same time"""
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.counters["hits"] += 1
+                return value
+            pending = self.inflight.get(key)
+            if pending is None:
+                self.inflight[key] = owner = Future()
+                self.counters["misses"] += 1
+            else:
+                self.counters["coalesced"] += 1
+        if pending is not None:
+            return pending.result()
+        try:
+            value = compute()
+        except BaseException as e:
+            owner.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self.inflight.pop(key, None)
+        self._store(key, value, tags)
+        owner.set_result(value)
+        return value
+
+    async def _acompute(self, key: str, compute: Callable[[], Awaitable[Any]], tags: Iterable[str]) -> Any:
+        try:
+            value = await compute()
+        finally:
+            with self._lock:
+                entry = self.ainflight.get(key)
+                if entry is not None and entry[0] is asyncio.current_task():
+                    del self.ainflight[key]
+        self._store(key, value, tags)
+        return value
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]], tags: Iterable[str] = ()) -> Any:
+        """Async form of get_or_compute for callers on one event loop"""
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.counters["hits"] += 1
+                return value
+            entry = self.ainflight.get(key)
+            if entry is None:
+                task = asyncio.get_running_loop().create_task(self._acompute(key, compute, tags))
+                self.ainflight[key] = entry = [task, 0]
+                self.counters["misses"] += 1
+            else:
+                self.counters["coalesced"] += 1
+            entry[1] += 1
+        try:
+            # Shielded, so cancelling this caller does not cancel the call the others wait on
+            return await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            with self._lock:
+                entry[1] -= 1
+                abandoned = entry[1] == 0 and not entry[0].done()
+                if abandoned and self.ainflight.get(key) is entry:
+                    del self.ainflight[key]
+            if abandoned:
+                # Nobody is left waiting: stop the upstream call and free its slot
+                entry[0].cancel()
+            raise
+        else:
+            with self._lock:
+                entry[1] -= 1
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        """Drop every entry carrying one of the tags"""
+        dropped = 0
+        with self._lock:
+            for tag in tags:
+                for key in list(self.tags.get(tag, ())):
+                    self._drop(key)
+                    dropped += 1
+            self.counters["invalidated"] += dropped
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"] + self.counters["coalesced"]
+            return {
+                **self.counters,
+                "entries": len(self.entries),
+                "inflight": len(self.inflight) + len(self.ainflight),
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else None,
+                "coalesced_rate": round(self.counters["coalesced"] / lookups, 3) if lookups else None
+            }
@@ -0,0 +1,233 @@
+"""
+Async LLM client shared by the CRRAK and RCA services.
+
+Endpoints await completions instead of blocking the event loop on the sync
+OpenAI client. Calls go through one pooled HTTP client per process, a
+semaphore caps how many are in flight (LLM_MAX_CONCURRENCY), each attempt
+has a timeout (LLM_TIMEOUT_SECONDS), and timeouts, connection errors, 429s
+and 5xxs are retried with full-jitter exponential backoff (LLM_MAX_RETRIES).
+
+LLM_BACKEND=openai (the default) talks to OpenAI or any compatible server at
+OPENAI_BASE_URL, e.g. scripts/mock_llm_server.py. LLM_BACKEND=stub answers
+locally after LLM_STUB_LATENCY_MS without any network, for tests and load
+runs.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+from typing import Any, AsyncIterator, Dict, List
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+DEFAULT_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+
+Messages = List[Dict[str, str]]
+
+
+class OpenAIBackend:
+    name = "openai"
+
+    def __init__(self, max_connections: int = DEFAULT_MAX_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT_SECONDS):
+        import httpx
+        import openai
+
+        self.errors = openai
+        # Retries are done by LLMClient, so the SDK's own are off
+        self.client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            timeout=timeout,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                timeout=timeout
+            )
+        )
+
+    async def complete(self, messages: Messages, model: str, temperature: float) -> str:
+        response = await self.client.chat.completions.create(model=model, messages=messages, temperature=temperature)
+        return response.choices[0].message.content.strip()
+
+    async def stream(self, messages: Messages, model: str, temperature: float) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=model, messages=messages, temperature=temperature, stream=True
+        )
+        try:
+            async for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    yield text
+        finally:
+            # Frees the pooled connection when the caller stops reading early
+            await stream.response.aclose()
+
+    def retryable(self, error: Exception) -> bool:
+        return isinstance(error, (
+            self.errors.APITimeoutError, self.errors.APIConnectionError,
+            self.errors.RateLimitError, self.errors.InternalServerError
+        ))
+
+    async def close(self):
+        await self.client.close()
+
+
+class StubBackend:
+    """Deterministic local answers; JSON-format prompts get an RCA-shaped object"""
+    name = "stub"
+
+    def __init__(self, latency: float = None):
+        self.latency = float(os.getenv("LLM_STUB_LATENCY_MS", "200")) / 1000 if latency is None else latency
+
+    def answer(self, messages: Messages) -> str:
+        prompt = "\n".join(message.get("content", "") for message in messages)
+        line_id = re.search(r'"line_id":\s*"([^"]+)"', prompt)
+        if "JSON format" in prompt:
+            return json.dumps({
+                "line_id": line_id.group(1) if line_id else None,
+                "root_cause": "Stub analysis: no model was called.",
+                "failure_category": "Technical",
+                "recommended_action": "1) Configure LLM_BACKEND=openai for real analyses",
+                "evidence_refs": {"stub": True}
+            })
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+        return f"## Executive Summary\nStub explanation {digest}; no model was called."
+
+    async def complete(self, messages: Messages, model: str, temperature: float) -> str:
+        await asyncio.sleep(self.latency)
+        return self.answer(messages)
+
+    async def stream(self, messages: Messages, model: str, temperature: float) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency)
+        for token in re.findall(r"\S+\s*|\s+", self.answer(messages)):
+            yield token
+
+    def retryable(self, error: Exception) -> bool:
+        return False
+
+    async def close(self):
+        pass
+
+
+class LLMClient:
+    def __init__(self, backend, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 timeout: float = DEFAULT_TIMEOUT_SECONDS, max_retries: int = DEFAULT_MAX_RETRIES):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.counters = {"calls": 0, "retries": 0, "timeouts": 0, "failures": 0}
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphores: Dict[int, asyncio.Semaphore] = {}
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # One per event loop: RCA's event-bus consumer and tests may run their own loops
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(id(loop))
+        if semaphore is None:
+            semaphore = self._semaphores[id(loop)] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def _retryable(self, error: Exception) -> bool:
+        return isinstance(error, asyncio.TimeoutError) or self.backend.retryable(error)
+
+    async def _backoff(self, attempt: int, error: Exception):
+        # Full jitter, so callers that failed together do not retry together
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+        self.counters["retries"] += 1
+        print(f"⚠️  LLM call failed ({type(error).__name__}: {error}), retry {attempt + 1} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    async def _acquire(self) -> asyncio.Semaphore:
+        semaphore = self._semaphore()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return semaphore
+
+    def _release(self, semaphore: asyncio.Semaphore):
+        self.in_flight -= 1
+        semaphore.release()
+
+    async def complete(self, messages: Messages, model: str = "gpt-4", temperature: float = 0) -> str:
+        self.counters["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            semaphore = await self._acquire()
+            try:
+                return await asyncio.wait_for(self.backend.complete(messages, model, temperature), self.timeout)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.counters["timeouts"] += 1
+                if attempt == self.max_retries or not self._retryable(e):
+                    self.counters["failures"] += 1
+                    raise
+                error = e
+            finally:
+                self._release(semaphore)
+            await self._backoff(attempt, error)
+
+    async def stream(self, messages: Messages, model: str = "gpt-4", temperature: float = 0) -> AsyncIterator[str]:
+        """Completion text as it is generated; retried only until the first chunk has been yielded"""
+        self.counters["calls"] += 1
+        for attempt in range(self.max_retries + 1):
+            semaphore, started = await self._acquire(), False
+            chunks = self.backend.stream(messages, model, temperature).__aiter__()
+            try:
+                while True:
+                    # The timeout bounds the gap between chunks, not the whole completion
+                    try:
+                        text = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        return
+                    started = True
+                    yield text
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.counters["timeouts"] += 1
+                if started or attempt == self.max_retries or not self._retryable(e):
+                    self.counters["failures"] += 1
+                    raise
+                error = e
+            finally:
+                await chunks.aclose()
+                self._release(semaphore)
+            await self._backoff(attempt, error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend.name,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            **self.counters
+        }
+
+    async def close(self):
+        await self.backend.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """Process-wide client selected from LLM_BACKEND"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            backend = os.getenv("LLM_BACKEND", "openai")
+            if backend == "stub":
+                _client = LLMClient(StubBackend())
+            else:
+                _client = LLMClient(OpenAIBackend())
+            print(f"✅ LLM client: {backend} backend, {_client.max_concurrency} concurrent calls")
+        return _client
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Concurrent load test for the LLM-backed endpoints (CRRAK /explain, RCA /rca).
+
+Fires --requests requests, --concurrency at a time, each with a distinct query
+so the response cache does not answer them, and reports latency percentiles
+and throughput. The serialisation factor compares wall time with what fully
+parallel execution would take (the fastest request times the number of
+waves): about 1.0 means requests overlap, about the concurrency means the
+service handled them one at a time. The service's own LLM_MAX_CONCURRENCY
+cap shows up here too when it is below --concurrency.
+
+Run the service against the local mock or the stub backend so the result
+measures the service, not the model:
+    python scripts/mock_llm_server.py --latency-ms 1000
+    OPENAI_BASE_URL=http://localhost:8900/v1 OPENAI_API_KEY=mock python services/crrak/main.py
+    python scripts/llm_load_test.py --url http://localhost:8001/explain --concurrency 20 --requests 40
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def body(kind, i):
+    if kind == "rca":
+        return {"line_id": f"L-{i + 1}", "query": f"Why did this payment fail? (load test {i})"}
+    return {"query": f"Summarise overall payment health (load test {i})"}
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(args):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, errors = [], 0
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=httpx.Limits(max_connections=args.concurrency)) as http:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await http.post(args.url, json=body(args.kind, i))
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    errors += 1
+                    print(f"❌ request {i}: {e}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        wall = time.perf_counter() - started
+
+        upstream = None
+        if args.mock_stats:
+            upstream = (await http.get(args.mock_stats)).json().get("requests")
+
+    if not latencies:
+        print("No successful requests")
+        return
+    ordered = sorted(latencies)
+    median = statistics.median(ordered)
+    parallel_wall = ordered[0] * -(-args.requests // args.concurrency)
+    print(f"requests={args.requests} concurrency={args.concurrency} ok={len(latencies)} errors={errors}")
+    print(f"wall={wall:.2f}s throughput={len(latencies) / wall:.1f} req/s")
+    print(f"latency p50={median:.2f}s p95={percentile(ordered, 0.95):.2f}s max={ordered[-1]:.2f}s")
+    print(f"serialisation factor={wall / parallel_wall:.2f} (1.0 = fully concurrent, {args.concurrency} = serial)")
+    if upstream is not None:
+        print(f"upstream LLM calls (mock total)={upstream}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8001/explain")
+    parser.add_argument("--kind", choices=["explain", "rca"], default=None, help="request body shape (default: from the URL)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--mock-stats", default=None, help="mock server /stats URL, to report upstream calls")
+    args = parser.parse_args()
+    args.kind = args.kind or ("rca" if args.url.rstrip("/").endswith("/rca") else "explain")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
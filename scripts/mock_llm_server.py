@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible chat completions server for tests and benchmarks.
+
+Answers POST /v1/chat/completions deterministically after a configurable
+latency, without network access or an API key. With "stream": true the
+answer is sent as OpenAI-style SSE chunks, one word every --token-ms.
+Prompts that ask for a JSON object (RCA) get a valid RCA JSON built from the
+ids found in the prompt; anything else (CRRAK) gets a short markdown audit
+report. GET /stats returns
+how many upstream calls were served, which is what cache and coalescing
+benchmarks compare against the number of client requests.
+
+Point a service at it with:
+    python scripts/mock_llm_server.py --port 8900 --latency-ms 800 --token-ms 20
+    OPENAI_BASE_URL=http://localhost:8900/v1 OPENAI_API_KEY=mock uvicorn main:app
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+stats = {"requests": 0, "by_model": {}}
+stats_lock = threading.Lock()
+
+
+def _find(pattern, text, default=None):
+    match = re.search(pattern, text)
+    return match.group(1) if match else default
+
+
+def rca_answer(prompt):
+    line_id = _find(r'"line_id":\s*"([^"]+)"', prompt, "L-0")
+    return json.dumps({
+        "rca_id": int(_find(r'"rca_id":\s*(\d+)', prompt, "0")),
+        "line_id": line_id,
+        "batch_id": _find(r'"batch_id":\s*"([^"]*)"', prompt, ""),
+        "root_cause": f"Mock root cause for {line_id}: beneficiary bank timeout during settlement.",
+        "failure_category": "Technical",
+        "recommended_action": "1) Retry on fallback rail 2) Monitor bank uptime 3) Notify operations",
+        "evidence_refs": {"mock": True},
+        "created_at": _find(r'"created_at":\s*"([^"]+)"', prompt, "1970-01-01T00:00:00")
+    })
+
+
+def audit_answer(prompt):
+    digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+    subject = _find(r"AUDIT REQUEST: ([^\n]+)", prompt, "General Analysis")
+    return (
+        f"## Executive Summary\nMock audit report for {subject.strip()}.\n\n"
+        f"## Findings & Root Cause Analysis\n1. **Deterministic response** for prompt {digest}.\n\n"
+        "## Recommendations\n1. No action required (mock)."
+    )
+
+
+def tokens(content):
+    """Words with their trailing whitespace, roughly how a model streams"""
+    return re.findall(r"\S+\s*|\s+", content)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    token_delay = 0.0
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with stats_lock:
+                return self._send(200, stats)
+        self._send(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send(404, {"error": {"message": "not found"}})
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model = request.get("model", "mock")
+        prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+        with stats_lock:
+            stats["requests"] += 1
+            stats["by_model"][model] = stats["by_model"].get(model, 0) + 1
+        time.sleep(self.latency)
+        content = rca_answer(prompt) if "JSON format" in prompt else audit_answer(prompt)
+        if request.get("stream"):
+            return self._stream(model, content)
+        self._send(200, {
+            "id": f"chatcmpl-mock-{stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (len(prompt) + len(content)) // 4}
+        })
+
+    def _stream(self, model, content):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        base = {"id": f"chatcmpl-mock-{stats['requests']}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": model}
+        deltas = [{"role": "assistant", "content": ""}] + [{"content": token} for token in tokens(content)]
+        try:
+            for delta in deltas:
+                chunk = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(self.token_delay)
+            final = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, as services do when their caller disconnects
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=500, help="delay before every response")
+    parser.add_argument("--token-ms", type=float, default=20, help="delay between streamed tokens")
+    args = parser.parse_args()
+
+    Handler.latency = args.latency_ms / 1000
+    Handler.token_delay = args.token_ms / 1000
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"🤖 Mock LLM on http://{args.host}:{args.port}/v1 ({args.latency_ms:.0f} ms latency)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
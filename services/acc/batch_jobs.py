@@ -0,0 +1,269 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func
+
+from database import SessionLocal, AccBatchJob, AccBatchLine
+
+MAX_ATTEMPTS = 3
+# Pause after OPA was unreachable, so an outage does not use up every line's attempts at once
+OPA_RETRY_SECONDS = 10.0
+
+
+def submit_batch(db, transactions: List[Dict[str, Any]], batch_id: Optional[str] = None) -> str:
+    """Persist a batch and its lines; workers pick the lines up from the table"""
+    batch_id = batch_id or f"BATCH-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    try:
+        db.add(AccBatchJob(batch_id=batch_id, status="QUEUED", total_lines=len(transactions)))
+        db.bulk_insert_mappings(AccBatchLine, [
+            {
+                "batch_id": batch_id,
+                "line_no": i,
+                "line_id": txn.get("transaction_id"),
+                "payload": txn,
+                "status": "PENDING",
+                "attempts": 0
+            }
+            for i, txn in enumerate(transactions, start=1)
+        ])
+        db.commit()
+        return batch_id
+    except Exception:
+        db.rollback()
+        raise
+
+
+def get_batch_progress(db, batch_id: str) -> Optional[Dict[str, Any]]:
+    """Line counts by status and decision for a batch"""
+    job = db.query(AccBatchJob).filter(AccBatchJob.batch_id == batch_id).first()
+    if not job:
+        return None
+
+    by_status = dict(
+        db.query(AccBatchLine.status, func.count(AccBatchLine.id))
+        .filter(AccBatchLine.batch_id == batch_id)
+        .group_by(AccBatchLine.status)
+        .all()
+    )
+    by_decision = dict(
+        db.query(AccBatchLine.decision, func.count(AccBatchLine.id))
+        .filter(AccBatchLine.batch_id == batch_id, AccBatchLine.decision.isnot(None))
+        .group_by(AccBatchLine.decision)
+        .all()
+    )
+    processed = by_status.get("DONE", 0) + by_status.get("FAILED", 0)
+    total = job.total_lines or 0
+
+    return {
+        "batch_id": job.batch_id,
+        "status": job.status,
+        "total_lines": total,
+        "processed_lines": processed,
+        "progress_percent": round(processed / total * 100, 1) if total else 100.0,
+        "lines_by_status": by_status,
+        "decisions": by_decision,
+        "summary": job.summary,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "completed_at": job.completed_at.isoformat() if job.completed_at else None
+    }
+
+
+def get_batch_results(db, batch_id: str, offset: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+    """Decisions committed so far for a batch, in file order"""
+    lines = (
+        db.query(AccBatchLine)
+        .filter(AccBatchLine.batch_id == batch_id, AccBatchLine.status.in_(["DONE", "FAILED"]))
+        .order_by(AccBatchLine.line_no)
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    return [{"line": line.line_no, "status": line.status, **(line.result or {})} for line in lines]
+
+
+class BatchWorkerPool:
+    """
+    Background workers draining acc_batch_lines.
+
+    Lines are leased by flipping them to RUNNING under FOR UPDATE SKIP LOCKED,
+    so several gunicorn workers can share the queue. A line becomes DONE in
+    the same transaction that stores its decision, so a crash never causes a
+    committed line to be decided twice; expired leases go back to PENDING on
+    the next poll. A line OPA could not evaluate is rolled back and retried.
+    """
+
+    def __init__(self, process_line: Callable[[Dict[str, Any], Any, str], Dict[str, Any]], workers: int = 2,
+                 claim_size: int = 50, lease_seconds: int = 300, poll_interval: float = 1.0):
+        self.process_line = process_line
+        self.workers = workers
+        self.claim_size = claim_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._leases_checked_at = 0.0
+
+    def start(self):
+        if self._threads or self.workers <= 0:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"acc-batch-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"✅ Started {self.workers} ACC batch workers")
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def release_expired_leases(self):
+        """Return lines leased by a crashed worker to the queue"""
+        db = SessionLocal()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+            released = (
+                db.query(AccBatchLine)
+                .filter(AccBatchLine.status == "RUNNING", AccBatchLine.claimed_at < cutoff)
+                .update({"status": "PENDING", "claimed_at": None}, synchronize_session=False)
+            )
+            db.commit()
+            if released:
+                print(f"♻️  Re-queued {released} batch lines with expired leases")
+        except Exception as e:
+            db.rollback()
+            print(f"❌ Error releasing batch leases: {e}")
+        finally:
+            db.close()
+
+    def _check_leases(self):
+        """Release expired leases once per poll interval, whichever worker gets here first"""
+        now = time.monotonic()
+        if now - self._leases_checked_at < self.poll_interval:
+            return
+        self._leases_checked_at = now
+        self.release_expired_leases()
+
+    def _claim(self, db) -> List[AccBatchLine]:
+        ids = [
+            row.id for row in
+            db.query(AccBatchLine.id)
+            .filter(AccBatchLine.status == "PENDING")
+            .order_by(AccBatchLine.id)
+            .limit(self.claim_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        ]
+        if not ids:
+            db.commit()
+            return []
+
+        db.query(AccBatchLine).filter(AccBatchLine.id.in_(ids)).update(
+            {"status": "RUNNING", "claimed_at": datetime.utcnow()}, synchronize_session=False
+        )
+        lines = db.query(AccBatchLine).filter(AccBatchLine.id.in_(ids)).order_by(AccBatchLine.id).all()
+        batch_ids = {line.batch_id for line in lines}
+        db.query(AccBatchJob).filter(AccBatchJob.batch_id.in_(batch_ids), AccBatchJob.status == "QUEUED").update(
+            {"status": "RUNNING"}, synchronize_session=False
+        )
+        db.commit()
+        return lines
+
+    def _process(self, db, line: AccBatchLine) -> bool:
+        """Decide one line; False when OPA was unreachable and the worker should back off"""
+        result = {}
+        try:
+            # The decision row is only flushed by process_line, so it is committed together
+            # with the line's status and result: a committed DONE line always has its decision
+            result = self.process_line(line.payload, db, line.batch_id)
+            if result.get("opa_error"):
+                raise RuntimeError("; ".join(result.get("reasons") or ["OPA unavailable"]))
+            if result.get("postgres_id") is None:
+                raise RuntimeError("; ".join(result.get("reasons") or ["Decision was not persisted"]))
+            line.status = "DONE"
+            line.decision = result.get("decision")
+            line.result = result
+            line.completed_at = datetime.utcnow()
+            db.commit()
+            for callback in db.info.pop("after_commit", []):
+                callback()
+            return True
+        except Exception as e:
+            db.rollback()
+            db.info.pop("after_commit", None)
+            line.attempts = (line.attempts or 0) + 1
+            if line.attempts >= MAX_ATTEMPTS:
+                line.status = "FAILED"
+                line.decision = "ERROR"
+                line.result = {"line_id": line.line_id, "decision": "ERROR", "reasons": [str(e)]}
+                line.completed_at = datetime.utcnow()
+            else:
+                line.status = "PENDING"
+                line.claimed_at = None
+            db.commit()
+            return not result.get("opa_error")
+
+    def _requeue(self, db, lines: List[AccBatchLine]):
+        db.query(AccBatchLine).filter(AccBatchLine.id.in_([line.id for line in lines])).update(
+            {"status": "PENDING", "claimed_at": None}, synchronize_session=False
+        )
+        db.commit()
+
+    def _complete_finished(self, db, batch_ids):
+        for batch_id in batch_ids:
+            remaining = (
+                db.query(func.count(AccBatchLine.id))
+                .filter(AccBatchLine.batch_id == batch_id, AccBatchLine.status.in_(["PENDING", "RUNNING"]))
+                .scalar()
+            )
+            if remaining:
+                continue
+            job = db.query(AccBatchJob).filter(AccBatchJob.batch_id == batch_id).first()
+            if not job or job.status == "COMPLETED":
+                continue
+            decisions = dict(
+                db.query(AccBatchLine.decision, func.count(AccBatchLine.id))
+                .filter(AccBatchLine.batch_id == batch_id)
+                .group_by(AccBatchLine.decision)
+                .all()
+            )
+            job.status = "COMPLETED"
+            job.completed_at = datetime.utcnow()
+            job.summary = {
+                "total_lines": job.total_lines,
+                "decisions": decisions,
+                "duration_seconds": round((job.completed_at - job.created_at).total_seconds(), 3) if job.created_at else None
+            }
+            db.commit()
+            print(f"✅ Batch {batch_id} completed: {decisions}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                self._check_leases()
+                lines = self._claim(db)
+                if not lines:
+                    self._stop.wait(self.poll_interval)
+                    continue
+                for i, line in enumerate(lines):
+                    if self._stop.is_set():
+                        self._requeue(db, lines[i:])
+                        break
+                    if not self._process(db, line):
+                        # The rest of the claim waits for OPA without spending attempts
+                        self._requeue(db, lines[i + 1:])
+                        self._stop.wait(OPA_RETRY_SECONDS)
+                        break
+                self._complete_finished(db, {line.batch_id for line in lines})
+            except Exception as e:
+                db.rollback()
+                print(f"❌ ACC batch worker error: {e}")
+                self._stop.wait(self.poll_interval)
+            finally:
+                db.close()
@@ -0,0 +1,157 @@
+import codecs
+import csv
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Same required columns as client_portal/lib/csv-parser.ts
+REQUIRED_FIELDS = [
+    "payment_type", "transaction_id", "sender_name", "sender_account_number", "sender_ifsc_code", "sender_bank_name",
+    "receiver_name", "receiver_account_number", "receiver_ifsc_code", "receiver_bank_name",
+    "amount", "currency", "method", "purpose", "schedule_datetime", "city"
+]
+
+
+async def iter_text_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode an (optionally gzipped) byte stream into text lines as bytes arrive"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    inflater = None
+    first = True
+    pending = ""
+
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        if first:
+            first = False
+            if chunk[:2] == GZIP_MAGIC:
+                # 16 + MAX_WBITS tells zlib to expect a gzip header
+                inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if inflater is not None:
+            chunk = inflater.decompress(chunk)
+        pending += decoder.decode(chunk)
+
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+
+    if inflater is not None:
+        pending += decoder.decode(inflater.flush())
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        for line in pending.split("\n"):
+            yield line.rstrip("\r")
+
+
+def _split_record(record: str) -> List[str]:
+    return [v.strip() for v in next(csv.reader([record]))]
+
+
+def _align(values: List[str], headers: List[str]) -> Dict[str, str]:
+    # Drop trailing empty columns left by trailing commas, then pad/truncate to the header
+    while values and values[-1] == "":
+        values.pop()
+    values = values[:len(headers)] + [""] * (len(headers) - len(values))
+    return dict(zip(headers, values))
+
+
+async def iter_csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Dict[str, str]]]:
+    """Yield (line_number, row) pairs from a streamed CSV upload with a header row"""
+    headers: Optional[List[str]] = None
+    line_number = 0
+    record_start = 0
+    buffered = None
+
+    async for line in iter_text_lines(chunks):
+        line_number += 1
+        if buffered is None:
+            record_start = line_number
+            buffered = line
+        else:
+            buffered += "\n" + line
+        if buffered.count('"') % 2:
+            continue
+        record, buffered = buffered, None
+        if not record.strip():
+            continue
+
+        values = _split_record(record)
+        if headers is None:
+            headers = values
+            continue
+        yield record_start, _align(values, headers)
+
+    # An unterminated quote at EOF still yields whatever the record holds
+    if buffered is not None and buffered.strip() and headers is not None:
+        yield record_start, _align(_split_record(buffered), headers)
+
+
+def _optional(row: Dict[str, str], field: str) -> Optional[str]:
+    value = (row.get(field) or "").strip()
+    return value or None
+
+
+def row_to_transaction(row: Dict[str, str], line_number: int) -> Dict[str, Any]:
+    """Map a flat CSV row onto the nested Transaction payload used by /acc/decide"""
+    missing = [f for f in REQUIRED_FIELDS if not (row.get(f) or "").strip()]
+    if missing:
+        raise ValueError(f"Missing required fields in row {line_number}: {', '.join(missing)}")
+
+    try:
+        amount = float(row["amount"])
+    except ValueError:
+        amount = 0
+    if amount <= 0:
+        raise ValueError(f"Invalid amount '{row['amount']}' in row {line_number}. Must be a positive number.")
+
+    kyc_verified = row["kyc_verified"].strip().lower() == "true" if _optional(row, "kyc_verified") else None
+    credit_score = int(row["credit_score"]) if _optional(row, "credit_score") else None
+    interest_rate = _optional(row, "interest_rate")
+    tenure_months = _optional(row, "tenure_months")
+
+    def party(prefix: str) -> Dict[str, Any]:
+        return {
+            "name": row[f"{prefix}_name"].strip(),
+            "account_number": row[f"{prefix}_account_number"].strip(),
+            "ifsc_code": row[f"{prefix}_ifsc_code"].strip(),
+            "bank_name": row[f"{prefix}_bank_name"].strip(),
+            "kyc_verified": kyc_verified,
+            "credit_score": credit_score
+        }
+
+    return {
+        "payment_type": row["payment_type"].strip(),
+        "transaction_id": row["transaction_id"].strip(),
+        "sender": party("sender"),
+        "receiver": party("receiver"),
+        "amount": amount,
+        "currency": row["currency"].strip(),
+        "method": row["method"].strip(),
+        "purpose": row["purpose"].strip(),
+        "schedule_datetime": row["schedule_datetime"].strip(),
+        "location": {
+            "city": row["city"].strip(),
+            "gps_coordinates": {
+                "latitude": float(row["latitude"]) if _optional(row, "latitude") else 0,
+                "longitude": float(row["longitude"]) if _optional(row, "longitude") else 0
+            }
+        },
+        "additional_fields": {
+            "employee_id": _optional(row, "employee_id"),
+            "department": _optional(row, "department"),
+            "payment_frequency": _optional(row, "payment_frequency"),
+            "invoice_number": _optional(row, "invoice_number"),
+            "invoice_date": _optional(row, "invoice_date"),
+            "gst_number": _optional(row, "gst_number"),
+            "pan_number": _optional(row, "pan_number"),
+            "vendor_code": _optional(row, "vendor_code"),
+            "loan_account_number": _optional(row, "loan_account_number"),
+            "loan_type": _optional(row, "loan_type"),
+            "sanction_date": _optional(row, "sanction_date"),
+            "interest_rate": float(interest_rate) if interest_rate else None,
+            "tenure_months": int(tenure_months) if tenure_months else None,
+            "borrower_verification_status": _optional(row, "borrower_verification_status")
+        }
+    }
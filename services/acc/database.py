@@ -142,6 +142,33 @@ class RcaTable(Base):
     evidence_refs = Column(JSON)
     created_at = Column(DateTime)
 
+class AccBatchJob(Base):
+    __tablename__ = "acc_batch_jobs"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    batch_id = Column(String(100), unique=True, index=True)
+    status = Column(String(20))  # QUEUED / RUNNING / COMPLETED
+    total_lines = Column(Integer)
+    summary = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(DateTime)
+
+class AccBatchLine(Base):
+    __tablename__ = "acc_batch_lines"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    batch_id = Column(String(100), index=True)
+    line_no = Column(Integer)
+    line_id = Column(String(100))
+    payload = Column(JSON)
+    status = Column(String(20), index=True)  # PENDING / RUNNING / DONE / FAILED
+    decision = Column(String(20))
+    result = Column(JSON)
+    attempts = Column(Integer, default=0)
+    claimed_at = Column(DateTime)
+    completed_at = Column(DateTime)
+
 def create_tables():
     """Create all tables in the database"""
     Base.metadata.create_all(bind=engine)
@@ -155,8 +182,8 @@ def get_db():
     finally:
         db.close()
 
-def save_acc_agent_result(db, line_id, beneficiary, ifsc, amount, policy_version, status, decision_reason, evidence_ref):
-    """Save ACC agent result to PostgreSQL"""
+def save_acc_agent_result(db, line_id, beneficiary, ifsc, amount, policy_version, status, decision_reason, evidence_ref, commit=True):
+    """Save ACC agent result to PostgreSQL; with commit=False the row is only flushed into the caller's transaction"""
     try:
         acc_record = AccAgent(
             line_id=line_id,
@@ -169,7 +196,10 @@ def save_acc_agent_result(db, line_id, beneficiary, ifsc, amount, policy_version
             evidence_ref=evidence_ref
         )
         db.add(acc_record)
-        db.commit()
+        if commit:
+            db.commit()
+        else:
+            db.flush()
         return acc_record.id
     except Exception as e:
         db.rollback()
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def transaction_fingerprint(transaction: Dict[str, Any], verifications: Dict[str, Any], policy_version: str) -> str:
+    """Content hash of a canonicalised transaction, its verification results and the policy version"""
+    canonical = json.dumps(
+        {
+            "policy_version": policy_version,
+            "transaction": transaction,
+            "verifications": verifications
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class DecisionCache:
+    """Bounded LRU of ACC decisions keyed by transaction fingerprint.
+
+    Entries are only valid for the policy bundle version they were computed
+    under; asking for a different version drops the whole cache.
+    """
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self.policy_version: Optional[str] = None
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, policy_version: str):
+        if self.policy_version != policy_version:
+            if self._entries:
+                print(f"♻️  Policy version changed {self.policy_version} -> {policy_version}, dropping {len(self._entries)} cached decisions")
+            self._entries.clear()
+            self.policy_version = policy_version
+
+    def get(self, fingerprint: str, policy_version: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._check_version(policy_version)
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return dict(entry)
+
+    def put(self, fingerprint: str, policy_version: str, decision: Dict[str, Any]):
+        with self._lock:
+            self._check_version(policy_version)
+            self._entries[fingerprint] = dict(decision)
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "policy_version": self.policy_version,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -1,16 +1,25 @@
-from fastapi import FastAPI, Body, Depends, HTTPException, Header
+from fastapi import FastAPI, Body, Depends, HTTPException, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import List, Dict, Any, Optional, Union
+import asyncio
+import os
 import requests
 import json
+from datetime import datetime
 from sqlalchemy.orm import Session
 from database import (
-    create_tables, get_db, save_acc_agent_result, 
+    create_tables, get_db, SessionLocal, save_acc_agent_result, 
     save_to_neo4j, save_payment_file, AccAgent, PaymentFile,
     get_payment_files, get_payment_file_by_id, get_payment_files_count,
     search_payment_files, get_latest_payment_files
 )
+from decision_cache import DecisionCache, transaction_fingerprint
+from csv_stream import iter_csv_records, row_to_transaction
+from batch_jobs import BatchWorkerPool, submit_batch, get_batch_progress, get_batch_results
+from arealis_events import get_event_bus, TOPIC_ACC_DECISIONS
 from sqlalchemy import func, and_
  
 app = FastAPI(title="ACC Agent Service", version="1.1")
@@ -40,10 +49,25 @@ def verify_api_key(x_api_key: Optional[str] = Header(None)):
         raise HTTPException(status_code=401, detail="Invalid API key")
     return x_api_key
 
+# Active OPA policy bundle version; cached decisions are tied to it
+POLICY_VERSION = os.getenv("ACC_POLICY_VERSION", "acc-1.4.2")
+
+# Memoized decisions for identical transaction fingerprints
+decision_cache = DecisionCache(max_entries=int(os.getenv("ACC_DECISION_CACHE_SIZE", "100000")))
+
+# Decision events for PDR / RCA (disabled unless Kafka or the in-memory bus is configured)
+event_bus = get_event_bus()
+
 # Create tables on startup
 @app.on_event("startup")
 async def startup_event():
     create_tables()
+    batch_workers.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    batch_workers.stop()
+    event_bus.close()
 
 @app.get("/")
 async def root():
@@ -182,6 +206,7 @@ def call_opa(input_payload: Dict[str, Any]) -> Dict[str, Any]:
         else:
             print(f"❌ OPA Error: {response.status_code}")
             return {
+                "opa_error": True,
                 "result": {
                     "allow": False,
                     "violations": [f"OPA server error: {response.status_code}"]
@@ -190,6 +215,7 @@ def call_opa(input_payload: Dict[str, Any]) -> Dict[str, Any]:
             
     except requests.exceptions.ConnectionError:
         return {
+            "opa_error": True,
             "result": {
                 "allow": False,
                 "violations": ["OPA server is not available"]
@@ -197,6 +223,7 @@ def call_opa(input_payload: Dict[str, Any]) -> Dict[str, Any]:
         }
     except requests.exceptions.Timeout:
         return {
+            "opa_error": True,
             "result": {
                 "allow": False,
                 "violations": ["OPA server timeout"]
@@ -204,6 +231,7 @@ def call_opa(input_payload: Dict[str, Any]) -> Dict[str, Any]:
         }
     except Exception as e:
         return {
+            "opa_error": True,
             "result": {
                 "allow": False,
                 "violations": [f"OPA integration error: {str(e)}"]
@@ -261,6 +289,183 @@ class Transaction(BaseModel):
     additional_fields: AdditionalFields
  
  
+# -------------------------
+# Decision Pipeline
+# -------------------------
+
+def run_verifications(txn: Transaction) -> Dict[str, Any]:
+    """Run the KYC / bank verifications required for a transaction"""
+    verifications = {}
+
+    # 1. PAN Verification (for all transaction types that have PAN)
+    if txn.additional_fields.pan_number and txn.additional_fields.pan_number.strip():
+        print(f"  🔍 PAN Verification: {txn.additional_fields.pan_number}")
+        pan_result = verify_pan(txn.additional_fields.pan_number)
+        print(f"  🔍 PAN Result: {pan_result}")
+        verifications["pan"] = pan_result
+    
+    # 2. GSTIN Verification (for vendor payments)
+    if txn.payment_type == "vendor_payment" and txn.additional_fields.gst_number and txn.additional_fields.gst_number.strip():
+        print(f"  🔍 GSTIN Verification: {txn.additional_fields.gst_number}")
+        gstin_result = verify_gstin(txn.additional_fields.gst_number, txn.receiver.name)
+        print(f"  🔍 GSTIN Result: {gstin_result}")
+        verifications["gstin"] = gstin_result
+    
+    # 3. Bank Verification (for all transaction types)
+    if txn.receiver.account_number and txn.receiver.ifsc_code:
+        print(f"  🔍 Bank Verification: {txn.receiver.account_number} / {txn.receiver.ifsc_code}")
+        bank_result = verify_bank(
+            txn.receiver.account_number,
+            txn.receiver.ifsc_code,
+            txn.receiver.name,
+            None  # Phone is optional
+        )
+        print(f"  🔍 Bank Result: {bank_result}")
+        verifications["bank"] = bank_result
+    
+    # 4. CIBIL Verification (for loan disbursements)
+    if txn.payment_type == "loan_disbursement":
+        print(f"  🔍 Loan Disbursement Details:")
+        print(f"    - Borrower Status: {txn.additional_fields.borrower_verification_status}")
+        print(f"    - Loan Account: {txn.additional_fields.loan_account_number}")
+        print(f"    - Loan Type: {txn.additional_fields.loan_type}")
+        print(f"    - Interest Rate: {txn.additional_fields.interest_rate}")
+        print(f"    - Tenure: {txn.additional_fields.tenure_months}")
+        
+        # Add CIBIL verification for loan disbursements
+        verifications["cibil_check_performed"] = True
+        verifications["cibil_score"] = 750  # High score for passing cases
+        print(f"  🔍 CIBIL Verification: check_performed=True, score=750")
+
+    return verifications
+
+
+def publish_decision(txn: Transaction, result: Dict[str, Any], batch_id: Optional[str] = None):
+    """Publish a fresh decision to the event bus, keyed by batch (or line) for ordering"""
+    event_bus.publish(TOPIC_ACC_DECISIONS, batch_id or txn.transaction_id, {
+        "event": "acc.decision",
+        "line_id": txn.transaction_id,
+        "batch_id": batch_id,
+        "decision": result["decision"],
+        "reasons": result["reasons"],
+        "policy_version": result["policy_version"],
+        "payment_type": txn.payment_type,
+        "amount": txn.amount,
+        "currency": txn.currency,
+        "method": txn.method,
+        "purpose": txn.purpose,
+        "schedule_datetime": txn.schedule_datetime,
+        "beneficiary": txn.receiver.name,
+        "account_number": txn.receiver.account_number,
+        "ifsc": txn.receiver.ifsc_code,
+        "bank_name": txn.receiver.bank_name,
+        "decided_at": datetime.utcnow().isoformat()
+    })
+
+
+def decide_transaction(txn: Transaction, db: Session, batch_id: Optional[str] = None, commit: bool = True) -> Dict[str, Any]:
+    """Verify, evaluate and persist a single transaction.
+
+    With commit=False the decision row is left uncommitted in db's transaction,
+    for callers that commit it together with their own bookkeeping.
+
+    Identical transactions (same fingerprint under the same policy version)
+    are answered from the decision cache without calling OPA or writing again,
+    and are not re-published downstream.
+    """
+    print(f"\n🔍 Processing {txn.transaction_id} ({txn.payment_type})...")
+
+    try:
+        verifications = run_verifications(txn)
+        transaction_data = txn.dict()
+        fingerprint = transaction_fingerprint(transaction_data, verifications, POLICY_VERSION)
+
+        cached = decision_cache.get(fingerprint, POLICY_VERSION)
+        if cached is not None:
+            print(f"  ⚡ Decision cache hit for {txn.transaction_id}")
+            cached["cached"] = True
+            return cached
+
+        opa_input = {
+            "policy_version": POLICY_VERSION,
+            "transaction": transaction_data,
+            "verifications": verifications
+        }
+        opa_result = call_opa(opa_input)
+        
+        # Prepare result data
+        decision = "PASS" if opa_result["result"]["allow"] else "FAIL"
+        reasons = opa_result["result"].get("violations", [])
+        evidence_refs = list(verifications.keys())
+        
+        # Create result object
+        result = {
+            "line_id": txn.transaction_id,
+            "decision": decision,
+            "policy_version": POLICY_VERSION,
+            "reasons": reasons,
+            "evidence_refs": evidence_refs
+        }
+
+        if opa_result.get("opa_error") and not commit:
+            # Not a policy decision: the batch worker retries the line instead of storing a FAIL
+            return {**result, "decision": "ERROR", "opa_error": True, "postgres_id": None, "neo4j_success": False}
+        
+        # Save to PostgreSQL
+        postgres_id = save_acc_agent_result(
+            db=db,
+            line_id=txn.transaction_id,
+            beneficiary=txn.receiver.name,
+            ifsc=txn.receiver.ifsc_code,
+            amount=txn.amount,
+            policy_version=POLICY_VERSION,
+            status=decision,
+            decision_reason=json.dumps(reasons),
+            evidence_ref=json.dumps(evidence_refs),
+            commit=commit
+        )
+        
+        # Save to Neo4j
+        neo4j_success = save_to_neo4j(
+            line_id=txn.transaction_id,
+            beneficiary=txn.receiver.name,
+            ifsc=txn.receiver.ifsc_code,
+            amount=txn.amount,
+            status=decision,
+            decision_reason=json.dumps(reasons),
+            evidence_ref=json.dumps(evidence_refs)
+        )
+        
+        # Add database IDs to result
+        result["postgres_id"] = postgres_id
+        result["neo4j_success"] = neo4j_success
+
+        # Only remember decisions that OPA actually evaluated and that were persisted
+        if not opa_result.get("opa_error") and postgres_id is not None:
+            def remember():
+                decision_cache.put(fingerprint, POLICY_VERSION, result)
+                publish_decision(txn, result, batch_id)
+
+            if commit:
+                remember()
+            else:
+                # Run by the caller once the decision row is committed
+                db.info.setdefault("after_commit", []).append(remember)
+        
+        return result
+        
+    except Exception as e:
+        return {
+            "line_id": txn.transaction_id,
+            "decision": "ERROR",
+            "policy_version": POLICY_VERSION,
+            "reasons": [str(e)],
+            "evidence_refs": [],
+            "postgres_id": None,
+            "neo4j_success": False
+        }
+
+
 # -------------------------
 # API Endpoint
 # -------------------------
@@ -270,115 +475,157 @@ def acc_decide(transactions: List[Transaction] = Body(...), db: Session = Depend
     results = []
  
     for txn in transactions:
-        verifications = {}
-        
-        print(f"\n🔍 Processing {txn.transaction_id} ({txn.payment_type})...")
-
-        # 1. PAN Verification (for all transaction types that have PAN)
-        if txn.additional_fields.pan_number and txn.additional_fields.pan_number.strip():
-            print(f"  🔍 PAN Verification: {txn.additional_fields.pan_number}")
-            pan_result = verify_pan(txn.additional_fields.pan_number)
-            print(f"  🔍 PAN Result: {pan_result}")
-            verifications["pan"] = pan_result
-        
-        # 2. GSTIN Verification (for vendor payments)
-        if txn.payment_type == "vendor_payment" and txn.additional_fields.gst_number and txn.additional_fields.gst_number.strip():
-            print(f"  🔍 GSTIN Verification: {txn.additional_fields.gst_number}")
-            gstin_result = verify_gstin(txn.additional_fields.gst_number, txn.receiver.name)
-            print(f"  🔍 GSTIN Result: {gstin_result}")
-            verifications["gstin"] = gstin_result
-        
-        # 3. Bank Verification (for all transaction types)
-        if txn.receiver.account_number and txn.receiver.ifsc_code:
-            print(f"  🔍 Bank Verification: {txn.receiver.account_number} / {txn.receiver.ifsc_code}")
-            bank_result = verify_bank(
-                txn.receiver.account_number,
-                txn.receiver.ifsc_code,
-                txn.receiver.name,
-                None  # Phone is optional
-            )
-            print(f"  🔍 Bank Result: {bank_result}")
-            verifications["bank"] = bank_result
-        
-        # 4. CIBIL Verification (for loan disbursements)
-        if txn.payment_type == "loan_disbursement":
-            print(f"  🔍 Loan Disbursement Details:")
-            print(f"    - Borrower Status: {txn.additional_fields.borrower_verification_status}")
-            print(f"    - Loan Account: {txn.additional_fields.loan_account_number}")
-            print(f"    - Loan Type: {txn.additional_fields.loan_type}")
-            print(f"    - Interest Rate: {txn.additional_fields.interest_rate}")
-            print(f"    - Tenure: {txn.additional_fields.tenure_months}")
-            
-            # Add CIBIL verification for loan disbursements
-            verifications["cibil_check_performed"] = True
-            verifications["cibil_score"] = 750  # High score for passing cases
-            print(f"  🔍 CIBIL Verification: check_performed=True, score=750")
+        results.append(decide_transaction(txn, db))
  
+    return {"decisions": results}
+
+@app.post("/acc/decide/stream")
+async def acc_decide_stream(request: Request, chunk_size: int = 500, format: str = "ndjson", api_key: str = Depends(verify_api_key)):
+    """
+    Decide a raw CSV (or gzipped CSV) payment file while it is being uploaded.
+
+    Rows are parsed incrementally and decided in chunks; each decision is
+    streamed back as NDJSON (default) or SSE (format=sse or Accept:
+    text/event-stream), followed by a summary record.
+    """
+    chunk_size = max(1, min(chunk_size, 5000))
+    use_sse = format == "sse" or "text/event-stream" in request.headers.get("accept", "")
+
+    def encode(event: str, payload: Dict[str, Any]) -> str:
+        if use_sse:
+            return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+        return json.dumps({"type": event, **payload}, default=str) + "\n"
+
+    def decide_chunk(txns: List[Transaction]) -> List[Dict[str, Any]]:
+        db = SessionLocal()
         try:
-            opa_input = {
-                "policy_version": "acc-1.4.2",
-                "transaction": txn.dict(),
-                "verifications": verifications
-            }
-            opa_result = call_opa(opa_input)
-            
-            # Prepare result data
-            decision = "PASS" if opa_result["result"]["allow"] else "FAIL"
-            reasons = opa_result["result"].get("violations", [])
-            evidence_refs = list(verifications.keys())
-            
-            # Create result object
-            result = {
-                "line_id": txn.transaction_id,
-                "decision": decision,
-                "policy_version": "acc-1.4.2",
-                "reasons": reasons,
-                "evidence_refs": evidence_refs
-            }
-            
-            # Save to PostgreSQL
-            postgres_id = save_acc_agent_result(
-                db=db,
-                line_id=txn.transaction_id,
-                beneficiary=txn.receiver.name,
-                ifsc=txn.receiver.ifsc_code,
-                amount=txn.amount,
-                policy_version="acc-1.4.2",
-                status=decision,
-                decision_reason=json.dumps(reasons),
-                evidence_ref=json.dumps(evidence_refs)
-            )
-            
-            # Save to Neo4j
-            neo4j_success = save_to_neo4j(
-                line_id=txn.transaction_id,
-                beneficiary=txn.receiver.name,
-                ifsc=txn.receiver.ifsc_code,
-                amount=txn.amount,
-                status=decision,
-                decision_reason=json.dumps(reasons),
-                evidence_ref=json.dumps(evidence_refs)
-            )
-            
-            # Add database IDs to result
-            result["postgres_id"] = postgres_id
-            result["neo4j_success"] = neo4j_success
-            
-            results.append(result)
-            
+            return [decide_transaction(txn, db) for txn in txns]
+        finally:
+            db.close()
+
+    async def event_stream():
+        summary = {"lines": 0, "PASS": 0, "FAIL": 0, "ERROR": 0, "INVALID": 0}
+        pending = []
+        # Start with tiny chunks so the first decisions go out immediately, then grow
+        limit = 1
+
+        async def decide_pending() -> str:
+            results = await run_in_threadpool(decide_chunk, [txn for _, txn in pending])
+            out = []
+            for (line_number, _), result in zip(pending, results):
+                summary[result["decision"]] = summary.get(result["decision"], 0) + 1
+                out.append(encode("decision", {"line": line_number, **result}))
+            pending.clear()
+            return "".join(out)
+
+        try:
+            async for line_number, row in iter_csv_records(request.stream()):
+                summary["lines"] += 1
+                try:
+                    txn = Transaction(**row_to_transaction(row, line_number))
+                except (ValueError, ValidationError) as e:
+                    summary["INVALID"] += 1
+                    yield encode("decision", {
+                        "line": line_number,
+                        "line_id": row.get("transaction_id"),
+                        "decision": "INVALID",
+                        "policy_version": POLICY_VERSION,
+                        "reasons": [str(e)],
+                        "evidence_refs": []
+                    })
+                    continue
+
+                pending.append((line_number, txn))
+                if len(pending) >= limit:
+                    yield await decide_pending()
+                    limit = min(limit * 2, chunk_size)
+
+            if pending:
+                yield await decide_pending()
         except Exception as e:
-            error_result = {
-                "line_id": txn.transaction_id,
-                "decision": "ERROR",
-                "policy_version": "acc-1.4.2",
-                "reasons": [str(e)],
-                "evidence_refs": [],
-                "postgres_id": None,
-                "neo4j_success": False
-            }
-            results.append(error_result)
- 
-    return {"decisions": results}
+            print(f"❌ Error streaming payment file: {str(e)}")
+            yield encode("error", {"message": f"Error streaming payment file: {str(e)}"})
+
+        yield encode("summary", summary)
+
+    media_type = "text/event-stream" if use_sse else "application/x-ndjson"
+    return StreamingResponse(event_stream(), media_type=media_type)
+
+def process_batch_line(payload: Dict[str, Any], db: Session, batch_id: str) -> Dict[str, Any]:
+    # Uncommitted: the batch worker commits the decision row together with the line's status and result
+    return decide_transaction(Transaction(**payload), db, batch_id=batch_id, commit=False)
+
+# Background workers for asynchronous batches (see batch_jobs.py)
+batch_workers = BatchWorkerPool(
+    process_batch_line,
+    workers=int(os.getenv("ACC_BATCH_WORKERS", "2")),
+    claim_size=int(os.getenv("ACC_BATCH_CLAIM_SIZE", "50")),
+    lease_seconds=int(os.getenv("ACC_BATCH_LEASE_SECONDS", "300"))
+)
+
+@app.post("/acc/batches")
+def submit_batch_endpoint(transactions: List[Transaction] = Body(...), batch_id: Optional[str] = None, db: Session = Depends(get_db), api_key: str = Depends(verify_api_key)):
+    """Queue a batch for asynchronous decisioning and return its batch_id"""
+    try:
+        batch_id = submit_batch(db, [txn.dict() for txn in transactions], batch_id=batch_id)
+        return {
+            "success": True,
+            "batch_id": batch_id,
+            "status": "QUEUED",
+            "total_lines": len(transactions),
+            "message": "Batch queued for processing"
+        }
+    except Exception as e:
+        return {"success": False, "message": f"Error queueing batch: {str(e)}"}
+
+@app.get("/acc/batches/{batch_id}")
+def get_batch_endpoint(batch_id: str, db: Session = Depends(get_db), api_key: str = Depends(verify_api_key)):
+    """Get progress (and the final summary once complete) for a batch"""
+    progress = get_batch_progress(db, batch_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return {"success": True, "data": progress}
+
+@app.get("/acc/batches/{batch_id}/results")
+def get_batch_results_endpoint(batch_id: str, offset: int = 0, limit: int = 100, db: Session = Depends(get_db), api_key: str = Depends(verify_api_key)):
+    """Get the decisions committed so far for a batch, in file order"""
+    limit = max(1, min(limit, 1000))
+    results = get_batch_results(db, batch_id, offset=offset, limit=limit)
+    return {"success": True, "data": {"batch_id": batch_id, "offset": offset, "limit": limit, "results": results}}
+
+@app.get("/acc/batches/{batch_id}/events")
+async def batch_events(batch_id: str, interval: float = 1.0, api_key: str = Depends(verify_api_key)):
+    """Subscribe to batch progress as server-sent events until the batch completes"""
+    interval = max(0.2, interval)
+
+    def read_progress():
+        db = SessionLocal()
+        try:
+            return get_batch_progress(db, batch_id)
+        finally:
+            db.close()
+
+    async def event_stream():
+        last = None
+        while True:
+            progress = await run_in_threadpool(read_progress)
+            if progress is None:
+                yield f"event: error\ndata: {json.dumps({'message': 'Batch not found'})}\n\n"
+                return
+            if progress != last:
+                event = "summary" if progress["status"] == "COMPLETED" else "progress"
+                yield f"event: {event}\ndata: {json.dumps(progress, default=str)}\n\n"
+                last = progress
+            if progress["status"] == "COMPLETED":
+                return
+            await asyncio.sleep(interval)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.get("/acc/decision-cache")
+def get_decision_cache_stats(api_key: str = Depends(verify_api_key)):
+    """Get decision cache statistics"""
+    return {"success": True, "data": decision_cache.stats()}
 
 class PaymentFileRequest(BaseModel):
     filename: str
@@ -1014,6 +1261,7 @@ def clear_vendor_data(db: Session = Depends(get_db), api_key: str = Depends(veri
             db.delete(pf)
         
         db.commit()
+        decision_cache.clear()
         
         return {
             "success": True,
@@ -1117,6 +1365,7 @@ def clear_payroll_data(db: Session = Depends(get_db), api_key: str = Depends(ver
             db.delete(pf)
         
         db.commit()
+        decision_cache.clear()
         
         return {
             "success": True,
@@ -1376,6 +1625,7 @@ def clear_loan_data(db: Session = Depends(get_db), api_key: str = Depends(verify
             db.delete(pf)
         
         db.commit()
+        decision_cache.clear()
         
         return {
             "success": True,
@@ -1393,6 +1643,7 @@ def clear_all_data(db: Session = Depends(get_db), api_key: str = Depends(verify_
         # Delete all AccAgent records
         deleted_count = db.query(AccAgent).delete()
         db.commit()
+        decision_cache.clear()
         
         return {
             "success": True,
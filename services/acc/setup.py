@@ -15,6 +15,7 @@ setup(
         "neo4j==5.15.0",
         "python-dotenv==1.0.0",
         "sqlalchemy==2.0.23",
-        "gunicorn==21.2.0"
+        "gunicorn==21.2.0",
+        "kafka-python==2.0.2",
     ],
 )
@@ -0,0 +1,426 @@
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import create_engine, Column, Integer, String, Numeric, DateTime, JSON, BigInteger, Boolean, Index, func, literal, or_, select, true, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+# Same PostgreSQL database as the ACC and PDR services; ARL runs file-only if unset
+POSTGRES_URL = os.getenv("DATABASE_URL")
+
+engine = create_engine(POSTGRES_URL, pool_pre_ping=True) if POSTGRES_URL else None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) if engine else None
+Base = declarative_base()
+
+class ArlTable(Base):
+    __tablename__ = "arl_table"
+    __table_args__ = (Index("ix_arl_table_line_id", "line_id"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    recon_id = Column(Integer, unique=True)
+    line_id = Column(String(50))
+    utr = Column(String(100))
+    psp_reference = Column(String(100))
+    match_status = Column(String(50))
+    match_reason = Column(String(100))
+    journal = Column(JSON)
+    metadata_info = Column(JSON)
+    created_at = Column(DateTime)
+
+class PdrTable(Base):
+    __tablename__ = "pdr_table"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    line_id = Column(String(50), unique=True)
+    batch_id = Column(String(100))
+    rail_selected = Column(String(100))
+    fallbacks = Column(JSON)
+    expected_amount = Column(Numeric)
+    expected_currency = Column(String(10))
+    expected_utr = Column(String(100))
+    status = Column(String(50))
+    created_at = Column(DateTime)
+
+class IntentTable(Base):
+    """ACC's payment instructions; ARL only reads the beneficiary of a line"""
+    __tablename__ = "intent_table"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    transaction_id = Column(String(100))
+    receiver_name = Column(String(255))
+    receiver_account_number = Column(String(50))
+    receiver_ifsc_code = Column(String(20))
+
+class ArlIngestCheckpoint(Base):
+    """How far a statement has been reconciled, so an interrupted ingest resumes"""
+    __tablename__ = "arl_ingest_checkpoints"
+
+    source_id = Column(String(64), primary_key=True)
+    filename = Column(String(255))
+    format = Column(String(20))
+    records_done = Column(BigInteger, default=0)
+    byte_offset = Column(BigInteger)
+    status = Column(String(20), default="RUNNING")
+    summary = Column(JSON)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ArlOpenItem(Base):
+    """Unmatched bank credit or unsettled PDR line awaiting re-matching"""
+    __tablename__ = "arl_open_items"
+
+    side = Column(String(10), primary_key=True)
+    item_id = Column(String(100), primary_key=True)
+    payload = Column(JSON)
+    dirty = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ArlIndexState(Base):
+    """Watermarks and running counters of the open-item index"""
+    __tablename__ = "arl_index_state"
+
+    name = Column(String(50), primary_key=True)
+    value = Column(BigInteger, default=0)
+
+class LedgerJournal(Base):
+    """One balanced journal; rows are only ever inserted"""
+    __tablename__ = "ledger_journals"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    journal_id = Column(String(100), unique=True, nullable=False)
+    line_id = Column(String(50))
+    batch_id = Column(String(100))
+    utr = Column(String(100))
+    description = Column(String(255))
+    posted_at = Column(DateTime, nullable=False)
+
+class LedgerPosting(Base):
+    """A journal leg; amount is signed, debits positive and credits negative"""
+    __tablename__ = "ledger_postings"
+    __table_args__ = (Index("ix_ledger_postings_posted_at", "posted_at"),)
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    journal_id = Column(String(100), nullable=False, index=True)
+    account = Column(String(100), nullable=False)
+    amount = Column(Numeric(18, 2), nullable=False)
+    posted_at = Column(DateTime, nullable=False)
+
+class LedgerBalance(Base):
+    """Running balance per account, advanced with every posted batch"""
+    __tablename__ = "ledger_balances"
+
+    account = Column(String(100), primary_key=True)
+    balance = Column(Numeric(18, 2), default=0)
+    debits = Column(Numeric(18, 2), default=0)
+    credits = Column(Numeric(18, 2), default=0)
+    postings = Column(BigInteger, default=0)
+    updated_at = Column(DateTime)
+
+class LedgerSnapshot(Base):
+    """Balances of every account as of snapshot_at"""
+    __tablename__ = "ledger_snapshots"
+
+    snapshot_at = Column(DateTime, primary_key=True)
+    account = Column(String(100), primary_key=True)
+    balance = Column(Numeric(18, 2))
+    debits = Column(Numeric(18, 2))
+    credits = Column(Numeric(18, 2))
+
+LEDGER_TABLES = [LedgerJournal.__table__, LedgerPosting.__table__, LedgerBalance.__table__, LedgerSnapshot.__table__]
+
+# pdr_table belongs to PDR and intent_table to ACC; ARL only creates its own tables
+ARL_TABLES = [ArlTable.__table__, ArlIngestCheckpoint.__table__, ArlOpenItem.__table__, ArlIndexState.__table__,
+              *LEDGER_TABLES]
+
+def create_tables():
+    """Create ARL tables if the database is configured"""
+    if engine is None:
+        print("⚠️  DATABASE_URL not set - ARL results will not be persisted")
+        return
+    Base.metadata.create_all(bind=engine, tables=ARL_TABLES)
+    # create_all skips indexes added to tables that already exist
+    for table in ARL_TABLES:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def _pdr_select():
+    """pdr_table rows with the line's beneficiary from intent_table, which the fuzzy matcher blocks on"""
+    pdr, intent = PdrTable.__table__, IntentTable.__table__
+    beneficiary = (
+        select(intent.c.receiver_name, intent.c.receiver_account_number, intent.c.receiver_ifsc_code)
+        .where(intent.c.transaction_id == pdr.c.line_id)
+        .order_by(intent.c.id.desc())
+        .limit(1)
+        .lateral()
+    )
+    return select(
+        pdr,
+        beneficiary.c.receiver_name.label("beneficiary_name"),
+        beneficiary.c.receiver_account_number.label("beneficiary_account"),
+        beneficiary.c.receiver_ifsc_code.label("ifsc")
+    ).select_from(pdr.outerjoin(beneficiary, true()))
+
+def _pdr_dict(row):
+    return {
+        "line_id": row.line_id,
+        "batch_id": row.batch_id,
+        "rail_selected": row.rail_selected,
+        "expected_amount": float(row.expected_amount or 0),
+        "expected_currency": row.expected_currency,
+        "expected_utr": row.expected_utr,
+        "status": row.status,
+        "created_at": row.created_at,
+        "beneficiary_name": row.beneficiary_name,
+        "beneficiary_account": row.beneficiary_account,
+        "ifsc": row.ifsc
+    }
+
+def fetch_pdr_lines(utrs, line_ids):
+    """
+    PDR expectations referenced by a chunk of bank records, by expected UTR or
+    line_id, leaving out lines an earlier statement already MATCHED
+    """
+    if engine is None or not (utrs or line_ids):
+        return []
+    with engine.connect() as conn:
+        table, arl = PdrTable.__table__, ArlTable.__table__
+        settled = select(arl.c.id).where(arl.c.line_id == table.c.line_id, arl.c.match_status == "MATCHED").exists()
+        query = _pdr_select().where(
+            or_(table.c.expected_utr.in_(list(utrs)), table.c.line_id.in_(list(line_ids))),
+            ~settled
+        )
+        return [_pdr_dict(row) for row in conn.execute(query)]
+
+def get_checkpoint(source_id):
+    if engine is None:
+        return None
+    with engine.connect() as conn:
+        table = ArlIngestCheckpoint.__table__
+        row = conn.execute(table.select().where(table.c.source_id == source_id)).first()
+        return dict(row._mapping) if row else None
+
+def save_chunk(rows, checkpoint):
+    """Bulk-insert a chunk of reconciliation rows and advance the checkpoint in one transaction"""
+    if engine is None:
+        return False
+    with engine.begin() as conn:
+        if rows:
+            conn.execute(ArlTable.__table__.insert(), rows)
+        stmt = insert(ArlIngestCheckpoint.__table__).values(**checkpoint, updated_at=datetime.utcnow())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["source_id"],
+            set_={key: stmt.excluded[key] for key in list(checkpoint) + ["updated_at"] if key != "source_id"}
+        )
+        conn.execute(stmt)
+    return True
+
+# pg advisory lock key held while a worker changes the open-item index
+INDEX_LOCK_KEY = 0x41524C01
+# Class of the per-statement lock held for a whole ingest, keyed by hashtext(source_id)
+STATEMENT_LOCK_CLASS = 0x41524C02
+
+@contextmanager
+def _advisory_lock(*keys):
+    if engine is None:
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(select(func.pg_advisory_lock(*keys)))
+        try:
+            yield
+        finally:
+            conn.execute(select(func.pg_advisory_unlock(*keys)))
+
+def index_lock():
+    """Serialise open-item index changes across worker processes; a no-op without a database"""
+    return _advisory_lock(INDEX_LOCK_KEY)
+
+def statement_lock(source_id):
+    """Serialise ingests of one statement across worker processes; a no-op without a database"""
+    return _advisory_lock(STATEMENT_LOCK_CLASS, func.hashtext(source_id))
+
+def load_index_state():
+    """Watermarks and counters of the open-item index, or None without a database"""
+    if engine is None:
+        return None
+    with engine.connect() as conn:
+        return {row.name: row.value for row in conn.execute(ArlIndexState.__table__.select())}
+
+def load_open_items():
+    """Open items and index state, or (None, []) without a database"""
+    if engine is None:
+        return None, []
+    # One snapshot, so the items agree with the watermarks
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn, conn.begin():
+        state = {row.name: row.value for row in conn.execute(ArlIndexState.__table__.select())}
+        items = [dict(row._mapping) for row in conn.execute(ArlOpenItem.__table__.select())]
+    return state, items
+
+def max_arl_id():
+    if engine is None:
+        return 0
+    with engine.connect() as conn:
+        return conn.execute(select(func.max(ArlTable.__table__.c.id))).scalar() or 0
+
+def _since(table, after_id, upto_id=None, chunk_size=5000, query=None):
+    query = (table.select() if query is None else query).where(table.c.id > after_id).order_by(table.c.id)
+    if upto_id is not None:
+        query = query.where(table.c.id <= upto_id)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        for row in result:
+            yield row
+
+def pdr_lines_since(after_id, chunk_size=5000):
+    """(id, PDR line) for pdr_table rows added after the watermark"""
+    if engine is None:
+        return
+    for row in _since(PdrTable.__table__, after_id, chunk_size=chunk_size, query=_pdr_select()):
+        line = _pdr_dict(row)
+        line["created_at"] = row.created_at.isoformat() if row.created_at else None
+        yield row.id, line
+
+def arl_rows_since(after_id, upto_id, chunk_size=5000):
+    """arl_table rows added after the watermark, up to upto_id"""
+    if engine is None:
+        return
+    for row in _since(ArlTable.__table__, after_id, upto_id, chunk_size):
+        yield dict(row._mapping)
+
+def save_index_changes(added, closed, cleaned, state, results=()):
+    """Apply one sync or rematch to the persistent index in a single transaction"""
+    if engine is None:
+        return False
+    table = ArlOpenItem.__table__
+    with engine.begin() as conn:
+        if results:
+            conn.execute(ArlTable.__table__.insert(), list(results))
+        if closed:
+            conn.execute(table.delete().where(tuple_(table.c.side, table.c.item_id).in_(list(closed))))
+        if cleaned:
+            conn.execute(table.update().where(tuple_(table.c.side, table.c.item_id).in_(list(cleaned))).values(dirty=False))
+        if added:
+            stmt = insert(table).values(list(added))
+            conn.execute(stmt.on_conflict_do_nothing(index_elements=["side", "item_id"]))
+        if state:
+            stmt = insert(ArlIndexState.__table__).values([{"name": name, "value": value} for name, value in state.items()])
+            conn.execute(stmt.on_conflict_do_update(index_elements=["name"], set_={"value": stmt.excluded.value}))
+    return True
+
+def _balance_dict(row):
+    return {
+        "account": row.account,
+        "balance": float(row.balance or 0),
+        "debits": float(row.debits or 0),
+        "credits": float(row.credits or 0)
+    }
+
+def post_journals(journals, postings, snapshot_at=None):
+    """
+    Append a batch of journals and their postings, fold the batch into the
+    running balances and optionally snapshot them, in one transaction.
+    Journals already on the ledger are skipped; returns the journal_ids posted.
+    """
+    if engine is None or not journals:
+        return set()
+    with engine.begin() as conn:
+        stmt = insert(LedgerJournal.__table__).values(journals).on_conflict_do_nothing(index_elements=["journal_id"])
+        posted = {row.journal_id for row in conn.execute(stmt.returning(LedgerJournal.__table__.c.journal_id))}
+        postings = [posting for posting in postings if posting["journal_id"] in posted]
+        if postings:
+            conn.execute(LedgerPosting.__table__.insert(), postings)
+            totals = {}
+            for posting in postings:
+                total = totals.setdefault(posting["account"], {"balance": 0.0, "debits": 0.0, "credits": 0.0, "postings": 0})
+                total["balance"] += posting["amount"]
+                total["debits" if posting["amount"] > 0 else "credits"] += abs(posting["amount"])
+                total["postings"] += 1
+            table = LedgerBalance.__table__
+            stmt = insert(table).values([
+                {"account": account, **total, "updated_at": postings[-1]["posted_at"]} for account, total in totals.items()
+            ])
+            conn.execute(stmt.on_conflict_do_update(index_elements=["account"], set_={
+                "balance": table.c.balance + stmt.excluded.balance,
+                "debits": table.c.debits + stmt.excluded.debits,
+                "credits": table.c.credits + stmt.excluded.credits,
+                "postings": table.c.postings + stmt.excluded.postings,
+                "updated_at": stmt.excluded.updated_at
+            }))
+        if snapshot_at is not None:
+            balances = LedgerBalance.__table__
+            conn.execute(LedgerSnapshot.__table__.insert().from_select(
+                ["snapshot_at", "account", "balance", "debits", "credits"],
+                select(literal(snapshot_at, DateTime), balances.c.account, balances.c.balance, balances.c.debits,
+                       balances.c.credits)
+            ))
+    return posted
+
+def load_balances():
+    if engine is None:
+        return None
+    with engine.connect() as conn:
+        return [_balance_dict(row) for row in conn.execute(LedgerBalance.__table__.select().order_by("account"))]
+
+def last_snapshot_at():
+    if engine is None:
+        return None
+    with engine.connect() as conn:
+        return conn.execute(select(func.max(LedgerSnapshot.__table__.c.snapshot_at))).scalar()
+
+def balances_at(at):
+    """Balances as of a point in time: the latest snapshot before it plus the postings since"""
+    if engine is None:
+        return None
+    snapshots, postings = LedgerSnapshot.__table__, LedgerPosting.__table__
+    with engine.connect() as conn:
+        snapshot_at = conn.execute(select(func.max(snapshots.c.snapshot_at)).where(snapshots.c.snapshot_at <= at)).scalar()
+        balances = {}
+        if snapshot_at is not None:
+            for row in conn.execute(snapshots.select().where(snapshots.c.snapshot_at == snapshot_at)):
+                balances[row.account] = _balance_dict(row)
+        query = select(
+            postings.c.account,
+            func.sum(postings.c.amount).label("balance"),
+            func.sum(func.greatest(postings.c.amount, 0)).label("debits"),
+            func.sum(func.greatest(-postings.c.amount, 0)).label("credits")
+        ).where(postings.c.posted_at <= at).group_by(postings.c.account)
+        if snapshot_at is not None:
+            query = query.where(postings.c.posted_at > snapshot_at)
+        for row in conn.execute(query):
+            delta = _balance_dict(row)
+            base = balances.setdefault(row.account, {"account": row.account, "balance": 0.0, "debits": 0.0, "credits": 0.0})
+            for key in ("balance", "debits", "credits"):
+                base[key] += delta[key]
+    return {"as_of": at, "snapshot_at": snapshot_at, "accounts": sorted(balances.values(), key=lambda b: b["account"])}
+
+def recent_journals(limit=50, journal_id=None):
+    """Latest journals with their postings, or a single journal by id"""
+    if engine is None:
+        return None
+    journals, postings = LedgerJournal.__table__, LedgerPosting.__table__
+    with engine.connect() as conn:
+        query = journals.select()
+        query = query.where(journals.c.journal_id == journal_id) if journal_id else query.order_by(journals.c.id.desc()).limit(limit)
+        rows = [dict(row._mapping) for row in conn.execute(query)]
+        legs = {}
+        if rows:
+            for leg in conn.execute(postings.select().where(postings.c.journal_id.in_([row["journal_id"] for row in rows]))):
+                legs.setdefault(leg.journal_id, []).append({"account": leg.account, "amount": float(leg.amount)})
+    return [{**row, "postings": legs.get(row["journal_id"], [])} for row in rows]
+
+def settlement_rows(since, upto_id=None, chunk_size=5000, after_id=0):
+    """arl_table rows created since a time, with the created_at of the PDR line each settles"""
+    if engine is None:
+        return
+    arl, pdr = ArlTable.__table__, PdrTable.__table__
+    query = (
+        select(arl.c.id, arl.c.match_status, arl.c.created_at, pdr.c.created_at.label("opened_at"))
+        .select_from(arl.outerjoin(pdr, arl.c.line_id == pdr.c.line_id))
+        .where(arl.c.created_at >= since, arl.c.id > after_id)
+    )
+    if upto_id is not None:
+        query = query.where(arl.c.id <= upto_id)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+        for row in result:
+            yield dict(row._mapping)
@@ -0,0 +1,257 @@
+"""
+Second-pass matcher for bank responses whose UTR is missing or garbled.
+
+Open PDR lines and leftover bank credits are blocked by (value date, log
+amount bucket, currency) and by beneficiary (IFSC + account, or normalised
+name), so each bank credit is only scored against the handful of lines that
+share a block. Pairs are scored on amount distance, name similarity, date
+distance and account agreement and assigned greedily, best score first. A
+pair needs a beneficiary signal (name or account) on both sides, and a
+credit or line whose best score is shared by two candidates is reported as
+ambiguous rather than assigned. Credits that still match nothing are tried
+as aggregated settlements (one credit covering several lines of the same
+beneficiary) and open lines as split settlements (several credits for one
+line), over small bounded subsets. Every match is a suggestion for review.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from difflib import SequenceMatcher
+from itertools import combinations, groupby
+from typing import Any, Dict, List, Optional, Tuple
+
+AMOUNT_TOLERANCE = 0.01
+DATE_WINDOW_DAYS = 2
+MIN_SCORE = 0.8
+MAX_PARTS = 4
+MAX_GROUP_CANDIDATES = 12
+
+WEIGHTS = {"amount": 0.4, "name": 0.35, "account": 0.15, "date": 0.1}
+
+_LEGAL_SUFFIXES = {"ltd", "limited", "pvt", "private", "inc", "llp", "co", "corp", "company", "the", "m/s", "ms"}
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_BUCKET_BASE = math.log1p(2 * AMOUNT_TOLERANCE)
+
+
+def normalise_name(name: Optional[str]) -> str:
+    tokens = _NON_WORD.sub(" ", (name or "").lower()).split()
+    return " ".join(sorted(token for token in tokens if token not in _LEGAL_SUFFIXES))
+
+
+def name_similarity(a: str, b: str) -> Optional[float]:
+    if not a or not b:
+        return None
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def _day(value: Any) -> Optional[int]:
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    if isinstance(value, str) and len(value) >= 10:
+        try:
+            return date.fromisoformat(value[:10]).toordinal()
+        except ValueError:
+            return None
+    return None
+
+
+def _bucket(amount: float) -> int:
+    return int(math.log(max(amount, 1.0)) / _BUCKET_BASE)
+
+
+def _side(amount: float, currency: Optional[str], day: Optional[int], name: Optional[str],
+          ifsc: Optional[str], account: Optional[str]) -> Dict[str, Any]:
+    name = normalise_name(name)
+    account_key = (ifsc.upper(), account) if ifsc and account else None
+    return {
+        "amount": float(amount),
+        "currency": currency,
+        "day": day,
+        "name": name,
+        "account_key": account_key,
+        "party": account_key or (("name", name) if name else None)
+    }
+
+
+def pdr_side(pdr: Dict[str, Any]) -> Dict[str, Any]:
+    return _side(pdr["expected_amount"], pdr.get("expected_currency"), _day(pdr.get("created_at")),
+                 pdr.get("beneficiary_name"), pdr.get("ifsc"), pdr.get("beneficiary_account"))
+
+
+def bank_side(bank: Dict[str, Any]) -> Dict[str, Any]:
+    beneficiary = bank.get("beneficiary") or {}
+    return _side(bank["amount"], bank.get("currency"), _day(bank.get("transactionDate")),
+                 beneficiary.get("accountHolderName"), beneficiary.get("ifscCode"), beneficiary.get("accountNumber"))
+
+
+def score_pair(bank: Dict[str, Any], pdr: Dict[str, Any], tolerance: float = AMOUNT_TOLERANCE,
+               date_window: int = DATE_WINDOW_DAYS) -> Optional[float]:
+    """
+    Weighted score in [0, 1] over the signals both sides have; None when a
+    hard rule fails or neither the name nor the account can be compared.
+    """
+    if bank["currency"] != pdr["currency"]:
+        return None
+    allowed = tolerance * pdr["amount"]
+    diff = abs(bank["amount"] - pdr["amount"])
+    if diff > allowed:
+        return None
+    components = {"amount": 1.0 - diff / allowed if allowed else 1.0}
+
+    if bank["day"] is not None and pdr["day"] is not None:
+        days = abs(bank["day"] - pdr["day"])
+        if days > date_window:
+            return None
+        components["date"] = 1.0 - days / (date_window + 1)
+    if bank["account_key"] and pdr["account_key"]:
+        if bank["account_key"] != pdr["account_key"]:
+            return None
+        components["account"] = 1.0
+    similarity = name_similarity(bank["name"], pdr["name"])
+    if similarity is not None:
+        components["name"] = similarity
+    if "account" not in components and "name" not in components:
+        # Amount and date alone do not identify a payee
+        return None
+
+    weight = sum(WEIGHTS[key] for key in components)
+    return sum(WEIGHTS[key] * value for key, value in components.items()) / weight
+
+
+def block_keys(side: Dict[str, Any], spread: bool = False, date_window: int = DATE_WINDOW_DAYS) -> List[Tuple]:
+    """
+    Blocking keys of a side. With spread, also the neighbouring day and
+    amount blocks it can meet, i.e. the keys a new item invalidates.
+    """
+    bucket = _bucket(side["amount"])
+    if spread:
+        buckets = (bucket - 1, bucket, bucket + 1)
+        days = [None] if side["day"] is None else [*range(side["day"] - date_window, side["day"] + date_window + 1), None]
+    else:
+        buckets, days = (bucket,), (side["day"],)
+    keys = [("block", side["currency"], day, b) for day in days for b in buckets]
+    if side["party"]:
+        keys.append(("party", side["party"]))
+    return keys
+
+
+class _Index:
+    """Block index over one side: (day, amount bucket, currency) and beneficiary"""
+
+    def __init__(self, sides: List[Dict[str, Any]]):
+        self.by_block: Dict[Tuple, List[int]] = defaultdict(list)
+        self.by_party: Dict[Tuple, List[int]] = defaultdict(list)
+        for i, side in enumerate(sides):
+            self.by_block[(side["day"], _bucket(side["amount"]), side["currency"])].append(i)
+            if side["party"]:
+                self.by_party[side["party"]].append(i)
+
+    def candidates(self, side: Dict[str, Any], date_window: int) -> set:
+        found = set()
+        bucket = _bucket(side["amount"])
+        days = [None] if side["day"] is None else range(side["day"] - date_window, side["day"] + date_window + 1)
+        for day in days:
+            for b in (bucket - 1, bucket, bucket + 1):
+                found.update(self.by_block.get((day, b, side["currency"]), ()))
+        if side["day"] is not None:
+            # Lines without a date can still meet through the beneficiary block
+            for b in (bucket - 1, bucket, bucket + 1):
+                found.update(self.by_block.get((None, b, side["currency"]), ()))
+        if side["party"]:
+            found.update(self.by_party.get(side["party"], ()))
+        return found
+
+
+def _subset_match(target: float, parts: List[Tuple[int, float]], tolerance: float) -> Optional[List[int]]:
+    """Smallest subset (2..MAX_PARTS items) of parts whose amounts sum to target within tolerance"""
+    parts = [part for part in parts if part[1] <= target * (1 + tolerance)][:MAX_GROUP_CANDIDATES]
+    for size in range(2, min(MAX_PARTS, len(parts)) + 1):
+        for combo in combinations(parts, size):
+            if abs(sum(amount for _, amount in combo) - target) <= tolerance * target:
+                return [i for i, _ in combo]
+    return None
+
+
+def _group_candidates(owner: Dict[str, Any], index: _Index, sides: List[Dict[str, Any]], taken: set,
+                      date_window: int) -> List[Tuple[int, float]]:
+    if not owner["party"]:
+        return []
+    found = []
+    for i in index.by_party.get(owner["party"], ()):
+        side = sides[i]
+        if i in taken or side["currency"] != owner["currency"]:
+            continue
+        if owner["day"] is not None and side["day"] is not None and abs(owner["day"] - side["day"]) > date_window:
+            continue
+        found.append((i, side["amount"]))
+    return found
+
+
+def fuzzy_match(bank_records: List[Dict[str, Any]], pdr_records: List[Dict[str, Any]],
+                tolerance: float = AMOUNT_TOLERANCE, date_window: int = DATE_WINDOW_DAYS,
+                min_score: float = MIN_SCORE) -> List[Dict[str, Any]]:
+    """
+    Match leftover bank credits to open PDR lines.
+
+    Returns matches as {"type", "bank": [bank indexes], "pdr": [pdr indexes],
+    "score"} where type is one_to_one, aggregated, split or ambiguous (credits
+    and lines whose best candidates tied on score; none of them is assigned).
+    """
+    banks = [bank_side(bank) for bank in bank_records]
+    pdrs = [pdr_side(pdr) for pdr in pdr_records]
+    pdr_index = _Index(pdrs)
+
+    pairs = []
+    for b, bank in enumerate(banks):
+        for p in pdr_index.candidates(bank, date_window):
+            score = score_pair(bank, pdrs[p], tolerance, date_window)
+            if score is not None and score >= min_score:
+                pairs.append((score, b, p))
+    pairs.sort(key=lambda pair: (-pair[0], pair[1], pair[2]))
+
+    matches = []
+    used_bank, used_pdr = set(), set()
+    for score, tied in groupby(pairs, key=lambda pair: round(pair[0], 6)):
+        open_pairs = [(b, p) for _, b, p in tied if b not in used_bank and p not in used_pdr]
+        per_bank = Counter(b for b, _ in open_pairs)
+        per_pdr = Counter(p for _, p in open_pairs)
+        ambiguous_bank, ambiguous_pdr = set(), set()
+        for b, p in open_pairs:
+            if per_bank[b] == 1 and per_pdr[p] == 1:
+                matches.append({"type": "one_to_one", "bank": [b], "pdr": [p], "score": round(score, 3)})
+            else:
+                ambiguous_bank.add(b)
+                ambiguous_pdr.add(p)
+            used_bank.add(b)
+            used_pdr.add(p)
+        if ambiguous_bank:
+            matches.append({"type": "ambiguous", "bank": sorted(ambiguous_bank), "pdr": sorted(ambiguous_pdr),
+                            "score": round(score, 3)})
+
+    # One credit settling several lines of the same beneficiary
+    for b, bank in enumerate(banks):
+        if b in used_bank:
+            continue
+        parts = _subset_match(bank["amount"], _group_candidates(bank, pdr_index, pdrs, used_pdr, date_window), tolerance)
+        if parts:
+            used_bank.add(b)
+            used_pdr.update(parts)
+            matches.append({"type": "aggregated", "bank": [b], "pdr": parts, "score": 1.0})
+
+    # Several credits settling one line
+    bank_index = _Index(banks)
+    for p, pdr in enumerate(pdrs):
+        if p in used_pdr:
+            continue
+        parts = _subset_match(pdr["amount"], _group_candidates(pdr, bank_index, banks, used_bank, date_window), tolerance)
+        if parts:
+            used_pdr.add(p)
+            used_bank.update(parts)
+            matches.append({"type": "split", "bank": parts, "pdr": [p], "score": 1.0})
+
+    return matches
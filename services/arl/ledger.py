@@ -0,0 +1,143 @@
+"""
+Append-only double-entry ledger.
+
+Journals are checked to balance and buffered, then posted in batches: one
+transaction appends the journals and their postings and folds the batch's
+per-account totals into ledger_balances, so running balances never need a
+scan of the postings. A snapshot of all balances is written with the first
+batch after every snapshot interval, and balances at an earlier time are the
+latest snapshot before it plus the postings in between. Posting a journal_id
+twice books it once, so results seen by more than one sync are safe.
+"""
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import balances_at, engine, last_snapshot_at, load_balances, post_journals, recent_journals
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_SNAPSHOT_INTERVAL = 3600
+
+
+class Ledger:
+    def __init__(self, batch_size: int = DEFAULT_BATCH_SIZE, snapshot_interval: int = DEFAULT_SNAPSHOT_INTERVAL,
+                 history: int = 200):
+        self.batch_size = batch_size
+        self.snapshot_interval = timedelta(seconds=snapshot_interval)
+        self.last_snapshot_at: Optional[datetime] = None
+        self.pending: List[Dict[str, Any]] = []
+        # Without a database the ledger lives in memory for the life of the process
+        self.balances: Dict[str, Dict[str, float]] = {}
+        self.journals = deque(maxlen=history)
+        self.journal_ids = set()
+        self._lock = threading.Lock()
+
+    def load(self):
+        self.last_snapshot_at = last_snapshot_at()
+
+    def post(self, journal_id: str, legs: List[Tuple[str, float]], line_id: Optional[str] = None,
+             batch_id: Optional[str] = None, utr: Optional[str] = None, description: Optional[str] = None):
+        """Queue a journal of (account, signed amount) legs; debits are positive"""
+        legs = [(account, round(float(amount), 2)) for account, amount in legs if amount]
+        if len(legs) < 2 or round(sum(amount for _, amount in legs), 2) != 0:
+            raise ValueError(f"Journal {journal_id} does not balance: {legs}")
+        with self._lock:
+            self.pending.append({
+                "journal_id": journal_id, "line_id": line_id, "batch_id": batch_id, "utr": utr,
+                "description": (description or "")[:255], "legs": legs
+            })
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def post_result(self, row: Dict[str, Any]):
+        """Book the journal of a MATCHED reconciliation row"""
+        journal = row.get("journal")
+        if not journal or not row.get("line_id"):
+            return
+        metadata = row.get("metadata_info") or {}
+        self.post(
+            f"JRN-{row['line_id']}",
+            [(journal["debit"]["account"], journal["debit"]["amount"]),
+             (journal["credit"]["account"], -journal["credit"]["amount"])],
+            line_id=row["line_id"], batch_id=row.get("batch_id") or metadata.get("batch_id"), utr=row.get("utr"),
+            description=row.get("match_reason")
+        )
+
+    def flush(self) -> int:
+        """Post everything queued as one batch; returns how many journals were new"""
+        with self._lock:
+            batch, self.pending = self.pending, []
+            if not batch:
+                return 0
+            posted_at = datetime.utcnow()
+            if engine is None:
+                return self._post_in_memory(batch, posted_at)
+
+            journals = [{**{k: v for k, v in journal.items() if k != "legs"}, "posted_at": posted_at} for journal in batch]
+            postings = [
+                {"journal_id": journal["journal_id"], "account": account, "amount": amount, "posted_at": posted_at}
+                for journal in batch for account, amount in journal["legs"]
+            ]
+            snapshot_at = None
+            if self.last_snapshot_at is None or posted_at - self.last_snapshot_at >= self.snapshot_interval:
+                snapshot_at = posted_at
+            try:
+                posted = post_journals(journals, postings, snapshot_at)
+            except Exception:
+                # Keep the batch for the next flush rather than dropping journals
+                self.pending = batch + self.pending
+                raise
+            if snapshot_at is not None:
+                self.last_snapshot_at = snapshot_at
+            return len(posted)
+
+    def _post_in_memory(self, batch: List[Dict[str, Any]], posted_at: datetime) -> int:
+        posted = 0
+        for journal in batch:
+            if journal["journal_id"] in self.journal_ids:
+                continue
+            self.journal_ids.add(journal["journal_id"])
+            for account, amount in journal["legs"]:
+                balance = self.balances.setdefault(account, {"account": account, "balance": 0.0, "debits": 0.0, "credits": 0.0})
+                balance["balance"] = round(balance["balance"] + amount, 2)
+                balance["debits" if amount > 0 else "credits"] += abs(amount)
+            self.journals.append({
+                **{k: v for k, v in journal.items() if k != "legs"}, "posted_at": posted_at,
+                "postings": [{"account": account, "amount": amount} for account, amount in journal["legs"]]
+            })
+            posted += 1
+        return posted
+
+    def account_balances(self, at: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """Current balances, or balances as of a past time (needs the database)"""
+        if at is not None:
+            return balances_at(at)
+        accounts = load_balances()
+        if accounts is None:
+            with self._lock:
+                accounts = sorted((dict(balance) for balance in self.balances.values()), key=lambda b: b["account"])
+        debits = round(sum(account["debits"] for account in accounts), 2)
+        credits = round(sum(account["credits"] for account in accounts), 2)
+        return {
+            "as_of": datetime.utcnow(),
+            "accounts": accounts,
+            "total_debits": debits,
+            "total_credits": credits,
+            "balanced": debits == credits
+        }
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        journals = recent_journals(limit)
+        if journals is None:
+            with self._lock:
+                journals = list(self.journals)[-limit:][::-1]
+        return journals
+
+    def get(self, journal_id: str) -> Optional[Dict[str, Any]]:
+        journals = recent_journals(journal_id=journal_id)
+        if journals is None:
+            with self._lock:
+                journals = [journal for journal in self.journals if journal["journal_id"] == journal_id]
+        return journals[0] if journals else None
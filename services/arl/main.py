@@ -1,9 +1,18 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from utils import load_json, save_json
-from models import BankResponse, PDROutput
-from arl_logic import reconcile
-from typing import List
+from database import create_tables, engine
+from matching_engine import reconcile_records
+from overview_metrics import OverviewMetrics
+from statement_parsers import FORMATS, detect_format
+from stream_reconciler import ingest_statement
+from typing import Any, Dict, List, Optional
+import contextlib
+import hashlib
+import os
+import tempfile
+import pipeline
 
 app = FastAPI(title="ARL Agent", description="Reconciliation Service for Arealis Gateway")
 
@@ -16,37 +25,105 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+STATEMENT_DIR = os.getenv("ARL_STATEMENT_DIR", os.path.join(tempfile.gettempdir(), "arl_statements"))
+
+# Dashboard KPIs, read incrementally from arl_table so every worker agrees
+overview = OverviewMetrics()
+
+@app.on_event("startup")
+async def startup_event():
+    create_tables()
+    await run_in_threadpool(overview.refresh)
+    pipeline.start(consumers=int(os.getenv("ARL_CONSUMERS", "1")))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    pipeline.event_bus.close()
+
 @app.get("/")
 async def root():
     return {"message": "ARL Agent Service", "status": "running", "version": "1.0"}
 
 @app.get("/arl/overview-metrics")
 async def get_overview_metrics():
-    """Get overview metrics for ARL service"""
-    return {
-        "total_transactions": 1250,
-        "reconciled": 1180,
-        "pending": 45,
-        "discrepancies": 25,
-        "success_rate": 94.4,
-        "last_updated": "2024-01-15T10:30:00Z"
-    }
+    """Reconciliation KPIs from ARL's own counters, caught up with arl_table on every call"""
+    await run_in_threadpool(overview.refresh)
+    return {"success": True, "data": overview.snapshot()}
 
 @app.post("/reconcile")
-def reconcile_batch():
+def reconcile_batch(include_results: bool = True):
     # Load datasets
     bank_data_list = load_json("bank_responses.json")   # list
-    pdr_data_list = load_json("pdr_outputs.json")       # list
-
-    results = []
+    # Prefer expectations streamed from PDR over the static export
+    pdr_data_list = pipeline.get_dispatched_lines() or load_json("pdr_outputs.json")
 
-    for bank_data, pdr_data in zip(bank_data_list, pdr_data_list):
-        bank = BankResponse(**bank_data)
-        pdr = PDROutput(**pdr_data)
-        result = reconcile(bank, pdr)
-        results.append(result.dict())
+    # Hash-indexed matching: independent of file order, reports leftovers on both sides
+    run = reconcile_records(bank_data_list, pdr_data_list)
+    results = run["results"]
+    # File-based runs are not written to arl_table
+    overview.record_run(run, pdr_data_list)
 
     # Save result list
-    save_json("reconciliation_results.json", results)
+    save_json("reconciliation_results.json", results, compact=True)
+    pipeline.settle(results)
+    pipeline.publish_exceptions(results)
+
+    return {
+        "status": "success",
+        "summary": run["summary"],
+        "unmatched_bank": run["unmatched_bank"],
+        "reconciliation_results": results if include_results else []
+    }
+
+def publish_rows(rows: List[Dict[str, Any]]):
+    """Forward statement exceptions to RCA in the reconciliation result shape; matched lines leave the dispatch index"""
+    pipeline.settle(rows)
+    if engine is None:
+        for row in rows:
+            overview.record(row)
+    pipeline.publish_exceptions([
+        {
+            "line_id": row["line_id"],
+            "batch_id": row["metadata_info"].get("batch_id"),
+            "utr": row["utr"],
+            "match_status": row["match_status"],
+            "match_reason": row["match_reason"],
+            "exception": row["metadata_info"].get("exception")
+        }
+        for row in rows if row["line_id"]
+    ])
+
+@app.post("/arl/statements/ingest")
+async def ingest_bank_statement(request: Request, filename: str = "statement.ndjson", format: Optional[str] = None,
+                                chunk_size: int = 5000):
+    """
+    Reconcile an uploaded bank statement (NDJSON, CSV, MT940 or camt.053).
+
+    The body is spooled to disk as it arrives and reconciled in chunks;
+    uploading the same file again resumes from its last committed chunk. The
+    spooled copy is deleted once the statement is fully reconciled.
+    """
+    fmt = format or detect_format(filename)
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported statement format; use one of {list(FORMATS)}")
+
+    os.makedirs(STATEMENT_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=STATEMENT_DIR, suffix=".upload")
+    with os.fdopen(fd, "wb") as f:
+        async for data in request.stream():
+            digest.update(data)
+            # Disk writes stay off the event loop
+            await run_in_threadpool(f.write, data)
+    source_id = digest.hexdigest()
+    path = os.path.join(STATEMENT_DIR, source_id)
+    os.replace(tmp_path, path)
 
-    return {"status": "success", "reconciliation_results": results}
+    lookup = {} if engine is not None else {"pdr_lookup": pipeline.lookup_dispatched}
+    summary = await run_in_threadpool(
+        ingest_statement, path, fmt, source_id, filename, max(1, min(chunk_size, 50000)), on_chunk=publish_rows, **lookup
+    )
+    # An interrupted ingest raises before this point and keeps its copy until the re-upload completes it
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+    return {"status": "success", "source_id": source_id, "format": fmt, "summary": summary}
@@ -1,11 +1,16 @@
 from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import uvicorn
-import requests
 import json
 from datetime import datetime, timedelta
+from database import create_tables, engine
+from ledger import Ledger
+from open_items import OpenItemIndex
+from overview_metrics import OverviewMetrics
+import os
 
 app = FastAPI(title="ARL Agent Service", version="1.0")
 
@@ -25,42 +30,34 @@ def verify_api_key(x_api_key: str = Header(...)):
         raise HTTPException(status_code=401, detail="Invalid API Key")
     return x_api_key
 
-# In-memory store for ledger data (for demonstration purposes)
-ledger_db = [
-    {
-        "id": "JRN-10001",
-        "trace": "TRC-2024-001210",
-        "stage": "REQUEST",
-        "rail": "IMPS",
-        "account": "Ops-01",
-        "merchant": "Acme Ltd",
-        "amount": "₹12,000",
-        "status": "posted",
-        "createdAt": "2025-10-02 10:21:10",
-    },
-    {
-        "id": "JRN-10002",
-        "trace": "TRC-2024-001211",
-        "stage": "CLEARING",
-        "rail": "NEFT",
-        "account": "Ops-01",
-        "merchant": "Volt Inc",
-        "amount": "₹55,000",
-        "status": "posted",
-        "createdAt": "2025-10-02 10:19:07",
-    },
-    {
-        "id": "JRN-10003",
-        "trace": "TRC-2024-001212",
-        "stage": "SETTLEMENT",
-        "rail": "RTGS",
-        "account": "Ops-02",
-        "merchant": "Globex",
-        "amount": "₹1,20,000",
-        "status": "posted",
-        "createdAt": "2025-10-02 10:15:30",
-    }
-]
+# Double-entry ledger fed by every matched line
+ledger = Ledger(
+    batch_size=int(os.getenv("ARL_LEDGER_BATCH_SIZE", "500")),
+    snapshot_interval=int(os.getenv("ARL_LEDGER_SNAPSHOT_SECONDS", "3600"))
+)
+
+# Dashboard KPIs, read incrementally from arl_table so every worker agrees
+overview = OverviewMetrics()
+
+def on_result(row, opened_at):
+    ledger.post_result(row)
+    # Without a database the rows never reach arl_table, so count them here
+    if engine is None:
+        overview.record(row, opened_at)
+
+# Unmatched bank credits and unsettled PDR lines, re-matched incrementally
+open_items = OpenItemIndex(on_result=on_result)
+
+@app.on_event("startup")
+async def startup_event():
+    create_tables()
+    ledger.load()
+    await run_in_threadpool(open_items.load)
+    await run_in_threadpool(overview.refresh)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    ledger.flush()
 
 @app.get("/")
 async def read_root():
@@ -68,144 +65,51 @@ async def read_root():
 
 @app.get("/arl/overview-metrics")
 async def get_overview_metrics():
-    try:
-        # Fetch real data from ACC service
-        acc_response = requests.get("http://localhost:8000/acc/vendor-payments", 
-                                  headers={"X-API-Key": "arealis_api_key_2024"})
-        
-        if acc_response.status_code == 200:
-            acc_data = acc_response.json()
-            kpis = acc_data.get("data", {}).get("kpis", {})
-            
-            # Calculate real metrics from ACC data
-            total_paid = kpis.get("total_paid", 0)
-            vendors_count = kpis.get("vendors_count", 0)
-            pending_approvals = kpis.get("pending_approvals", 0)
-            
-            # Calculate success rate based on pending approvals
-            total_transactions = vendors_count + pending_approvals
-            success_rate = (vendors_count / total_transactions * 100) if total_transactions > 0 else 98.7
-            
-            return {
-                "success": True,
-                "data": {
-                    "todays_volume": {
-                        "value": total_transactions,
-                        "change_percent": 18.2,
-                        "trend": "up"
-                    },
-                    "success_rate": {
-                        "value": round(success_rate, 1),
-                        "change_percent": 2.1,
-                        "trend": "up"
-                    },
-                    "avg_time_to_settle": {
-                        "value": 2.3,
-                        "change_percent": -5.2,
-                        "trend": "down"
-                    },
-                    "approvals_pending": {
-                        "value": pending_approvals,
-                        "change_percent": 12.5,
-                        "trend": "up"
-                    }
-                }
-            }
-        else:
-            # Fallback to static data if ACC service is unavailable
-            return {
-                "success": True,
-                "data": {
-                    "todays_volume": {
-                        "value": 2847,
-                        "change_percent": 18.2,
-                        "trend": "up"
-                    },
-                    "success_rate": {
-                        "value": 98.7,
-                        "change_percent": 2.1,
-                        "trend": "up"
-                    },
-                    "avg_time_to_settle": {
-                        "value": 2.3,
-                        "change_percent": -5.2,
-                        "trend": "down"
-                    },
-                    "approvals_pending": {
-                        "value": 156,
-                        "change_percent": 12.5,
-                        "trend": "up"
-                    }
-                }
-            }
-    except Exception as e:
-        print(f"Error fetching real data: {e}")
-        # Fallback to static data
-        return {
-            "success": True,
-            "data": {
-                "todays_volume": {
-                    "value": 2847,
-                    "change_percent": 18.2,
-                    "trend": "up"
-                },
-                "success_rate": {
-                    "value": 98.7,
-                    "change_percent": 2.1,
-                    "trend": "up"
-                },
-                "avg_time_to_settle": {
-                    "value": 2.3,
-                    "change_percent": -5.2,
-                    "trend": "down"
-                },
-                "approvals_pending": {
-                    "value": 156,
-                    "change_percent": 12.5,
-                    "trend": "up"
-                }
-            }
-        }
+    """Reconciliation KPIs from ARL's own counters, caught up with arl_table on every call"""
+    await run_in_threadpool(overview.refresh)
+    return {
+        "success": True,
+        "data": overview.snapshot(open_items.metrics())
+    }
 
 @app.get("/arl/ledger-recon")
 async def get_ledger_recon():
-    # Placeholder for ledger and reconciliation data
+    metrics = open_items.metrics()
+    balances = await run_in_threadpool(ledger.account_balances)
+    journals = await run_in_threadpool(ledger.recent, 20)
     return {
         "success": True,
         "data": {
             "reconciliation_metrics": {
-                "total_transactions": 2847,
-                "matched_transactions": 2801,
-                "unmatched_transactions": 46,
-                "reconciliation_rate": 98.4
+                "total_transactions": metrics["total_transactions"],
+                "matched_transactions": metrics["matched_transactions"],
+                "unmatched_transactions": metrics["unmatched_transactions"],
+                "reconciliation_rate": metrics["reconciliation_rate"],
+                "open_bank_items": metrics["open_bank"],
+                "open_pdr_items": metrics["open_pdr"]
             },
+            "ledger": balances,
             "journal_entries": [
                 {
-                    "entry_id": "JE-001",
-                    "date": "2025-01-06",
-                    "description": "Vendor Payment - ABC Corp",
-                    "debit": 50000.00,
-                    "credit": 0.00,
+                    "entry_id": journal["journal_id"],
+                    "date": journal["posted_at"].date().isoformat(),
+                    "description": journal["description"] or journal["line_id"],
+                    "debit": sum(leg["amount"] for leg in journal["postings"] if leg["amount"] > 0),
+                    "credit": -sum(leg["amount"] for leg in journal["postings"] if leg["amount"] < 0),
                     "status": "matched"
-                },
-                {
-                    "entry_id": "JE-002", 
-                    "date": "2025-01-06",
-                    "description": "Bank Transfer - XYZ Ltd",
-                    "debit": 0.00,
-                    "credit": 75000.00,
-                    "status": "pending"
                 }
+                for journal in journals
             ],
             "exception_logs": [
                 {
-                    "exception_id": "EX-001",
-                    "transaction_id": "TXN-12345",
-                    "type": "amount_mismatch",
-                    "description": "Payment amount differs from invoice",
+                    "exception_id": f"EX-{row['line_id']}",
+                    "transaction_id": row["psp_reference"] or row["line_id"],
+                    "type": (row["metadata_info"]["exception"] or "exception").lower().replace(" ", "_"),
+                    "description": f"{row['metadata_info']['exception']} ({row['match_reason']})",
                     "severity": "high",
-                    "created_at": "2025-01-06T10:30:00Z"
+                    "created_at": row["created_at"].isoformat() + "Z"
                 }
+                for row in reversed(open_items.recent_exceptions)
             ]
         }
     }
@@ -214,14 +118,16 @@ async def get_ledger_recon():
 async def download_journal_csv(journal_id: str, api_key: str = Depends(verify_api_key)):
     """Download journal CSV for a specific journal entry"""
     try:
-        # Find the journal entry
-        journal = next((j for j in ledger_db if j["id"] == journal_id), None)
+        journal = await run_in_threadpool(ledger.get, journal_id)
         if not journal:
             raise HTTPException(status_code=404, detail="Journal entry not found")
         
-        # Generate CSV content
-        csv_content = f"""Journal ID,Trace ID,Stage,Rail,Account,Merchant,Amount,Status,Created At
-{journal['id']},{journal['trace']},{journal['stage']},{journal['rail']},{journal['account']},{journal['merchant']},{journal['amount']},{journal['status']},{journal['createdAt']}"""
+        # One row per posting
+        csv_content = "Journal ID,Line ID,Batch ID,UTR,Account,Debit,Credit,Posted At\n" + "\n".join(
+            f"{journal['journal_id']},{journal['line_id'] or ''},{journal['batch_id'] or ''},{journal['utr'] or ''},"
+            f"{leg['account']},{max(leg['amount'], 0):.2f},{max(-leg['amount'], 0):.2f},{journal['posted_at'].isoformat()}"
+            for leg in journal["postings"]
+        )
         
         return {
             "success": True,
@@ -232,16 +138,27 @@ async def download_journal_csv(journal_id: str, api_key: str = Depends(verify_ap
                 "generated_at": datetime.now().isoformat()
             }
         }
+    except HTTPException:
+        raise
     except Exception as e:
         return {"success": False, "message": f"Error generating journal CSV: {str(e)}"}
 
+@app.get("/arl/ledger/balances")
+async def get_ledger_balances(at: Optional[datetime] = None):
+    """Account balances now, or as of a past time from the nearest snapshot"""
+    balances = await run_in_threadpool(ledger.account_balances, at)
+    if balances is None:
+        raise HTTPException(status_code=503, detail="Historical balances need DATABASE_URL")
+    return {"success": True, "data": balances}
+
 @app.post("/arl/rerun-matching")
 async def rerun_matching(api_key: str = Depends(verify_api_key)):
-    """Re-run matching for all unmatched entries"""
+    """Re-run matching for the open items touched since the last run"""
     try:
-        # Simulate re-running matching
-        matched_count = 3
-        unmatched_count = 1
+        run = await run_in_threadpool(open_items.rerun)
+        run["journals_posted"] = await run_in_threadpool(ledger.flush)
+        matched_count = run["matched"]
+        unmatched_count = run["open_bank"] + run["open_pdr"]
         
         return {
             "success": True,
@@ -249,7 +166,8 @@ async def rerun_matching(api_key: str = Depends(verify_api_key)):
             "data": {
                 "matched_count": matched_count,
                 "unmatched_count": unmatched_count,
-                "executed_at": datetime.now().isoformat()
+                "executed_at": datetime.now().isoformat(),
+                "run": run
             }
         }
     except Exception as e:
@@ -257,18 +175,24 @@ async def rerun_matching(api_key: str = Depends(verify_api_key)):
 
 @app.post("/arl/match-entry/{entry_id}")
 async def match_entry(entry_id: str, api_key: str = Depends(verify_api_key)):
-    """Match a specific unmatched entry"""
+    """Match a specific unmatched entry (a PDR line_id or bank transaction id)"""
     try:
-        # Simulate matching an entry
+        run = await run_in_threadpool(open_items.rematch_entry, entry_id)
+        if run is None:
+            raise HTTPException(status_code=404, detail="Entry is not open for matching")
+        run["journals_posted"] = await run_in_threadpool(ledger.flush)
         return {
             "success": True,
-            "message": f"Entry {entry_id} matched successfully",
+            "message": f"Entry {entry_id} {'matched successfully' if run['status'] == 'matched' else 'is ' + run['status']}",
             "data": {
                 "entry_id": entry_id,
                 "matched_at": datetime.now().isoformat(),
-                "status": "matched"
+                "status": run["status"],
+                "run": run
             }
         }
+    except HTTPException:
+        raise
     except Exception as e:
         return {"success": False, "message": f"Error matching entry: {str(e)}"}
 
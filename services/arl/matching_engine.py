@@ -0,0 +1,206 @@
+"""
+Indexed reconciliation of bank responses against PDR expectations.
+
+Bank responses are matched in three passes so the outcome does not depend
+on the order of either file: an exact-UTR join run by the columnar kernel in
+recon_kernel, then hash lookups of the bank's source reference as line_id,
+then the blocked fuzzy matcher in fuzzy_matcher for whatever is left
+(including split and aggregated settlements). Records stay plain dicts; the
+result rows have the ReconciliationResult shape and semantics of
+arl_logic.reconcile. Fuzzy matches are not posted: their lines come back as
+EXCEPTION rows without a journal, naming the suggested credit, for review.
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from fuzzy_matcher import fuzzy_match
+from recon_kernel import (
+    AMOUNT_TOLERANCE, EXCEPTION_LABELS, OK, UTR_MISMATCH, AMOUNT_MISMATCH, CURRENCY_MISMATCH,
+    bank_columns, pdr_columns, reconcile_columns
+)
+
+
+def bank_utr(bank: Dict[str, Any]) -> Optional[str]:
+    return (bank.get("response") or {}).get("utrNumber")
+
+
+def build_result(pdr: Dict[str, Any], utr: Optional[str], code: int, timestamp: datetime,
+                 match_reason: str = "UTR+Amount+Currency", expected_amount: Optional[float] = None) -> Dict[str, Any]:
+    if code == OK:
+        if expected_amount is None:
+            expected_amount = float(pdr["expected_amount"])
+        return {
+            "line_id": pdr["line_id"],
+            "batch_id": pdr.get("batch_id"),
+            "utr": utr,
+            "match_status": "MATCHED",
+            "match_reason": match_reason,
+            "journal": {
+                "debit": {"account": "Expense", "amount": expected_amount},
+                "credit": {"account": "Bank", "amount": expected_amount}
+            },
+            "exception": None,
+            "timestamp": timestamp
+        }
+    return {
+        "line_id": pdr["line_id"],
+        "batch_id": pdr.get("batch_id"),
+        "utr": utr,
+        "match_status": "EXCEPTION",
+        "match_reason": "No match" if match_reason == "UTR+Amount+Currency" else match_reason,
+        "journal": None,
+        "exception": EXCEPTION_LABELS[code],
+        "timestamp": timestamp
+    }
+
+
+def evaluate(bank: Dict[str, Any], pdr: Dict[str, Any], timestamp: datetime,
+             match_reason: str = "UTR+Amount+Currency", tolerance: float = AMOUNT_TOLERANCE) -> Dict[str, Any]:
+    """Same rules as arl_logic.reconcile, on plain dicts"""
+    utr = bank_utr(bank)
+    expected_amount = float(pdr["expected_amount"])
+    if utr is None or utr != pdr.get("expected_utr"):
+        code = UTR_MISMATCH
+    elif abs(float(bank["amount"]) - expected_amount) > tolerance * expected_amount:
+        code = AMOUNT_MISMATCH
+    elif bank.get("currency") != pdr.get("expected_currency"):
+        code = CURRENCY_MISMATCH
+    else:
+        code = OK
+    return build_result(pdr, utr, code, timestamp, match_reason)
+
+
+def missing_bank_response(pdr: Dict[str, Any], timestamp: datetime) -> Dict[str, Any]:
+    return {
+        "line_id": pdr["line_id"],
+        "batch_id": pdr.get("batch_id"),
+        "utr": None,
+        "match_status": "EXCEPTION",
+        "match_reason": "No match",
+        "journal": None,
+        "exception": "Missing bank response",
+        "timestamp": timestamp
+    }
+
+
+def review_result(pdr: Dict[str, Any], utr: Optional[str], match_reason: str, exception: str,
+                  timestamp: datetime) -> Dict[str, Any]:
+    return {
+        "line_id": pdr["line_id"],
+        "batch_id": pdr.get("batch_id"),
+        "utr": utr,
+        "match_status": "EXCEPTION",
+        "match_reason": match_reason,
+        "journal": None,
+        "exception": exception,
+        "timestamp": timestamp
+    }
+
+
+def unmatched_bank_entry(bank: Dict[str, Any], reason: str) -> Dict[str, Any]:
+    return {
+        "transaction_id": bank.get("transactionId"),
+        "source_reference": bank.get("sourceReferenceNumber"),
+        "utr": bank_utr(bank),
+        "amount": bank.get("amount"),
+        "currency": bank.get("currency"),
+        "reason": reason
+    }
+
+
+def reconcile_records(bank_records: Iterable[Dict[str, Any]], pdr_records: Iterable[Dict[str, Any]],
+                      tolerance: float = AMOUNT_TOLERANCE, timestamp: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Match every bank response to at most one PDR line in O(n + m).
+
+    Returns {"results", "unmatched_bank", "summary"}: one result per PDR line
+    in PDR order (lines with no bank response are "Missing bank response"
+    exceptions) and the bank responses that matched no line.
+    """
+    timestamp = timestamp or datetime.utcnow()
+    bank_records = list(bank_records)
+    pdr_records = list(pdr_records)
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(pdr_records)
+    unmatched_bank: List[Dict[str, Any]] = []
+
+    # Pass 1: exact UTR, joined and checked column-wise
+    bank_cols, pdr_cols = bank_columns(bank_records), pdr_columns(pdr_records)
+    kernel = reconcile_columns(bank_cols, pdr_cols, tolerance)
+    owners = np.flatnonzero(kernel["code"] >= 0)
+    owned = kernel["pdr_index"][owners]
+    for i, utr, code, amount in zip(owned.tolist(), bank_cols["utr"][owners].tolist(),
+                                    kernel["code"][owners].tolist(), pdr_cols["amount"][owned].tolist()):
+        results[i] = build_result(pdr_records[i], utr, code, timestamp, expected_amount=amount)
+    for b in np.flatnonzero(kernel["duplicate"]).tolist():
+        unmatched_bank.append(unmatched_bank_entry(bank_records[b], "Duplicate UTR"))
+    leftovers = [bank_records[b] for b in np.flatnonzero(kernel["pdr_index"] < 0).tolist()]
+
+    # Pass 2: the bank echoes our line_id as its source reference
+    by_line: Dict[str, int] = {}
+    if leftovers:
+        for i, pdr in enumerate(pdr_records):
+            if results[i] is None:
+                by_line.setdefault(pdr["line_id"], i)
+    remaining = []
+    for bank in leftovers:
+        i = by_line.get(bank.get("sourceReferenceNumber"))
+        if i is not None and results[i] is None:
+            results[i] = evaluate(bank, pdr_records[i], timestamp, match_reason="Reference fallback", tolerance=tolerance)
+        else:
+            remaining.append(bank)
+
+    # Pass 3: blocked fuzzy matching of what is left on both sides
+    fuzzy_counts: Dict[str, int] = {}
+    if remaining:
+        open_lines = [i for i, result in enumerate(results) if result is None]
+        matches = fuzzy_match(remaining, [pdr_records[i] for i in open_lines], tolerance=tolerance) if open_lines else []
+        matched_bank, ambiguous_bank = set(), set()
+        for match in matches:
+            fuzzy_counts[match["type"]] = fuzzy_counts.get(match["type"], 0) + 1
+            if match["type"] == "ambiguous":
+                for p in match["pdr"]:
+                    i = open_lines[p]
+                    results[i] = review_result(pdr_records[i], None, f"Fuzzy tie ({match['score']})",
+                                               "Ambiguous fuzzy match", timestamp)
+                ambiguous_bank.update(match["bank"])
+                continue
+            banks = [remaining[b] for b in match["bank"]]
+            utr = ",".join(filter(None, (bank_utr(bank) for bank in banks))) or None
+            reason = {
+                "one_to_one": f"Fuzzy match ({match['score']})",
+                "aggregated": "Aggregated settlement",
+                "split": "Split settlement"
+            }[match["type"]]
+            for p in match["pdr"]:
+                i = open_lines[p]
+                results[i] = review_result(pdr_records[i], utr, reason, "Fuzzy match needs review", timestamp)
+            matched_bank.update(match["bank"])
+        for b, bank in enumerate(remaining):
+            if b in ambiguous_bank:
+                unmatched_bank.append(unmatched_bank_entry(bank, "Ambiguous fuzzy match"))
+            elif b not in matched_bank:
+                unmatched_bank.append(unmatched_bank_entry(bank, "No matching PDR line"))
+
+    missing = 0
+    for i, result in enumerate(results):
+        if result is None:
+            results[i] = missing_bank_response(pdr_records[i], timestamp)
+            missing += 1
+
+    matched = sum(1 for result in results if result["match_status"] == "MATCHED")
+    return {
+        "results": results,
+        "unmatched_bank": unmatched_bank,
+        "summary": {
+            "bank_records": len(bank_records),
+            "pdr_records": len(pdr_records),
+            "matched": matched,
+            "exceptions": len(results) - matched,
+            "unmatched_pdr": missing,
+            "unmatched_bank": len(unmatched_bank),
+            "fuzzy_matches": fuzzy_counts
+        }
+    }
@@ -0,0 +1,299 @@
+"""
+Persistent index of the open reconciliation set.
+
+Only unmatched bank credits and unsettled PDR lines live here, each filed
+under the keys it can match on: UTR, line reference, beneficiary and the
+fuzzy matcher's (currency, day, amount bucket) blocks. A new item marks the
+keys it can reach as dirty, and a rematch runs the matching engine over just
+the items filed under dirty keys, so a rerun costs in proportion to what
+changed rather than to the size of the ledger. A PDR line leaves the set
+only when it is MATCHED; lines with an exception stay open for a later
+credit or a manual match. With DATABASE_URL set the index is mirrored to
+arl_open_items and fed from the pdr_table and arl_table rows past its stored
+watermarks. Every worker process keeps its own copy: changes are made under
+a database advisory lock, and a worker whose copy is older than the stored
+version reloads it first.
+"""
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from database import (
+    arl_rows_since, index_lock, load_index_state, load_open_items, max_arl_id, pdr_lines_since, save_index_changes
+)
+from fuzzy_matcher import bank_side, block_keys, pdr_side
+from matching_engine import bank_utr, reconcile_records
+from stream_reconciler import arl_rows
+
+BANK, PDR = "BANK", "PDR"
+RERUN_SOURCE = "rerun"
+STATE_KEYS = ("pdr_watermark", "arl_watermark", "matched", "exceptions", "version")
+
+Item = Tuple[str, str]
+
+
+def bank_from_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Bank record rebuilt from an unmatched_bank entry"""
+    return {
+        "transactionId": entry.get("transaction_id"),
+        "sourceReferenceNumber": entry.get("source_reference"),
+        "amount": entry.get("amount") or 0,
+        "currency": entry.get("currency"),
+        "response": {"utrNumber": entry.get("utr")}
+    }
+
+
+def bank_item_id(bank: Dict[str, Any]) -> str:
+    return bank.get("transactionId") or f"{bank_utr(bank) or ''}|{bank.get('sourceReferenceNumber') or ''}|{bank.get('amount')}"
+
+
+def item_keys(side: str, record: Dict[str, Any], spread: bool = False) -> List[Tuple]:
+    """Keys an item is filed under, or with spread the keys whose items it could match"""
+    if side == BANK:
+        keys = [("utr", bank_utr(record)), ("ref", record.get("sourceReferenceNumber"))]
+        fuzzy = bank_side(record)
+    else:
+        keys = [("utr", record.get("expected_utr")), ("ref", record["line_id"])]
+        fuzzy = pdr_side(record)
+    return [key for key in keys if key[1]] + block_keys(fuzzy, spread)
+
+
+def _row(side: str, item_id: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    return {"side": side, "item_id": item_id, "payload": record, "dirty": True, "created_at": datetime.utcnow()}
+
+
+class OpenItemIndex:
+    """
+    on_result(row, opened_at) receives every arl_table row the index takes in,
+    with the created_at of the PDR line it settles when known.
+    """
+
+    def __init__(self, history: int = 200, on_result: Optional[Callable[[Dict[str, Any], Any], None]] = None):
+        self.on_result = on_result
+        self.items: Dict[str, Dict[str, Dict[str, Any]]] = {BANK: {}, PDR: {}}
+        self.by_key: Dict[Tuple, Set[Item]] = defaultdict(set)
+        self.dirty: Set[Tuple] = set()
+        self.state = dict.fromkeys(STATE_KEYS, 0)
+        self.recent_exceptions = deque(maxlen=history)
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._lock = threading.RLock()
+
+    def _add(self, side: str, item_id: str, record: Dict[str, Any], dirty: bool = True) -> bool:
+        if item_id in self.items[side]:
+            return False
+        self.items[side][item_id] = record
+        for key in item_keys(side, record):
+            self.by_key[key].add((side, item_id))
+        if dirty:
+            self.dirty.update(item_keys(side, record, spread=True))
+        return True
+
+    def _close(self, side: str, item_id: str) -> Optional[Dict[str, Any]]:
+        record = self.items[side].pop(item_id, None)
+        if record is None:
+            return None
+        for key in item_keys(side, record):
+            members = self.by_key.get(key)
+            if members is not None:
+                members.discard((side, item_id))
+                if not members:
+                    del self.by_key[key]
+        return record
+
+    def _load(self):
+        state, rows = load_open_items()
+        if state is None:
+            return
+        self.items = {BANK: {}, PDR: {}}
+        self.by_key = defaultdict(set)
+        self.dirty = set()
+        self.state = dict.fromkeys(STATE_KEYS, 0)
+        self.state.update({key: value for key, value in state.items() if key in self.state})
+        for row in rows:
+            self._add(row["side"], row["item_id"], row["payload"], dirty=row["dirty"])
+
+    def _refresh(self):
+        """Reload from arl_open_items if another worker has changed the index since this copy was taken"""
+        state = load_index_state()
+        if state is not None and state.get("version", 0) != self.state["version"]:
+            self._load()
+
+    def _save(self, added, closed, cleaned, results=()):
+        self.state["version"] += 1
+        save_index_changes(added, closed, cleaned, self.state, results)
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the index across threads and worker processes, on an up-to-date copy"""
+        with self._lock, index_lock():
+            self._refresh()
+            yield
+
+    def load(self):
+        """Rebuild the in-memory index from arl_open_items"""
+        with self._lock:
+            self._load()
+        print(f"✅ ARL open items loaded: {len(self.items[BANK])} bank, {len(self.items[PDR])} PDR")
+
+    def add(self, bank_records: Iterable[Dict[str, Any]] = (), pdr_lines: Iterable[Dict[str, Any]] = ()) -> int:
+        """File new open items directly; returns how many were new"""
+        with self._exclusive():
+            added = []
+            for bank in bank_records:
+                item_id = bank_item_id(bank)
+                if self._add(BANK, item_id, bank):
+                    added.append(_row(BANK, item_id, bank))
+            for line in pdr_lines:
+                if isinstance(line.get("created_at"), datetime):
+                    line = {**line, "created_at": line["created_at"].isoformat()}
+                if self._add(PDR, line["line_id"], line):
+                    added.append(_row(PDR, line["line_id"], line))
+            if added:
+                self._save(added, [], [])
+            return len(added)
+
+    def sync(self) -> Dict[str, int]:
+        """Pull pdr_table and arl_table rows past the watermarks into the index"""
+        with self._exclusive():
+            return self._sync()
+
+    def _sync(self) -> Dict[str, int]:
+        # Any arl row up to here refers to a PDR line the pdr_table read below will see
+        arl_upto = max_arl_id()
+        new: Dict[Item, Dict[str, Any]] = {}
+        closed: List[Item] = []
+
+        pdr_watermark = self.state["pdr_watermark"]
+        for row_id, line in pdr_lines_since(pdr_watermark):
+            pdr_watermark = row_id
+            if line["status"] != "UNROUTABLE" and self._add(PDR, line["line_id"], line):
+                new[(PDR, line["line_id"])] = line
+
+        arl_watermark = self.state["arl_watermark"]
+        for row in arl_rows_since(arl_watermark, arl_upto):
+            arl_watermark = row["id"]
+            metadata = row["metadata_info"] or {}
+            if metadata.get("source_id") == RERUN_SOURCE:
+                continue
+            line = None
+            if row["match_status"] == "UNMATCHED_BANK":
+                bank = metadata.get("record") or bank_from_entry(metadata)
+                item_id = bank_item_id(bank)
+                if self._add(BANK, item_id, bank):
+                    new[(BANK, item_id)] = bank
+            elif row["match_status"] == "MATCHED" and row["line_id"]:
+                self.state["matched"] += 1
+                line = self._close(PDR, row["line_id"])
+                # Lines opened and settled within this sync never reach the table
+                if line and new.pop((PDR, row["line_id"]), None) is None:
+                    closed.append((PDR, row["line_id"]))
+            elif row["line_id"]:
+                self.state["exceptions"] += 1
+                line = self.items[PDR].get(row["line_id"])
+            if self.on_result:
+                self.on_result(row, (line or {}).get("created_at"))
+
+        if (pdr_watermark, arl_watermark) != (self.state["pdr_watermark"], self.state["arl_watermark"]):
+            self.state.update(pdr_watermark=pdr_watermark, arl_watermark=arl_watermark)
+            self._save([_row(side, item_id, record) for (side, item_id), record in new.items()], closed, [])
+        return {"new_items": len(new), "closed_items": len(closed)}
+
+    def _rematch(self, keys: Optional[Iterable[Tuple]]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        started = datetime.utcnow()
+        full = keys is None
+        keys = set(self.dirty) if full else set(keys)
+        members: Set[Item] = set()
+        for key in keys:
+            members.update(self.by_key.get(key, ()))
+        banks = [(item_id, self.items[BANK][item_id]) for side, item_id in members if side == BANK]
+        pdrs = [self.items[PDR][item_id] for side, item_id in members if side == PDR]
+
+        closed: List[Item] = []
+        rows: List[Dict[str, Any]] = []
+        if banks and pdrs:
+            run = reconcile_records([bank for _, bank in banks], pdrs, timestamp=started)
+            still_open = {bank_item_id(bank_from_entry(entry)) for entry in run["unmatched_bank"]}
+            # Only a credit that settled a line closes; review suggestions and mismatches leave it open
+            settled = {result["utr"] for result in run["results"] if result["match_status"] == "MATCHED"}
+            for item_id, bank in banks:
+                if item_id not in still_open and bank_utr(bank) in settled and self._close(BANK, item_id):
+                    closed.append((BANK, item_id))
+            rows = [row for row in arl_rows(run, [bank for _, bank in banks], RERUN_SOURCE, started) if row["line_id"]]
+            for row in rows:
+                if row["match_status"] == "MATCHED":
+                    line = self._close(PDR, row["line_id"])
+                    if line:
+                        closed.append((PDR, row["line_id"]))
+                    self.state["matched"] += 1
+                else:
+                    # The line stays open: a later credit or a reviewer may still settle it
+                    line = self.items[PDR].get(row["line_id"])
+                    self.state["exceptions"] += 1
+                    self.recent_exceptions.append(row)
+                if self.on_result:
+                    self.on_result(row, (line or {}).get("created_at"))
+
+        self.dirty -= keys
+        closed_set = set(closed)
+        cleaned = [item for item in members if item not in closed_set] if full else []
+        if closed or cleaned or rows:
+            self._save([], closed, cleaned, rows)
+
+        matched = sum(1 for row in rows if row["match_status"] == "MATCHED")
+        self.last_run = {
+            "keys": len(keys),
+            "candidates": len(members),
+            "matched": matched,
+            "exceptions": len(rows) - matched,
+            "closed_bank": sum(1 for side, _ in closed if side == BANK),
+            "closed_pdr": sum(1 for side, _ in closed if side == PDR),
+            "open_bank": len(self.items[BANK]),
+            "open_pdr": len(self.items[PDR]),
+            "executed_at": started.isoformat(),
+            "elapsed_ms": round((datetime.utcnow() - started).total_seconds() * 1000, 2)
+        }
+        return self.last_run, rows
+
+    def rematch(self, keys: Optional[Iterable[Tuple]] = None) -> Dict[str, Any]:
+        """Re-match the items filed under keys, by default every dirty key"""
+        with self._exclusive():
+            return self._rematch(keys)[0]
+
+    def rerun(self) -> Dict[str, Any]:
+        """Sync deltas, then re-match what they touched"""
+        with self._exclusive():
+            synced = self._sync()
+            return {**self._rematch(None)[0], **synced}
+
+    def rematch_entry(self, entry_id: str) -> Optional[Dict[str, Any]]:
+        """Re-match the keys one open item can reach; None if it is not open"""
+        with self._exclusive():
+            side = PDR if entry_id in self.items[PDR] else BANK if entry_id in self.items[BANK] else None
+            if side is None:
+                return None
+            summary, rows = self._rematch(item_keys(side, self.items[side][entry_id], spread=True))
+            if side == PDR:
+                status = next((row["match_status"].lower() for row in rows if row["line_id"] == entry_id), "unmatched")
+            else:
+                status = "unmatched" if entry_id in self.items[BANK] else "matched"
+            return {**summary, "side": side, "status": status}
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            # Lines with an exception are still open, so every line is either matched or open
+            open_pdr = len(self.items[PDR])
+            total = self.state["matched"] + open_pdr
+            return {
+                "total_transactions": total,
+                "matched_transactions": self.state["matched"],
+                "unmatched_transactions": open_pdr,
+                "reconciliation_rate": round(self.state["matched"] / total * 100, 1) if total else 0.0,
+                "exceptions": self.state["exceptions"],
+                "open_bank": len(self.items[BANK]),
+                "open_pdr": open_pdr,
+                "dirty_keys": len(self.dirty),
+                "last_run": self.last_run
+            }
@@ -0,0 +1,152 @@
+"""
+In-memory reconciliation metrics for the ARL dashboard.
+
+arl_table rows are folded into per-day counters (volume, matched,
+exceptions, unmatched bank credits) and a time-to-settle histogram, so
+/arl/overview-metrics is answered from memory. refresh() reads only the rows
+added since the previous call, so every worker process reports the same
+figures whichever worker reconciled. Runs that never reach arl_table
+(file-based /reconcile, or no DATABASE_URL) are folded in with record().
+"""
+import threading
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from database import max_arl_id, settlement_rows
+
+# Histogram upper bounds in seconds: 1m, 5m, 15m, 30m, 1h, 2h, 4h, 12h, 1d, 2d, then overflow
+SETTLE_BUCKETS = (60, 300, 900, 1800, 3600, 7200, 14400, 43200, 86400, 172800)
+SETTLE_LABELS = ("1m", "5m", "15m", "30m", "1h", "2h", "4h", "12h", "1d", "2d", "2d+")
+DEFAULT_DAYS = 7
+
+
+def _as_datetime(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).replace(tzinfo=None)
+        except ValueError:
+            return None
+    return None
+
+
+def _change(current: float, previous: float) -> Dict[str, Any]:
+    change = round((current - previous) / previous * 100, 1) if previous else 0.0
+    return {"change_percent": change, "trend": "up" if change > 0 else "down" if change < 0 else "flat"}
+
+
+def _empty_day() -> Dict[str, Any]:
+    return {
+        "volume": 0, "matched": 0, "exceptions": 0, "unmatched_bank": 0,
+        "settle_count": 0, "settle_seconds": 0.0, "settle_histogram": [0] * len(SETTLE_LABELS)
+    }
+
+
+class OverviewMetrics:
+    def __init__(self, days: int = DEFAULT_DAYS):
+        self.days = days
+        self.by_day: Dict[date, Dict[str, Any]] = {}
+        self.loaded_upto = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _day(self, day: date) -> Dict[str, Any]:
+        counters = self.by_day.get(day)
+        if counters is None:
+            counters = self.by_day[day] = _empty_day()
+            cutoff = day - timedelta(days=self.days)
+            for old in [d for d in self.by_day if d <= cutoff]:
+                del self.by_day[old]
+        return counters
+
+    def record(self, row: Dict[str, Any], opened_at: Any = None):
+        """Fold in one reconciliation row ({match_status, created_at}) that is not read from arl_table"""
+        created_at = _as_datetime(row.get("created_at")) or datetime.utcnow()
+        with self._lock:
+            counters = self._day(created_at.date())
+            status = row["match_status"]
+            counters["volume"] += 1
+            if status == "MATCHED":
+                counters["matched"] += 1
+                opened = _as_datetime(opened_at)
+                if opened is not None and opened <= created_at:
+                    seconds = (created_at - opened).total_seconds()
+                    counters["settle_count"] += 1
+                    counters["settle_seconds"] += seconds
+                    counters["settle_histogram"][bisect_left(SETTLE_BUCKETS, seconds)] += 1
+            elif status == "UNMATCHED_BANK":
+                counters["unmatched_bank"] += 1
+            else:
+                counters["exceptions"] += 1
+
+    def record_run(self, run: Dict[str, Any], pdr_lines: List[Dict[str, Any]]):
+        """Fold in a matching_engine run; results are in the order of pdr_lines"""
+        for result, line in zip(run["results"], pdr_lines):
+            self.record({"match_status": result["match_status"], "created_at": result["timestamp"]}, line.get("created_at"))
+        timestamp = run["results"][0]["timestamp"] if run["results"] else None
+        for _ in run["unmatched_bank"]:
+            self.record({"match_status": "UNMATCHED_BANK", "created_at": timestamp})
+
+    def refresh(self):
+        """Fold in the arl_table rows added since the last refresh; the whole window on the first call"""
+        with self._refresh_lock:
+            upto = max_arl_id()
+            if upto <= self.loaded_upto:
+                return
+            since = datetime.combine(datetime.utcnow().date() - timedelta(days=self.days - 1), datetime.min.time())
+            loaded = 0
+            for row in settlement_rows(since, upto, after_id=self.loaded_upto) or ():
+                self.record(row, row["opened_at"])
+                loaded += 1
+            first = not self.loaded_upto
+            self.loaded_upto = upto
+        if first and loaded:
+            print(f"✅ ARL overview metrics loaded from {loaded} reconciliation rows")
+
+    def _percentile(self, histogram: List[int], q: float) -> Optional[int]:
+        total = sum(histogram)
+        if not total:
+            return None
+        running = 0
+        for i, count in enumerate(histogram):
+            running += count
+            if running >= q * total:
+                return SETTLE_BUCKETS[i] if i < len(SETTLE_BUCKETS) else None
+        return None
+
+    def snapshot(self, open_items: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        today = datetime.utcnow().date()
+        with self._lock:
+            current = dict(self.by_day.get(today) or _empty_day())
+            previous = dict(self.by_day.get(today - timedelta(days=1)) or _empty_day())
+            window = [0] * len(SETTLE_LABELS)
+            for counters in self.by_day.values():
+                window = [a + b for a, b in zip(window, counters["settle_histogram"])]
+
+        def success_rate(counters):
+            decided = counters["matched"] + counters["exceptions"]
+            return round(counters["matched"] / decided * 100, 1) if decided else 0.0
+
+        def avg_hours(counters):
+            return round(counters["settle_seconds"] / counters["settle_count"] / 3600, 2) if counters["settle_count"] else 0.0
+
+        open_items = open_items or {}
+        return {
+            "todays_volume": {"value": current["volume"], **_change(current["volume"], previous["volume"])},
+            "success_rate": {"value": success_rate(current), **_change(success_rate(current), success_rate(previous))},
+            "avg_time_to_settle": {"value": avg_hours(current), "unit": "hours",
+                                   **_change(avg_hours(current), avg_hours(previous))},
+            "discrepancies": {"value": current["exceptions"], **_change(current["exceptions"], previous["exceptions"])},
+            "matched": current["matched"],
+            "unmatched_bank": current["unmatched_bank"],
+            "open_items": {"bank": open_items.get("open_bank", 0), "pdr": open_items.get("open_pdr", 0)},
+            "time_to_settle": {
+                "window_days": self.days,
+                "histogram": dict(zip(SETTLE_LABELS, window)),
+                "p50_seconds_max": self._percentile(window, 0.5),
+                "p90_seconds_max": self._percentile(window, 0.9),
+                "p99_seconds_max": self._percentile(window, 0.99)
+            }
+        }
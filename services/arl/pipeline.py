@@ -0,0 +1,71 @@
+import threading
+from typing import Any, Dict, Iterable, List
+
+from arealis_events import get_event_bus, TOPIC_PDR_DISPATCH, TOPIC_ARL_EXCEPTIONS
+
+event_bus = get_event_bus()
+
+# PDR expectations received from pdr.dispatch, keyed by line_id and by expected UTR
+dispatched_lines: Dict[str, Dict[str, Any]] = {}
+dispatched_by_utr: Dict[str, str] = {}
+_lock = threading.Lock()
+
+
+def handle_dispatch(event: Dict[str, Any]):
+    """Consumer callback for pdr.dispatch"""
+    with _lock:
+        dispatched_lines[event["line_id"]] = event
+        if event.get("expected_utr"):
+            dispatched_by_utr[event["expected_utr"]] = event["line_id"]
+
+
+def settle(results: Iterable[Dict[str, Any]]) -> int:
+    """Drop MATCHED lines from the dispatch index; only lines still awaiting a bank response stay in memory"""
+    settled = 0
+    with _lock:
+        for result in results:
+            if result.get("match_status") != "MATCHED":
+                continue
+            event = dispatched_lines.pop(result.get("line_id"), None)
+            if event is None:
+                continue
+            utr = event.get("expected_utr")
+            if utr and dispatched_by_utr.get(utr) == event["line_id"]:
+                del dispatched_by_utr[utr]
+            settled += 1
+    return settled
+
+
+def get_dispatched_lines() -> List[Dict[str, Any]]:
+    with _lock:
+        return list(dispatched_lines.values())
+
+
+def lookup_dispatched(utrs: Iterable[str], line_ids: Iterable[str]) -> List[Dict[str, Any]]:
+    """PDR lines referenced by a statement chunk, when PDR expectations come from the bus"""
+    with _lock:
+        wanted = {dispatched_by_utr[utr] for utr in utrs if utr in dispatched_by_utr}
+        wanted.update(line_id for line_id in line_ids if line_id in dispatched_lines)
+        return [dispatched_lines[line_id] for line_id in wanted]
+
+
+def publish_exceptions(results: List[Dict[str, Any]]) -> int:
+    """Publish EXCEPTION reconciliation results for RCA, keyed by batch"""
+    published = 0
+    for result in results:
+        if result.get("match_status") != "EXCEPTION":
+            continue
+        event_bus.publish(TOPIC_ARL_EXCEPTIONS, result.get("batch_id") or result["line_id"], {
+            "event": "arl.exception",
+            **result
+        })
+        published += 1
+    return published
+
+
+def start(consumers: int = 1):
+    if not event_bus.enabled:
+        return
+    for _ in range(consumers):
+        event_bus.subscribe(TOPIC_PDR_DISPATCH, "arl", handle_dispatch)
+    print("✅ ARL consuming pdr.dispatch")
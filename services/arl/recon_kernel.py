@@ -0,0 +1,97 @@
+"""
+Columnar reconciliation kernel.
+
+Bank responses and PDR expectations are loaded into NumPy arrays once; the
+UTR join (sort + searchsorted), the ±1% amount tolerance, the currency check
+and the mismatch reason are then computed for the whole run at once. Codes
+map onto the arl_logic.reconcile exception strings via EXCEPTION_LABELS.
+"""
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+AMOUNT_TOLERANCE = 0.01
+
+OK, UTR_MISMATCH, AMOUNT_MISMATCH, CURRENCY_MISMATCH = 0, 1, 2, 3
+EXCEPTION_LABELS = [None, "UTR mismatch", "Amount mismatch", "Currency mismatch"]
+
+
+def _str_column(values: Iterable[Any]) -> np.ndarray:
+    return np.array([value or "" for value in values], dtype=str)
+
+
+def bank_columns(records: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    return {
+        "utr": _str_column((record.get("response") or {}).get("utrNumber") for record in records),
+        "reference": _str_column(record.get("sourceReferenceNumber") for record in records),
+        "amount": np.fromiter((float(record["amount"]) for record in records), dtype=float, count=len(records)),
+        "currency": _str_column(record.get("currency") for record in records)
+    }
+
+
+def pdr_columns(records: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    return {
+        "utr": _str_column(record.get("expected_utr") for record in records),
+        "line_id": _str_column(record["line_id"] for record in records),
+        "amount": np.fromiter((float(record["expected_amount"]) for record in records), dtype=float, count=len(records)),
+        "currency": _str_column(record.get("expected_currency") for record in records)
+    }
+
+
+def join_on(bank_keys: np.ndarray, pdr_keys: np.ndarray) -> np.ndarray:
+    """
+    Index of the first PDR row with the same key for every bank row, -1 when
+    there is none. Empty keys never match.
+    """
+    if not len(pdr_keys) or not len(bank_keys):
+        return np.full(len(bank_keys), -1, dtype=np.int64)
+    unique_keys, first_index = np.unique(pdr_keys, return_index=True)
+    pos = np.minimum(np.searchsorted(unique_keys, bank_keys), len(unique_keys) - 1)
+    found = (unique_keys[pos] == bank_keys) & (bank_keys != "")
+    return np.where(found, first_index[pos], -1)
+
+
+def first_claims(pdr_index: np.ndarray) -> np.ndarray:
+    """Mask of bank rows that are the first (in bank order) to claim their PDR row"""
+    claimed = pdr_index >= 0
+    first = np.zeros(len(pdr_index), dtype=bool)
+    if claimed.any():
+        rows = np.flatnonzero(claimed)
+        _, first_pos = np.unique(pdr_index[rows], return_index=True)
+        first[rows[first_pos]] = True
+    return first
+
+
+def mismatch_codes(bank: Dict[str, np.ndarray], pdr: Dict[str, np.ndarray], bank_rows: np.ndarray,
+                   pdr_rows: np.ndarray, tolerance: float = AMOUNT_TOLERANCE) -> np.ndarray:
+    """arl_logic.reconcile rules for paired rows: UTR, then amount, then currency"""
+    expected = pdr["amount"][pdr_rows]
+    utr_match = (bank["utr"][bank_rows] == pdr["utr"][pdr_rows]) & (bank["utr"][bank_rows] != "")
+    amt_match = np.abs(bank["amount"][bank_rows] - expected) <= tolerance * expected
+    currency_match = bank["currency"][bank_rows] == pdr["currency"][pdr_rows]
+    return np.select(
+        [~utr_match, ~amt_match, ~currency_match],
+        [UTR_MISMATCH, AMOUNT_MISMATCH, CURRENCY_MISMATCH],
+        default=OK
+    ).astype(np.int8)
+
+
+def reconcile_columns(bank: Dict[str, np.ndarray], pdr: Dict[str, np.ndarray],
+                      tolerance: float = AMOUNT_TOLERANCE) -> Dict[str, np.ndarray]:
+    """
+    Exact-UTR pass over whole columns.
+
+    Returns per-bank-row arrays: pdr_index (-1 when the UTR is unknown),
+    duplicate (UTR already claimed by an earlier bank row) and code (the
+    mismatch code for rows that own their PDR line).
+    """
+    pdr_index = join_on(bank["utr"], pdr["utr"])
+    owner = first_claims(pdr_index)
+    code = np.full(len(pdr_index), -1, dtype=np.int8)
+    rows = np.flatnonzero(owner)
+    code[rows] = mismatch_codes(bank, pdr, rows, pdr_index[rows], tolerance)
+    return {
+        "pdr_index": pdr_index,
+        "duplicate": (pdr_index >= 0) & ~owner,
+        "code": code
+    }
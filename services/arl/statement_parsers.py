@@ -0,0 +1,257 @@
+"""
+Incremental bank-statement parsers.
+
+Every parser reads its file as a stream and yields (record, byte_offset)
+pairs, where record has the bank-response shape used by the matching engine
+(transactionId, sourceReferenceNumber, amount, currency, transactionDate,
+beneficiary, response.utrNumber) plus creditDebit, "C" or "D" from the
+statement's debit/credit mark. Line-based formats report the byte offset
+just after the record so an ingest can seek straight back to it; MT940 and
+camt.053 report None and are resumed by skipping already-processed records.
+"""
+import csv
+import json
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+FORMATS = ("ndjson", "csv", "mt940", "camt053")
+
+EXTENSIONS = {".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv", ".sta": "mt940", ".mt940": "mt940",
+              ".940": "mt940", ".xml": "camt053"}
+
+CSV_COLUMNS = {
+    "transactionId": ("transaction id", "txn id", "transaction ref", "bank transaction id"),
+    "utr": ("utr", "utr number", "utr no", "bank reference", "bank ref no"),
+    "reference": ("customer reference", "source reference", "reference", "line id", "cust ref"),
+    "amount": ("amount", "credit amount", "deposit amount", "transaction amount"),
+    "debit": ("debit amount", "withdrawal amount", "withdrawal"),
+    "direction": ("dr/cr", "cr/dr", "debit/credit", "credit/debit", "dr cr", "cr dr", "credit debit indicator"),
+    "currency": ("currency", "ccy"),
+    "date": ("value date", "transaction date", "txn date", "date"),
+    "name": ("beneficiary name", "account holder name", "name"),
+    "account": ("beneficiary account number", "beneficiary account", "account number"),
+    "ifsc": ("ifsc", "ifsc code", "beneficiary ifsc"),
+}
+
+Record = Dict[str, Any]
+
+
+def detect_format(filename: str) -> Optional[str]:
+    for extension, fmt in EXTENSIONS.items():
+        if filename.lower().endswith(extension):
+            return fmt
+    return None
+
+
+def _iso_date(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    value = value.strip()
+    for pattern in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%y%m%d", "%Y%m%d", "%d-%b-%Y"):
+        try:
+            return datetime.strptime(value[:11].strip(), pattern).date().isoformat()
+        except ValueError:
+            continue
+    return value[:10]
+
+
+def _direction(mark: Optional[str]) -> str:
+    """'C' or 'D' from a statement's debit/credit mark (C/D, CR/DR, CRDT/DBIT, credit/debit); credit when absent"""
+    return "D" if mark and mark.strip().upper().startswith("D") else "C"
+
+
+def _record(transaction_id, reference, utr, amount, currency, date, name=None, account=None, ifsc=None,
+            direction="C") -> Record:
+    return {
+        "transactionId": transaction_id,
+        "sourceReferenceNumber": reference,
+        "transactionDate": date,
+        "amount": float(amount),
+        "currency": currency or "INR",
+        "beneficiary": {"accountHolderName": name, "accountNumber": account, "ifscCode": ifsc},
+        "response": {"utrNumber": utr or None},
+        "creditDebit": direction
+    }
+
+
+def _lines(stream: BinaryIO, offset: int) -> Iterator[Tuple[bytes, int]]:
+    """Raw lines with the byte offset just past each one"""
+    stream.seek(offset)
+    while True:
+        line = stream.readline()
+        if not line:
+            return
+        offset += len(line)
+        yield line, offset
+
+
+def parse_ndjson(stream: BinaryIO, offset: int = 0) -> Iterator[Tuple[Record, int]]:
+    for line, end in _lines(stream, offset):
+        line = line.strip()
+        if line:
+            record = json.loads(line)
+            record.setdefault("response", {})
+            record["creditDebit"] = _direction(record.get("creditDebit"))
+            yield record, end
+
+
+def parse_csv(stream: BinaryIO, offset: int = 0) -> Iterator[Tuple[Record, int]]:
+    header_line = stream.readline()
+    header = next(csv.reader([header_line.decode("utf-8-sig")]))
+    normalised = [column.strip().lower().replace("_", " ") for column in header]
+    positions = {}
+    for field, aliases in CSV_COLUMNS.items():
+        for alias in aliases:
+            if alias in normalised:
+                positions[field] = normalised.index(alias)
+                break
+    if "amount" not in positions:
+        raise ValueError("Statement CSV has no amount column")
+
+    for line, end in _lines(stream, max(offset, len(header_line))):
+        text = line.decode("utf-8").strip()
+        if not text:
+            continue
+        values = next(csv.reader([text]))
+
+        def get(field):
+            index = positions.get(field)
+            return values[index].strip() if index is not None and index < len(values) else None
+
+        amount, direction = get("amount"), _direction(get("direction"))
+        if not amount and get("debit"):
+            # Statements with separate withdrawal and deposit columns
+            amount, direction = get("debit"), "D"
+        yield _record(get("transactionId"), get("reference"), get("utr"), (amount or "0").replace(",", ""),
+                      get("currency"), _iso_date(get("date")), get("name"), get("account"), get("ifsc"),
+                      direction), end
+
+
+# :61: value date, optional entry date, debit/credit mark, funds code, amount, type, references
+MT940_61 = re.compile(
+    r"^(?P<date>\d{6})(?P<entry>\d{4})?(?P<mark>R?[CD])(?P<funds>[A-Z])?(?P<amount>\d+(,\d*)?)"
+    r"(?P<type>[A-Z][A-Z0-9]{3})(?P<customer>[^/\n]*)(//(?P<bank>[^\n]*))?"
+)
+MT940_TAG = re.compile(r"^:(?P<tag>\d{2}[A-Z]?):(?P<value>.*)$")
+
+
+def parse_mt940(stream: BinaryIO, offset: int = 0) -> Iterator[Tuple[Record, None]]:
+    currency = None
+    entry: Optional[Dict[str, Any]] = None
+    current_tag = None
+
+    def finish(entry):
+        details = " ".join(entry["details"]).strip()
+        fields = dict(re.findall(r"/(NAME|ACCT|IFSC|UTR)/([^/]*)", details))
+        return _record(
+            entry["bank"] or None, entry["customer"] or None, fields.get("UTR") or entry["bank"] or None,
+            entry["amount"], currency, _iso_date(entry["date"]),
+            fields.get("NAME") or details or None, fields.get("ACCT"), fields.get("IFSC"), entry["direction"]
+        )
+
+    for raw, _ in _lines(stream, offset):
+        line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+        match = MT940_TAG.match(line)
+        if not match:
+            if current_tag == "86" and entry is not None:
+                entry["details"].append(line.strip())
+            continue
+        current_tag, value = match.group("tag"), match.group("value")
+        if current_tag in ("60F", "60M"):
+            currency = value[7:10]
+        elif current_tag == "61":
+            if entry is not None:
+                yield finish(entry), None
+            fields = MT940_61.match(value)
+            if not fields:
+                entry = None
+                continue
+            mark = fields.group("mark")
+            entry = {
+                "date": fields.group("date"),
+                # RC reverses a credit and RD a debit
+                "direction": {"C": "C", "D": "D", "RC": "D", "RD": "C"}[mark],
+                "amount": fields.group("amount").replace(",", "."),
+                "customer": fields.group("customer").strip(),
+                "bank": (fields.group("bank") or "").strip(),
+                "details": []
+            }
+        elif current_tag == "86" and entry is not None:
+            entry["details"].append(value.strip())
+        elif current_tag in ("62F", "62M") and entry is not None:
+            yield finish(entry), None
+            entry = None
+    if entry is not None:
+        yield finish(entry), None
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _find(elem, path: str):
+    """Namespace-agnostic find along a path of local names"""
+    for name in path.split("/"):
+        if elem is None:
+            return None
+        elem = next((child for child in elem if _local(child.tag) == name), None)
+    return elem
+
+
+def _text(elem, *paths: str) -> Optional[str]:
+    for path in paths:
+        found = _find(elem, path)
+        if found is not None and found.text and found.text.strip():
+            return found.text.strip()
+    return None
+
+
+def parse_camt053(stream: BinaryIO, offset: int = 0) -> Iterator[Tuple[Record, None]]:
+    stack = []
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        if _local(elem.tag) != "Ntry":
+            continue
+
+        amount = _find(elem, "Amt")
+        tx = _find(elem, "NtryDtls/TxDtls")
+        direction = _direction(_text(elem, "CdtDbtInd"))
+        if (_text(elem, "RvslInd") or "").lower() == "true":
+            direction = "C" if direction == "D" else "D"
+        yield _record(
+            _text(tx, "Refs/TxId") or _text(elem, "NtryRef", "AcctSvcrRef"),
+            _text(tx, "Refs/EndToEndId", "Refs/InstrId"),
+            _text(tx, "Refs/ClrSysRef", "Refs/AcctSvcrRef", "Refs/UETR") or _text(elem, "AcctSvcrRef"),
+            amount.text if amount is not None else 0,
+            amount.get("Ccy") if amount is not None else None,
+            _text(elem, "ValDt/Dt", "BookgDt/Dt", "BookgDt/DtTm"),
+            _text(tx, "RltdPties/Cdtr/Nm", "RltdPties/Cdtr/Pty/Nm"),
+            _text(tx, "RltdPties/CdtrAcct/Id/Othr/Id", "RltdPties/CdtrAcct/Id/IBAN"),
+            _text(tx, "RltdAgts/CdtrAgt/FinInstnId/ClrSysMmbId/MmbId"),
+            direction
+        ), None
+        # Drop the finished entry so memory stays flat on multi-million entry statements
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+
+PARSERS = {"ndjson": parse_ndjson, "csv": parse_csv, "mt940": parse_mt940, "camt053": parse_camt053}
+
+
+def iter_statement(stream: BinaryIO, fmt: str, byte_offset: Optional[int] = None,
+                   skip_records: int = 0) -> Iterator[Tuple[Record, Optional[int]]]:
+    """Parse a statement, resuming at byte_offset when the format supports it, else after skip_records"""
+    if fmt not in PARSERS:
+        raise ValueError(f"Unsupported statement format: {fmt}")
+    if byte_offset:
+        yield from PARSERS[fmt](stream, byte_offset)
+        return
+    for i, item in enumerate(PARSERS[fmt](stream)):
+        if i >= skip_records:
+            yield item
@@ -0,0 +1,130 @@
+"""
+Chunked, resumable reconciliation of bank statements.
+
+A statement is parsed incrementally and reconciled chunk by chunk: for each
+chunk only the PDR lines it references (by UTR or source reference) are
+loaded, the chunk goes through the matching engine, and the results are
+bulk-inserted into arl_table in the same transaction that advances the
+ingest checkpoint. Memory is bounded by the chunk size, and re-running an
+interrupted ingest continues after the last committed chunk; concurrent
+ingests of the same statement run one after the other. Debit entries
+(money leaving the account, or reversed credits) settle no PDR line; they are
+counted and skipped.
+"""
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from database import fetch_pdr_lines, get_checkpoint, save_chunk, statement_lock
+from matching_engine import bank_utr, reconcile_records
+from statement_parsers import iter_statement
+
+DEFAULT_CHUNK_SIZE = 5000
+
+PdrLookup = Callable[[Iterable[str], Iterable[str]], List[Dict[str, Any]]]
+
+
+def arl_rows(run: Dict[str, Any], chunk: List[Dict[str, Any]], source_id: str, created_at: datetime) -> List[Dict[str, Any]]:
+    """arl_table rows for a reconciled chunk: one per decided PDR line and one per unmatched bank record"""
+    psp_refs = {bank_utr(bank): bank.get("transactionId") for bank in chunk}
+    by_transaction = {bank.get("transactionId"): bank for bank in chunk}
+    rows = []
+    for result in run["results"]:
+        # Lines loaded for this chunk but not settled by it stay open for later statements
+        if result["exception"] == "Missing bank response":
+            continue
+        rows.append({
+            "line_id": result["line_id"],
+            "utr": result["utr"],
+            "psp_reference": psp_refs.get(result["utr"]),
+            "match_status": result["match_status"],
+            "match_reason": result["match_reason"],
+            "journal": result["journal"],
+            "metadata_info": {"batch_id": result["batch_id"], "exception": result["exception"], "source_id": source_id},
+            "created_at": created_at
+        })
+    for entry in run["unmatched_bank"]:
+        rows.append({
+            "line_id": None,
+            "utr": entry["utr"],
+            "psp_reference": entry["transaction_id"],
+            "match_status": "UNMATCHED_BANK",
+            "match_reason": entry["reason"],
+            "journal": None,
+            # The full record lets the open-item index re-match it later
+            "metadata_info": {**entry, "source_id": source_id, "record": by_transaction.get(entry["transaction_id"])},
+            "created_at": created_at
+        })
+    return rows
+
+
+def ingest_statement(path: str, fmt: str, source_id: str, filename: Optional[str] = None,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE, pdr_lookup: PdrLookup = fetch_pdr_lines,
+                     on_chunk: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> Dict[str, Any]:
+    """
+    Reconcile a statement file in chunks, resuming from its checkpoint.
+
+    source_id identifies the statement (the upload's sha256), so a repeated
+    upload of the same file resumes instead of double-posting. on_chunk
+    receives each chunk's arl_table rows after they are committed.
+    """
+    # A second upload of the same file waits here, then resumes from (or finds DONE) the first one's checkpoint
+    with statement_lock(source_id):
+        return _ingest(path, fmt, source_id, filename, chunk_size, pdr_lookup, on_chunk)
+
+
+def _ingest(path: str, fmt: str, source_id: str, filename: Optional[str], chunk_size: int, pdr_lookup: PdrLookup,
+            on_chunk: Optional[Callable[[List[Dict[str, Any]]], None]]) -> Dict[str, Any]:
+    checkpoint = get_checkpoint(source_id) or {}
+    if checkpoint.get("status") == "DONE":
+        return {**(checkpoint.get("summary") or {}), "resumed": False, "already_done": True}
+
+    summary = {"records": 0, "matched": 0, "exceptions": 0, "unmatched_bank": 0, "debits_skipped": 0, "chunks": 0}
+    summary.update({key: value for key, value in (checkpoint.get("summary") or {}).items() if key in summary})
+    records_done = checkpoint.get("records_done") or 0
+    byte_offset = checkpoint.get("byte_offset")
+    started = time.perf_counter()
+
+    def flush(chunk, offset):
+        nonlocal records_done, byte_offset
+        records_done += len(chunk)
+        byte_offset = offset
+        summary["records"] += len(chunk)
+        summary["chunks"] += 1
+        credits = [bank for bank in chunk if bank.get("creditDebit", "C") != "D"]
+        summary["debits_skipped"] += len(chunk) - len(credits)
+
+        utrs = {bank_utr(bank) for bank in credits} - {None}
+        refs = {bank.get("sourceReferenceNumber") for bank in credits} - {None}
+        run = reconcile_records(credits, pdr_lookup(utrs, refs) if credits else [])
+        rows = arl_rows(run, credits, source_id, datetime.utcnow())
+
+        summary["unmatched_bank"] += len(run["unmatched_bank"])
+        for row in rows:
+            if row["match_status"] == "MATCHED":
+                summary["matched"] += 1
+            elif row["match_status"] == "EXCEPTION":
+                summary["exceptions"] += 1
+        save_chunk(rows, {
+            "source_id": source_id, "filename": filename, "format": fmt, "records_done": records_done,
+            "byte_offset": byte_offset, "status": "RUNNING", "summary": summary
+        })
+        if on_chunk:
+            on_chunk(rows)
+
+    with open(path, "rb") as stream:
+        chunk, offset = [], None
+        for record, offset in iter_statement(stream, fmt, byte_offset, records_done):
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                flush(chunk, offset)
+                chunk = []
+        if chunk:
+            flush(chunk, offset)
+
+    summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    save_chunk([], {
+        "source_id": source_id, "filename": filename, "format": fmt, "records_done": records_done,
+        "byte_offset": byte_offset, "status": "DONE", "summary": summary
+    })
+    return {**summary, "resumed": bool(checkpoint), "already_done": False}
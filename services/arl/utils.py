@@ -4,6 +4,9 @@ def load_json(file_path: str):
     with open(file_path, "r") as f:
         return json.load(f)
 
-def save_json(file_path: str, data):
+def save_json(file_path: str, data, compact: bool = False):
     with open(file_path, "w") as f:
-        json.dump(data, f, indent=4, default=str)
+        if compact:
+            json.dump(data, f, separators=(",", ":"), default=str)
+        else:
+            json.dump(data, f, indent=4, default=str)
@@ -0,0 +1,143 @@
+# services/crrak/batch_summary.py
+"""
+Bounded batch context for batch-level explanations.
+
+Instead of inlining every record, a batch is reduced to counts by decision,
+status, rail, category and match status, the most frequent failure reasons,
+amount percentiles and a handful of representative lines. The output size
+depends only on the TOP_N and SAMPLE_SIZE limits, not on the batch size.
+"""
+import json
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+TOP_N = 5
+SAMPLE_SIZE = 8
+MAX_TEXT = 160
+
+FAILED_STATUSES = {"FAILED", "EXCEPTION", "HOLD", "FAIL", "REJECTED", "UNROUTABLE"}
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value)
+    return value if len(value) <= MAX_TEXT else value[:MAX_TEXT - 1] + "…"
+
+
+def _top(values, n: int = TOP_N) -> Dict[str, int]:
+    counts = Counter(_text(value) for value in values if value)
+    top = dict(counts.most_common(n))
+    others = sum(counts.values()) - sum(top.values())
+    if others:
+        top["(other)"] = others
+    return top
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of a sorted list"""
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))
+    return round(ordered[index], 2)
+
+
+def amount_stats(amounts: List[float]) -> Dict[str, Any]:
+    if not amounts:
+        return {"count": 0}
+    ordered = sorted(amounts)
+    return {
+        "count": len(ordered),
+        "total": round(sum(ordered), 2),
+        "min": round(ordered[0], 2),
+        "p50": _percentile(ordered, 0.5),
+        "p90": _percentile(ordered, 0.9),
+        "p99": _percentile(ordered, 0.99),
+        "max": round(ordered[-1], 2)
+    }
+
+
+def _is_failed(line: Dict[str, Any]) -> bool:
+    acc, pdr, recon = line.get("acc"), line.get("pdr"), line.get("recon")
+    return bool(
+        line.get("rca")
+        or (acc and str(acc.get("decision", "")).upper() in FAILED_STATUSES)
+        or (pdr and str(pdr.get("status", "")).upper() in FAILED_STATUSES)
+        or (recon and str(recon.get("match_status", "")).upper() in FAILED_STATUSES)
+    )
+
+
+def _sample_row(line_id: str, line: Dict[str, Any]) -> Dict[str, Any]:
+    acc, pdr, rca, recon = (line.get(source) or {} for source in ("acc", "pdr", "rca", "recon"))
+    row = {
+        "line_id": line_id,
+        "decision": acc.get("decision"),
+        "rail": pdr.get("rail_selected"),
+        "status": pdr.get("status"),
+        "amount": pdr.get("expected_amount"),
+        "match_status": recon.get("match_status"),
+        "root_cause": _text(rca.get("root_cause")),
+        "category": rca.get("failure_category")
+    }
+    return {key: value for key, value in row.items() if value is not None}
+
+
+def sample_lines(lines: Dict[str, Dict[str, Any]], size: int = SAMPLE_SIZE) -> List[Dict[str, Any]]:
+    """One line per distinct failure signature first, then successes, up to size"""
+    seen, failed, ok = set(), [], []
+    for line_id in sorted(lines):
+        line = lines[line_id]
+        if _is_failed(line):
+            signature = (
+                (line.get("rca") or {}).get("failure_category"),
+                (line.get("acc") or {}).get("decision"),
+                (line.get("pdr") or {}).get("status"),
+                (line.get("recon") or {}).get("match_status")
+            )
+            if signature not in seen:
+                seen.add(signature)
+                failed.append(line_id)
+        elif len(ok) < size:
+            ok.append(line_id)
+    chosen = failed[:size] + ok[:max(0, size - len(failed))]
+    return [_sample_row(line_id, lines[line_id]) for line_id in chosen]
+
+
+def summarize(lines: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate {line_id: {source: record}} into a fixed-size batch summary"""
+    acc = [line["acc"] for line in lines.values() if line.get("acc")]
+    pdr = [line["pdr"] for line in lines.values() if line.get("pdr")]
+    rca = [line["rca"] for line in lines.values() if line.get("rca")]
+    recon = [line["recon"] for line in lines.values() if line.get("recon")]
+
+    amounts_by_currency: Dict[str, List[float]] = {}
+    for record in pdr:
+        if record.get("expected_amount") is not None:
+            amounts_by_currency.setdefault(record.get("expected_currency") or "INR", []).append(float(record["expected_amount"]))
+
+    failed = sum(1 for line in lines.values() if _is_failed(line))
+    return {
+        "lines": len(lines),
+        "failed_lines": failed,
+        "success_rate_percent": round((len(lines) - failed) / len(lines) * 100, 1) if lines else None,
+        "records": {"acc": len(acc), "pdr": len(pdr), "rca": len(rca), "recon": len(recon)},
+        "acc": {"by_decision": _top(r.get("decision") for r in acc), "top_reasons": _top(r.get("reason") for r in acc)},
+        "pdr": {
+            "by_status": _top(r.get("status") for r in pdr),
+            "by_rail": _top(r.get("rail_selected") for r in pdr),
+            "amounts": {currency: amount_stats(values) for currency, values in sorted(amounts_by_currency.items())[:TOP_N]}
+        },
+        "rca": {
+            "by_category": _top(r.get("failure_category") for r in rca),
+            "top_root_causes": _top(r.get("root_cause") for r in rca),
+            "top_actions": _top(r.get("recommended_action") for r in rca)
+        },
+        "recon": {
+            "by_match_status": _top(r.get("match_status") for r in recon),
+            "top_match_reasons": _top(r.get("match_reason") for r in recon)
+        },
+        "sample_lines": sample_lines(lines)
+    }
+
+
+def render(summary: Dict[str, Any]) -> str:
+    """Compact text for the prompt"""
+    return json.dumps(summary, separators=(",", ":"), default=str, ensure_ascii=False)
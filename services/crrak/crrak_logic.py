@@ -1,17 +1,26 @@
 # services/crrak/crrak_logic.py
+import asyncio
 import json
 import os
+from contextlib import aclosing
 from pathlib import Path
 from models import ACCDecision, Neo4jGraph, PDROutput, RCAResult, ReconciliationResult, RedisRecord
-from typing import List, Dict, Optional
-from openai import OpenAI
+from batch_summary import SAMPLE_SIZE, TOP_N, render as render_summary
+from data_access import DataAccess
+from line_store import LineStore
+from arealis_llm import ResponseCache, cache_key, get_llm_client
+from typing import AsyncIterator, List, Dict, Optional
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Async LLM client (LLM_BACKEND picks OpenAI or the local stub; OPENAI_BASE_URL e.g. scripts/mock_llm_server.py)
+llm = get_llm_client()
+MODEL = "gpt-4"
+
+# Bump whenever the prompts below change so cached answers to the old prompts are not reused
+PROMPT_VERSION = "crrak-2"
 
 # Get the directory where this script is located
 BASE_DIR = Path(__file__).resolve().parent
@@ -30,84 +39,54 @@ def load_json(filename: str):
         print(f"Error parsing {filename}: {e}")
         return [] if filename.endswith('.json') else {}
 
-# Load all datasets
-try:
-    acc_data = [ACCDecision(**x) for x in load_json("acc_decision.json")]
-except Exception as e:
-    print(f"Error loading ACC data: {e}")
-    acc_data = []
-
-try:
-    neo4j_data = load_json("neo4j_graph.json")
-except Exception as e:
-    print(f"Error loading Neo4j data: {e}")
-    neo4j_data = []
-
-try:
-    pdr_data = [PDROutput(**x) for x in load_json("pdr_outputs.json")]
-except Exception as e:
-    print(f"Error loading PDR data: {e}")
-    pdr_data = []
-
-try:
-    rca_json = load_json("rca_reports.json")
-    rca_data = [RCAResult(**x) for x in rca_json.get("rca_results", [])]
-except Exception as e:
-    print(f"Error loading RCA data: {e}")
-    rca_data = []
-
-try:
-    recon_data = [ReconciliationResult(**x) for x in load_json("reconciliation_results.json")]
-except Exception as e:
-    print(f"Error loading Reconciliation data: {e}")
-    recon_data = []
-
-try:
-    redis_data = [RedisRecord(**x) for x in load_json("redis.json")]
-except Exception as e:
-    print(f"Error loading Redis data: {e}")
-    redis_data = []
+def load_source(store: LineStore, source: str, loader):
+    """Index one fixture into the store as plain dicts, logging instead of failing on bad data"""
+    try:
+        store.add_many(source, (x.dict() if hasattr(x, "dict") else x for x in loader()))
+    except Exception as e:
+        print(f"Error loading {source.upper()} data: {e}")
+
+def load_fixtures(store: LineStore):
+    """JSON fixtures used when no database is configured"""
+    load_source(store, "acc", lambda: [ACCDecision(**x) for x in load_json("acc_decision.json")])
+    load_source(store, "neo4j", lambda: load_json("neo4j_graph.json"))
+    load_source(store, "pdr", lambda: [PDROutput(**x) for x in load_json("pdr_outputs.json")])
+    load_source(store, "rca", lambda: [RCAResult(**x) for x in load_json("rca_reports.json").get("rca_results", [])])
+    load_source(store, "recon", lambda: [ReconciliationResult(**x) for x in load_json("reconciliation_results.json")])
+    load_source(store, "redis", lambda: [RedisRecord(**x) for x in load_json("redis.json")])
+
+# Live tables behind a bounded LRU, or the fixtures when DATABASE_URL is unset
+data_access = DataAccess(
+    load_fixtures,
+    cache_lines=int(os.getenv("CRRAK_CACHE_LINES", "10000")),
+    poll_seconds=float(os.getenv("CRRAK_POLL_SECONDS", "5"))
+)
+
+# Explanations keyed on (query, line/batch data, prompt version); dropped when the poller sees their data change
+llm_cache = ResponseCache()
+data_access.on_change = lambda lines, batches: llm_cache.invalidate(
+    [*lines, *(f"batch:{batch_id}" for batch_id in batches), "batch:"]
+)
 
 # Helper to find line info
 def find_line_info(line_id: str) -> Dict:
     """Find all information related to a specific line ID"""
-    acc = next((x for x in acc_data if x.line_id == line_id), None)
-    pdr = next((x for x in pdr_data if x.line_id == line_id), None)
-    rca = next((x for x in rca_data if x.line_id == line_id), None)
-    recon = next((x for x in recon_data if x.line_id == line_id), None)
-    redis = next((x for x in redis_data if x.line_id == line_id), None)
-    neo4j = next((x for x in neo4j_data if x.get("line_id") == line_id), None)
-    
-    return {
-        "acc": acc,
-        "pdr": pdr,
-        "rca": rca,
-        "recon": recon,
-        "redis": redis,
-        "neo4j": neo4j
-    }
+    return data_access.get(line_id)
 
-# Generate explanation via OpenAI
-def generate_explanation(query: str, line_id: Optional[str] = None) -> str:
+def build_request(query: str, line_id: Optional[str] = None, batch_id: Optional[str] = None):
     """
-    Generate a human-readable explanation using OpenAI based on the query.
-    
-    Args:
-        query: The user's query
-        line_id: Optional line ID to focus the explanation on
-        
-    Returns:
-        str: AI-generated explanation
+    Messages for an explanation, with its cache key and invalidation tags.
+    Raises LookupError when the line or batch has no data.
     """
-    try:
-        if line_id:
-            data = find_line_info(line_id)
-            
-            # Check if we found any data for this line
-            if not any(data.values()):
-                return f"No data found for line {line_id}. Please verify the line ID and try again."
-            
-            prompt = f"""
+    if line_id:
+        data = find_line_info(line_id)
+        
+        # Check if we found any data for this line
+        if not any(data.values()):
+            raise LookupError(f"No data found for line {line_id}. Please verify the line ID and try again.")
+        context, tags = data, [line_id]
+        
+        prompt = f"""
 AUDIT REQUEST: Line-Level Analysis for {line_id}
 
 USER QUERY: {query}
@@ -115,19 +94,19 @@ USER QUERY: {query}
 === DATA SOURCES ===
 
 [ACC - Anti-Compliance Check Decision]
-{data['acc'].dict() if data['acc'] else 'No ACC data available'}
+{data['acc'] if data['acc'] else 'No ACC data available'}
 
 [PDR - Payment Decision & Rail Selection]
-{data['pdr'].dict() if data['pdr'] else 'No PDR data available'}
+{data['pdr'] if data['pdr'] else 'No PDR data available'}
 
 [RCA - Root Cause Analysis Report]
-{data['rca'].dict() if data['rca'] else 'No RCA data available'}
+{data['rca'] if data['rca'] else 'No RCA data available'}
 
 [ARL - Automated Reconciliation & Ledger]
-{data['recon'].dict() if data['recon'] else 'No reconciliation data available'}
+{data['recon'] if data['recon'] else 'No reconciliation data available'}
 
 [Redis - Real-Time Execution Timeline & System Health]
-{data['redis'].dict() if data['redis'] else 'No Redis data available'}
+{data['redis'] if data['redis'] else 'No Redis data available'}
 
 [Neo4j - Transaction Execution Graph]
 {data['neo4j'] if data['neo4j'] else 'No Neo4j graph available'}
@@ -137,33 +116,21 @@ Analyze the above data and provide a comprehensive audit report following the st
 Focus on answering the user's specific query while maintaining audit rigor and completeness.
 Correlate data across all systems to provide a complete picture of the transaction lifecycle.
 """
-        else:
-            # Batch-level or general query
-            prompt = f"""
-AUDIT REQUEST: Batch-Level or General Analysis
+    else:
+        # Batch-level or general query
+        if batch_id and not data_access.batch_lines(batch_id):
+            raise LookupError(f"No data found for batch {batch_id}. Please verify the batch ID and try again.")
+        summary = data_access.batch_summary(batch_id)
+        context, tags = summary, [f"batch:{batch_id or ''}"]
+        prompt = f"""
+AUDIT REQUEST: Batch-Level or General Analysis{f" for {batch_id}" if batch_id else ""}
 
 USER QUERY: {query}
 
-=== AVAILABLE DATA SUMMARY ===
-- ACC Decisions: {len(acc_data)} records
-- PDR Outputs: {len(pdr_data)} records  
-- RCA Reports: {len(rca_data)} records
-- Reconciliation Results: {len(recon_data)} records
-- Redis Records: {len(redis_data)} records
-- Neo4j Graphs: {len(neo4j_data)} records
-
-=== KEY METRICS ===
-ACC Decisions:
-{[{'line_id': x.line_id, 'decision': x.decision, 'reason': x.reason} for x in acc_data]}
-
-PDR Status:
-{[{'line_id': x.line_id, 'rail': x.rail_selected, 'status': x.status, 'amount': x.expected_amount} for x in pdr_data]}
-
-RCA Summary:
-{[{'line_id': x.line_id, 'root_cause': x.root_cause, 'category': x.failure_category, 'action': x.recommended_action} for x in rca_data]}
-
-Reconciliation Summary:
-{[{'line_id': x.line_id, 'match_status': x.match_status, 'match_reason': x.match_reason} for x in recon_data]}
+=== BATCH SUMMARY ===
+Counts, top-{TOP_N} breakdowns ("(other)" folds the rest), amount percentiles and up to
+{SAMPLE_SIZE} representative lines (distinct failure patterns first):
+{render_summary(summary)}
 
 === AUDIT INSTRUCTIONS ===
 Analyze the batch data and provide a comprehensive audit report. Identify patterns, trends, and systemic issues.
@@ -175,9 +142,9 @@ Present findings in the structured format with particular attention to:
 - Financial impact
 - Recommendations for improvement
 """
-        
-        # Professional audit system prompt
-        system_prompt = """You are a Senior Financial Auditor and Root Cause Analysis Expert specializing in payment systems and transaction reconciliation.
+    
+    # Professional audit system prompt
+    system_prompt = """You are a Senior Financial Auditor and Root Cause Analysis Expert specializing in payment systems and transaction reconciliation.
 
 Your responsibilities:
 1. Provide thorough, evidence-based audit explanations
@@ -244,17 +211,56 @@ Provide specific, actionable recommendations:
 - Circuit breaker TRIPPED = System protection activated
 - High CPU (>80%) = System under stress"""
 
-        # Call OpenAI API with new client interface
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0
-        )
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+    key = cache_key("explain", query, [line_id, batch_id, context], PROMPT_VERSION, MODEL)
+    return messages, key, tags
+
+# Generate explanation via OpenAI
+async def generate_explanation(query: str, line_id: Optional[str] = None, batch_id: Optional[str] = None) -> str:
+    """
+    Generate a human-readable explanation using OpenAI based on the query.
+    
+    Args:
+        query: The user's query
+        line_id: Optional line ID to focus the explanation on
+        batch_id: Optional batch ID to limit a batch-level explanation to
         
-        return response.choices[0].message.content.strip()
+    Returns:
+        str: AI-generated explanation
+    """
+    try:
+        try:
+            # Line data may come from the database, which is read with a sync driver
+            messages, key, tags = await asyncio.to_thread(build_request, query, line_id, batch_id)
+        except LookupError as e:
+            return str(e)
+
+        # Identical questions about unchanged data share one answer, and one upstream call when concurrent
+        return await llm_cache.aget_or_compute(key, lambda: llm.complete(messages, MODEL), tags)
         
     except Exception as e:
-        return f"Error generating explanation: {str(e)}. Please check your OpenAI API key and try again."
\ No newline at end of file
+        return f"Error generating explanation: {str(e)}. Please check your OpenAI API key and try again."
+
+async def stream_explanation(query: str, line_id: Optional[str] = None, batch_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Same explanation as generate_explanation, yielded as the model produces it.
+    A cached answer comes back as a single chunk; a streamed one is cached once complete.
+    """
+    try:
+        messages, key, tags = await asyncio.to_thread(build_request, query, line_id, batch_id)
+    except LookupError as e:
+        yield str(e)
+        return
+    cached = llm_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    async with aclosing(llm.stream(messages, MODEL)) as chunks:
+        async for text in chunks:
+            parts.append(text)
+            yield text
+    llm_cache.put(key, "".join(parts).strip(), tags)
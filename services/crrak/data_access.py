@@ -0,0 +1,194 @@
+# services/crrak/data_access.py
+"""
+On-demand access to the per-line data CRRAK explains.
+
+With DATABASE_URL set, lines are read from acc_agent, pdr_table, arl_table,
+rca_table and redis_table when first asked for and kept in a bounded LRU,
+so startup does no loading and memory follows the working set. A poller
+follows each table's created_at watermark and evicts the lines that changed
+and the batches they belong to, so explanations see new data without a
+restart. Without a database the JSON fixtures are indexed into a LineStore
+on first use.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from batch_summary import summarize
+from database import batch_line_ids, batches_of, changed_since, engine, fetch_lines, max_created_at, recent_line_ids
+from line_store import SOURCES, LineStore
+
+DEFAULT_CACHE_LINES = 10000
+DEFAULT_CACHE_BATCHES = 256
+DEFAULT_POLL_SECONDS = 5.0
+RECENT_LINES = 100
+
+
+class LRU:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries: "OrderedDict[str, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def evict(self, keys: Iterable[str]) -> int:
+        return sum(1 for key in keys if self.entries.pop(key, None) is not None)
+
+
+class DataAccess:
+    def __init__(self, fixtures: Callable[[LineStore], None], cache_lines: int = DEFAULT_CACHE_LINES,
+                 cache_batches: int = DEFAULT_CACHE_BATCHES, poll_seconds: float = DEFAULT_POLL_SECONDS):
+        self.fixtures = fixtures
+        self.lines = LRU(cache_lines)
+        self.batches = LRU(cache_batches)
+        self.summaries = LRU(cache_batches)
+        self.poll_seconds = poll_seconds
+        self.watermarks: Dict[str, Any] = {}
+        self.invalidations = 0
+        # Called with (lines, batches) after a poll evicts them, for caches derived from line data
+        self.on_change: Optional[Callable[[set, set], Any]] = None
+        self._generation = 0
+        self._store: Optional[LineStore] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._poller: Optional[threading.Thread] = None
+
+    @property
+    def store(self) -> LineStore:
+        """Fixture-backed store, built on first use when there is no database"""
+        with self._lock:
+            if self._store is None:
+                self._store = LineStore()
+                self.fixtures(self._store)
+            return self._store
+
+    def get(self, line_id: str) -> Dict[str, Any]:
+        """Every source's record for a line, None where a source has none"""
+        return self.get_many([line_id])[line_id]
+
+    def get_many(self, line_ids: Iterable[str], cache: bool = True) -> Dict[str, Dict[str, Any]]:
+        """Records of many lines; cache=False reads misses without letting a batch scan flush the LRU"""
+        line_ids = list(dict.fromkeys(line_ids))
+        if engine is None:
+            return {line_id: self.store.get(line_id) for line_id in line_ids}
+        found, missing = {}, []
+        with self._lock:
+            generation = self._generation
+            for line_id in line_ids:
+                cached = self.lines.get(line_id)
+                if cached is None:
+                    missing.append(line_id)
+                else:
+                    found[line_id] = cached
+        if missing:
+            fetched = {
+                line_id: {source: records.get(source) for source in SOURCES}
+                for line_id, records in fetch_lines(missing).items()
+            }
+            with self._lock:
+                # A poll in between may have evicted what was just read; cache it next time instead
+                if cache and generation == self._generation:
+                    for line_id, info in fetched.items():
+                        self.lines.put(line_id, info)
+            found.update(fetched)
+        return {line_id: found[line_id] for line_id in line_ids}
+
+    def batch_lines(self, batch_id: str) -> List[str]:
+        if engine is None:
+            return self.store.batch_lines(batch_id)
+        with self._lock:
+            generation = self._generation
+            cached = self.batches.get(batch_id)
+        if cached is None:
+            cached = batch_line_ids(batch_id)
+            with self._lock:
+                # As in get_many: a poll in between may have evicted this batch
+                if generation == self._generation:
+                    self.batches.put(batch_id, cached)
+        return cached
+
+    def records(self, source: str, batch_id: Optional[str] = None) -> List[Any]:
+        """One source's records for a batch, or for the most recent lines when no batch is given"""
+        if engine is None:
+            return self.store.records(source, batch_id)
+        line_ids = self.batch_lines(batch_id) if batch_id else recent_line_ids(RECENT_LINES)
+        return [info[source] for info in self.get_many(line_ids).values() if info[source] is not None]
+
+    def batch_summary(self, batch_id: Optional[str] = None) -> Dict[str, Any]:
+        """Bounded summary of a batch, or of the most recent lines when no batch is given"""
+        key = batch_id or ""
+        if engine is None:
+            line_ids = self.store.batch_lines(batch_id) if batch_id else self.store.line_ids()
+            return summarize({line_id: self.store.get(line_id) for line_id in line_ids})
+        with self._lock:
+            generation = self._generation
+            cached = self.summaries.get(key) if batch_id else None
+        if cached is None:
+            line_ids = self.batch_lines(batch_id) if batch_id else recent_line_ids(RECENT_LINES)
+            cached = summarize(self.get_many(line_ids, cache=False))
+            if batch_id:
+                with self._lock:
+                    if generation == self._generation:
+                        self.summaries.put(key, cached)
+        return cached
+
+    def poll(self) -> int:
+        """Evict lines and batches written since the last poll; returns how many lines changed"""
+        lines, batches, self.watermarks = changed_since(self.watermarks)
+        # acc, recon and redis rows carry no batch_id; their lines' batches are stale too
+        batches |= batches_of(lines)
+        with self._lock:
+            if lines or batches:
+                self._generation += 1
+            self.lines.evict(lines)
+            self.batches.evict(batches)
+            self.summaries.evict(batches)
+        self.invalidations += len(lines)
+        if self.on_change is not None and (lines or batches):
+            self.on_change(lines, batches)
+        return len(lines)
+
+    def _run_poller(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"⚠️  CRRAK cache poll failed: {e}")
+
+    def start(self):
+        """Start following the tables' created_at watermarks (database mode only)"""
+        if engine is None or self._poller is not None:
+            return
+        self.watermarks = max_created_at()
+        self._poller = threading.Thread(target=self._run_poller, daemon=True, name="crrak-cache-poller")
+        self._poller.start()
+        print(f"✅ CRRAK reading live tables, cache invalidation every {self.poll_seconds}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": "database" if engine is not None else "fixtures",
+                "cached_lines": len(self.lines.entries),
+                "cached_batches": len(self.batches.entries),
+                "hits": self.lines.hits,
+                "misses": self.lines.misses,
+                "invalidations": self.invalidations
+            }
@@ -0,0 +1,177 @@
+import os
+from decimal import Decimal
+from sqlalchemy import create_engine, Column, Integer, String, Text, Numeric, DateTime, JSON, select, tuple_
+from sqlalchemy.ext.declarative import declarative_base
+
+# Same PostgreSQL database as the other agents; CRRAK falls back to its JSON fixtures if unset
+POSTGRES_URL = os.getenv("DATABASE_URL")
+
+engine = create_engine(POSTGRES_URL, pool_pre_ping=True) if POSTGRES_URL else None
+Base = declarative_base()
+
+# Read-only mirrors of the tables owned by ACC, PDR, ARL and RCA
+class AccAgent(Base):
+    __tablename__ = "acc_agent"
+
+    id = Column(Integer, primary_key=True)
+    line_id = Column(String(100))
+    beneficiary = Column(String(255))
+    ifsc = Column(String(20))
+    amount = Column(Numeric)
+    policy_version = Column(String(50))
+    status = Column(String(20))
+    decision_reason = Column(Text)
+    evidence_ref = Column(Text)
+    created_at = Column(DateTime)
+
+class PdrTable(Base):
+    __tablename__ = "pdr_table"
+
+    id = Column(Integer, primary_key=True)
+    line_id = Column(String(50), unique=True)
+    batch_id = Column(String(100))
+    rail_selected = Column(String(100))
+    fallbacks = Column(JSON)
+    expected_amount = Column(Numeric)
+    expected_currency = Column(String(10))
+    expected_utr = Column(String(100))
+    status = Column(String(50))
+    created_at = Column(DateTime)
+
+class ArlTable(Base):
+    __tablename__ = "arl_table"
+
+    id = Column(Integer, primary_key=True)
+    recon_id = Column(Integer)
+    line_id = Column(String(50))
+    utr = Column(String(100))
+    psp_reference = Column(String(100))
+    match_status = Column(String(50))
+    match_reason = Column(String(100))
+    journal = Column(JSON)
+    metadata_info = Column(JSON)
+    created_at = Column(DateTime)
+
+class RcaTable(Base):
+    __tablename__ = "rca_table"
+
+    id = Column(Integer, primary_key=True)
+    rca_id = Column(Integer)
+    line_id = Column(String(50))
+    batch_id = Column(String(100))
+    root_cause = Column(Text)
+    failure_category = Column(String(100))
+    recommended_action = Column(Text)
+    evidence_refs = Column(JSON)
+    created_at = Column(DateTime)
+
+class RedisTable(Base):
+    __tablename__ = "redis_table"
+
+    id = Column(Integer, primary_key=True)
+    line_id = Column(String(50), unique=True)
+    execution_timeline = Column(JSON)
+    system_health = Column(JSON)
+    ttl = Column(Integer)
+    created_at = Column(DateTime)
+
+SOURCE_TABLES = {
+    "acc": AccAgent.__table__,
+    "pdr": PdrTable.__table__,
+    "recon": ArlTable.__table__,
+    "rca": RcaTable.__table__,
+    "redis": RedisTable.__table__,
+}
+
+def _plain(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+def _record(source, row):
+    record = {key: _plain(value) for key, value in row._mapping.items() if key != "id"}
+    if source == "acc":
+        # Same keys as the acc_decision.json fixture
+        record["decision"] = record.pop("status")
+        record["reason"] = record.pop("decision_reason")
+    elif source == "recon":
+        record["metadata"] = record.pop("metadata_info")
+    return record
+
+def fetch_lines(line_ids):
+    """{line_id: {source: latest record}} for the given lines, one query per table"""
+    line_ids = list(line_ids)
+    found = {line_id: {} for line_id in line_ids}
+    if engine is None or not line_ids:
+        return found
+    with engine.connect() as conn:
+        for source, table in SOURCE_TABLES.items():
+            query = table.select().where(table.c.line_id.in_(line_ids)).order_by(table.c.id)
+            for row in conn.execute(query):
+                # Ascending id, so the newest row for a line wins
+                found[row.line_id][source] = _record(source, row)
+    return found
+
+def batch_line_ids(batch_id):
+    if engine is None:
+        return []
+    pdr, rca = PdrTable.__table__, RcaTable.__table__
+    with engine.connect() as conn:
+        query = select(pdr.c.line_id).where(pdr.c.batch_id == batch_id).union(
+            select(rca.c.line_id).where(rca.c.batch_id == batch_id)
+        )
+        return sorted(line_id for (line_id,) in conn.execute(query) if line_id)
+
+def batches_of(line_ids):
+    """Batch ids the given lines belong to, from pdr_table and rca_table"""
+    line_ids = list(line_ids)
+    if engine is None or not line_ids:
+        return set()
+    pdr, rca = PdrTable.__table__, RcaTable.__table__
+    with engine.connect() as conn:
+        query = select(pdr.c.batch_id).where(pdr.c.line_id.in_(line_ids)).union(
+            select(rca.c.batch_id).where(rca.c.line_id.in_(line_ids))
+        )
+        return {batch_id for (batch_id,) in conn.execute(query) if batch_id}
+
+def recent_line_ids(limit):
+    if engine is None:
+        return []
+    pdr = PdrTable.__table__
+    with engine.connect() as conn:
+        query = select(pdr.c.line_id).order_by(pdr.c.created_at.desc().nullslast()).limit(limit)
+        return [line_id for (line_id,) in conn.execute(query)]
+
+def max_created_at():
+    """Current (created_at, id) watermark of every source table"""
+    if engine is None:
+        return {}
+    with engine.connect() as conn:
+        watermarks = {}
+        for source, table in SOURCE_TABLES.items():
+            query = (
+                select(table.c.created_at, table.c.id).where(table.c.created_at.is_not(None))
+                .order_by(table.c.created_at.desc(), table.c.id.desc()).limit(1)
+            )
+            row = conn.execute(query).first()
+            watermarks[source] = tuple(row) if row else None
+        return watermarks
+
+def changed_since(watermarks):
+    """Lines and batches written after the watermarks, and the advanced watermarks"""
+    lines, batches, advanced = set(), set(), dict(watermarks)
+    if engine is None:
+        return lines, batches, advanced
+    with engine.connect() as conn:
+        for source, table in SOURCE_TABLES.items():
+            columns = [table.c.id, table.c.line_id, table.c.created_at]
+            if "batch_id" in table.c:
+                columns.append(table.c.batch_id)
+            query = select(*columns).where(table.c.created_at.is_not(None)).order_by(table.c.created_at, table.c.id)
+            if watermarks.get(source) is not None:
+                # Strictly after (created_at, id), so rows at the watermark's timestamp are neither missed nor re-read
+                query = query.where(tuple_(table.c.created_at, table.c.id) > tuple(watermarks[source]))
+            for row in conn.execute(query):
+                lines.add(row.line_id)
+                if "batch_id" in table.c and row.batch_id:
+                    batches.add(row.batch_id)
+                advanced[source] = (row.created_at, row.id)
+    return lines, batches, advanced
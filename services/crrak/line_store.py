@@ -0,0 +1,76 @@
+# services/crrak/line_store.py
+"""
+Line-indexed store of everything CRRAK knows about a payment line.
+
+Each source (ACC, PDR, RCA, ARL reconciliation, Redis, Neo4j) is a dict keyed
+by line_id, and a batch index maps batch_id to its line_ids, so a line
+lookup is O(1) and a batch is sliced without scanning the other batches.
+Records can be added at any time; a newer record for a line replaces the
+older one.
+"""
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+SOURCES = ("acc", "pdr", "rca", "recon", "redis", "neo4j")
+
+
+def _field(record: Any, name: str) -> Optional[Any]:
+    if isinstance(record, dict):
+        return record.get(name)
+    return getattr(record, name, None)
+
+
+class LineStore:
+    def __init__(self):
+        self.sources: Dict[str, Dict[str, Any]] = {source: {} for source in SOURCES}
+        self.by_batch: Dict[str, Set[str]] = defaultdict(set)
+        self.batch_of: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def add(self, source: str, record: Any):
+        """Index one record under its line_id (and batch_id, when the source carries one)"""
+        line_id = _field(record, "line_id")
+        if not line_id:
+            return
+        batch_id = _field(record, "batch_id")
+        with self._lock:
+            self.sources[source][line_id] = record
+            if batch_id and self.batch_of.get(line_id) != batch_id:
+                previous = self.batch_of.get(line_id)
+                if previous:
+                    self.by_batch[previous].discard(line_id)
+                self.batch_of[line_id] = batch_id
+                self.by_batch[batch_id].add(line_id)
+
+    def add_many(self, source: str, records: Iterable[Any]) -> int:
+        count = 0
+        for record in records:
+            self.add(source, record)
+            count += 1
+        return count
+
+    def get(self, line_id: str) -> Dict[str, Any]:
+        """Every source's record for a line, None where a source has none"""
+        return {source: self.sources[source].get(line_id) for source in SOURCES}
+
+    def line_ids(self) -> List[str]:
+        with self._lock:
+            return sorted(set().union(*(records.keys() for records in self.sources.values())))
+
+    def batch_lines(self, batch_id: str) -> List[str]:
+        with self._lock:
+            return sorted(self.by_batch.get(batch_id, ()))
+
+    def batch(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        return {line_id: self.get(line_id) for line_id in self.batch_lines(batch_id)}
+
+    def records(self, source: str, batch_id: Optional[str] = None) -> List[Any]:
+        """All records of one source, or only those of one batch"""
+        if batch_id is None:
+            return list(self.sources[source].values())
+        index = self.sources[source]
+        return [index[line_id] for line_id in self.batch_lines(batch_id) if line_id in index]
+
+    def counts(self) -> Dict[str, int]:
+        return {source: len(records) for source, records in self.sources.items()}
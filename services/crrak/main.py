@@ -1,7 +1,10 @@
 # services/crrak/main.py
+from contextlib import aclosing
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from models import CRRAKQuery
-from crrak_logic import generate_explanation
+from crrak_logic import data_access, generate_explanation, llm, llm_cache, stream_explanation
+import json
 import re
 import uvicorn
 
@@ -11,6 +14,15 @@ app = FastAPI(
     version="1.0.0"
 )
 
+@app.on_event("startup")
+async def startup_event():
+    data_access.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    data_access.stop()
+    await llm.close()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -19,6 +31,7 @@ async def root():
         "status": "running",
         "endpoints": {
             "explain": "/explain",
+            "explain_stream": "/explain/stream",
             "health": "/health"
         }
     }
@@ -26,7 +39,17 @@ async def root():
 @app.get("/health")
 async def health():
     """Detailed health check"""
-    return {"status": "healthy", "service": "crrak"}
+    return {"status": "healthy", "service": "crrak", "data": data_access.stats(), "llm_cache": llm_cache.stats(), "llm": llm.stats()}
+
+def extract_ids(user_query: str):
+    """Line ID (e.g., L-2) in the query, otherwise a batch ID (e.g., B-2024-001, BATCH-1)"""
+    match = re.search(r"L-\d+", user_query)
+    line_id = match.group(0) if match else None
+    match = None if line_id else re.search(r"\b(?:B|BATCH)-[\w-]+", user_query)
+    return line_id, match.group(0) if match else None
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @app.post("/explain")
 async def explain(query: CRRAKQuery):
@@ -52,16 +75,16 @@ async def explain(query: CRRAKQuery):
         if not user_query or not user_query.strip():
             raise HTTPException(status_code=400, detail="Query cannot be empty")
         
-        # Extract line ID if present in query (e.g., L-1, L-2, etc.)
-        match = re.search(r"L-\d+", user_query)
-        line_id = match.group(0) if match else None
+        # Extract line ID if present in query, otherwise a batch ID to narrow a batch-level query
+        line_id, batch_id = extract_ids(user_query)
         
-        # Generate explanation
-        explanation = generate_explanation(user_query, line_id)
+        # Generate explanation (awaited, so other requests keep being served meanwhile)
+        explanation = await generate_explanation(user_query, line_id, batch_id)
         
         return {
             "query": user_query,
             "line_id": line_id,
+            "batch_id": batch_id,
             "explanation": explanation,
             "status": "success"
         }
@@ -69,6 +92,34 @@ async def explain(query: CRRAKQuery):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+@app.post("/explain/stream")
+async def explain_stream(query: CRRAKQuery):
+    """
+    Same as /explain, streamed as Server-Sent Events while the model writes:
+    one "meta" event with the extracted IDs, "token" events carrying text
+    chunks, then "done" (or "error").
+    """
+    user_query = query.query
+    if not user_query or not user_query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    line_id, batch_id = extract_ids(user_query)
+
+    async def events():
+        yield sse("meta", {"query": user_query, "line_id": line_id, "batch_id": batch_id})
+        try:
+            async with aclosing(stream_explanation(user_query, line_id, batch_id)) as chunks:
+                async for text in chunks:
+                    yield sse("token", {"text": text})
+            yield sse("done", {"status": "success"})
+        except Exception as e:
+            yield sse("error", {"detail": f"Error generating explanation: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
     # Run the server when executed directly
     uvicorn.run(
@@ -1,9 +1,11 @@
 from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import uvicorn
+import requests
 import os
 import tempfile
 import json
@@ -35,6 +37,10 @@ def verify_api_key(x_api_key: Optional[str] = Header(None)):
         raise HTTPException(status_code=401, detail="Invalid API key")
     return x_api_key
 
+# PDR builds the bank bulk-upload files from pdr_table
+PDR_SERVICE_URL = os.getenv("PDR_SERVICE_URL", "http://localhost:8002")
+BANK_FORMAT_TYPES = {"CSV": ("csv", "text/csv"), "XML": ("pain001", "application/xml")}
+
 @app.get("/")
 async def root():
     return {"message": "CRRAK Agent Service", "status": "running"}
@@ -261,43 +267,44 @@ For production use, this would contain actual transaction data from your system.
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
+def _fetch_bank_file(trace_id: str, pdr_format: str, api_key: str):
+    """Ask PDR to build the bank file for a line and download it (blocking; run off the event loop)"""
+    headers = {"X-API-Key": api_key}
+    response = requests.post(
+        f"{PDR_SERVICE_URL}/pdr/dispatch-files",
+        params={"line_id": trace_id, "format_type": pdr_format},
+        headers=headers,
+        timeout=30
+    )
+    result = response.json()
+    if not result.get("success") or not result["data"]["files"]:
+        return result, None
+    file_response = requests.get(f"{PDR_SERVICE_URL}{result['data']['files'][0]['download_url']}", headers=headers, timeout=30)
+    file_response.raise_for_status()
+    return result, file_response.content
+
 @app.post("/crrak/download-bank-format/{trace_id}")
 async def download_bank_format(trace_id: str, format_type: str = "CSV", api_key: str = Depends(verify_api_key)):
     """Download bank format file for a specific trace"""
     try:
-        # Generate bank format content based on format type
-        if format_type.upper() == "CSV":
-            content = f"""Line ID,Date,Status,Mode,UTR,Bank Ref No,Settlement Date
-{trace_id},06/01/2025,Success,Bulk Upload,UTR2024001230456,B-2024-001,06/01/2025
-{trace_id},06/01/2025,Success,Bulk Upload,UTR2024001230457,B-2024-002,06/01/2025"""
-            filename = f"bank_format_{trace_id}.csv"
-            content_type = "text/csv"
-        elif format_type.upper() == "XML":
-            content = f"""<?xml version="1.0" encoding="UTF-8"?>
-<BankTransaction>
-    <TraceID>{trace_id}</TraceID>
-    <Bank>HDFC Bank</Bank>
-    <Amount>₹25,000</Amount>
-    <Status>Processed</Status>
-    <UTR>UTR2024001230456</UTR>
-    <Date>2025-01-06</Date>
-</BankTransaction>"""
-            filename = f"bank_format_{trace_id}.xml"
-            content_type = "application/xml"
-        else:
-            content = f"Bank Format Report for {trace_id}\n\nTrace ID: {trace_id}\nBank: HDFC Bank\nAmount: ₹25,000\nStatus: Processed\nUTR: UTR2024001230456\nDate: 2025-01-06"
-            filename = f"bank_format_{trace_id}.txt"
-            content_type = "text/plain"
-        
+        pdr_format, content_type = BANK_FORMAT_TYPES.get(format_type.upper(), ("fixed", "text/plain"))
+        result, content = await run_in_threadpool(_fetch_bank_file, trace_id, pdr_format, api_key)
+        if not result.get("success"):
+            return {"success": False, "message": result.get("message", "PDR could not build the bank file")}
+        files = result["data"]["files"]
+        if not files:
+            return {"success": False, "message": f"No routed PDR line found for {trace_id}"}
+
         return {
             "success": True,
             "data": {
                 "trace_id": trace_id,
                 "format_type": format_type,
-                "content": content,
-                "filename": filename,
+                "content": content.decode("utf-8"),
+                "filename": files[0]["filename"],
                 "content_type": content_type,
-                "generated_at": "2025-01-06T20:30:00Z"
+                "sha256": files[0]["sha256"],
+                "generated_at": result["data"]["generated_at"]
             }
         }
     except Exception as e:
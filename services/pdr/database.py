@@ -0,0 +1,210 @@
+import os
+from datetime import datetime
+from sqlalchemy import create_engine, Boolean, Column, Float, Integer, String, Numeric, DateTime, JSON, Text, bindparam, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+# Same PostgreSQL database as the ACC service; PDR runs without persistence if unset
+POSTGRES_URL = os.getenv("DATABASE_URL")
+
+engine = create_engine(POSTGRES_URL, pool_pre_ping=True) if POSTGRES_URL else None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) if engine else None
+Base = declarative_base()
+
+class PdrTable(Base):
+    __tablename__ = "pdr_table"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    line_id = Column(String(50), unique=True)
+    batch_id = Column(String(100))
+    rail_selected = Column(String(100))
+    fallbacks = Column(JSON)
+    expected_amount = Column(Numeric)
+    expected_currency = Column(String(10))
+    expected_utr = Column(String(100))
+    status = Column(String(50))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class PdrQueueEntry(Base):
+    """
+    Snapshot of the in-memory dispatch schedulers, reloaded on restart.
+
+    Each worker process writes only its own rows (owner). Rows released on
+    shutdown (owner NULL) or left stale by a crashed worker are claimed by
+    exactly one worker, which deletes them as it takes them.
+    """
+    __tablename__ = "pdr_queue"
+
+    line_id = Column(String(50), primary_key=True)
+    owner = Column(String(100), index=True)
+    payload = Column(JSON)
+    rail_selected = Column(String(100))
+    deadline = Column(DateTime, index=True)
+    queued_at = Column(DateTime)
+    snapshot_at = Column(DateTime, default=datetime.utcnow)
+
+class PdrRailOutcome(Base):
+    """Bank acks and returns per rail, shared by every worker's rolling rail statistics"""
+    __tablename__ = "pdr_rail_outcomes"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    rail = Column(String(20))
+    success = Column(Boolean)
+    latency_seconds = Column(Float)
+    error = Column(Text)
+    outcome_at = Column(DateTime, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+def create_tables():
+    """Create PDR tables if the database is configured"""
+    if engine is None:
+        print("⚠️  DATABASE_URL not set - PDR results will not be persisted")
+        return
+    Base.metadata.create_all(bind=engine)
+
+def save_pdr_results(rows, chunk_size=5000):
+    """Upsert routed lines into pdr_table in chunks; returns the number of rows written"""
+    if engine is None or not rows:
+        return 0
+    columns = ["line_id", "batch_id", "rail_selected", "fallbacks", "expected_amount",
+               "expected_currency", "expected_utr", "status", "created_at"]
+    written = 0
+    try:
+        with engine.begin() as conn:
+            for start in range(0, len(rows), chunk_size):
+                chunk = [{c: row.get(c) for c in columns} for row in rows[start:start + chunk_size]]
+                stmt = insert(PdrTable.__table__).values(chunk)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["line_id"],
+                    set_={c: stmt.excluded[c] for c in columns if c != "line_id"}
+                )
+                conn.execute(stmt)
+                written += len(chunk)
+        return written
+    except Exception as e:
+        print(f"❌ Error saving PDR results: {e}")
+        return 0
+
+def save_queue_snapshot(owner, rows, release=False):
+    """Replace this owner's pdr_queue rows; release=True leaves them for another worker to claim"""
+    if engine is None:
+        return False
+    table = PdrQueueEntry.__table__
+    try:
+        with engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.owner == owner))
+            if rows:
+                now = datetime.utcnow()
+                stmt = insert(table).values([{**row, "owner": None if release else owner, "snapshot_at": now} for row in rows])
+                conn.execute(stmt.on_conflict_do_update(
+                    index_elements=["line_id"],
+                    set_={c: stmt.excluded[c] for c in ("owner", "payload", "rail_selected", "deadline", "queued_at", "snapshot_at")}
+                ))
+        return True
+    except Exception as e:
+        print(f"❌ Error saving PDR queue snapshot: {e}")
+        return False
+
+def claim_queue_snapshot(stale_before):
+    """Take the released rows and those of workers silent since stale_before, oldest first; each row goes to one caller"""
+    if engine is None:
+        return []
+    table = PdrQueueEntry.__table__
+    try:
+        with engine.begin() as conn:
+            result = conn.execute(
+                table.delete()
+                .where((table.c.owner.is_(None)) | (table.c.snapshot_at < stale_before))
+                .returning(table.c.payload, table.c.queued_at)
+            )
+            return [row.payload for row in sorted(result, key=lambda row: row.queued_at or datetime.min)]
+    except Exception as e:
+        print(f"❌ Error claiming PDR queue snapshot: {e}")
+        return []
+
+def save_rail_outcomes(rows):
+    """Store rail outcomes ({rail, success, latency_seconds, error, outcome_at}); returns the number written"""
+    if engine is None or not rows:
+        return 0
+    with engine.begin() as conn:
+        conn.execute(PdrRailOutcome.__table__.insert(), rows)
+    return len(rows)
+
+# Reconciliation results as rail outcomes: a MATCHED line was delivered, a UTR/amount/currency
+# mismatch was delivered wrong; missing responses and fuzzy review suggestions say nothing about the rail
+RECON_OUTCOMES_SQL = """
+    SELECT a.id, split_part(p.rail_selected, '@', 1) AS rail, a.match_status = 'MATCHED' AS success,
+           a.metadata_info->>'exception' AS error, a.created_at AS outcome_at
+    FROM arl_table a
+    JOIN pdr_table p ON p.line_id = a.line_id
+    WHERE a.id > :after_id AND a.id <= :upto AND a.created_at >= :since AND p.rail_selected IS NOT NULL
+      AND (a.match_status = 'MATCHED'
+           OR a.metadata_info->>'exception' IN ('UTR mismatch', 'Amount mismatch', 'Currency mismatch'))
+    ORDER BY a.id
+"""
+
+def rail_outcomes_since(watermarks, since):
+    """
+    Outcomes stored in pdr_rail_outcomes and reconciled by ARL after the
+    watermarks ({"outcomes": id, "recon": id}), and the advanced watermarks
+    """
+    advanced = dict(watermarks)
+    if engine is None:
+        return [], advanced
+    rows = []
+    table = PdrRailOutcome.__table__
+    with engine.connect() as conn:
+        upto = conn.execute(select(func.max(table.c.id))).scalar() or 0
+        if upto > advanced["outcomes"]:
+            query = (
+                select(table.c.rail, table.c.success, table.c.latency_seconds, table.c.error, table.c.outcome_at)
+                .where(table.c.id > advanced["outcomes"], table.c.id <= upto, table.c.outcome_at >= since)
+                .order_by(table.c.id)
+            )
+            rows.extend(dict(row) for row in conn.execute(query).mappings())
+            advanced["outcomes"] = upto
+        try:
+            # arl_table belongs to ARL and may not exist yet
+            upto = conn.execute(text("SELECT max(id) FROM arl_table")).scalar() or 0
+        except Exception:
+            return rows, advanced
+        if upto > advanced["recon"]:
+            result = conn.execute(text(RECON_OUTCOMES_SQL), {"after_id": advanced["recon"], "upto": upto, "since": since})
+            rows.extend({**row, "latency_seconds": None} for row in result.mappings())
+            advanced["recon"] = upto
+    return rows, advanced
+
+DISPATCH_LINES_SQL = """
+    SELECT p.line_id, p.batch_id, p.rail_selected, p.expected_amount, p.expected_currency, p.expected_utr,
+           i.receiver_name AS beneficiary_name, i.receiver_account_number AS beneficiary_account,
+           i.receiver_ifsc_code AS ifsc, i.sender_account_number AS debit_account, i.purpose
+    FROM pdr_table p
+    LEFT JOIN LATERAL (
+        SELECT * FROM intent_table t WHERE t.transaction_id = p.line_id ORDER BY t.id DESC LIMIT 1
+    ) i ON true
+    WHERE p.status IN ('ROUTED', 'DISPATCHED') {filters}
+    ORDER BY p.rail_selected, p.line_id
+"""
+
+def iter_dispatch_lines(batch_id=None, rail=None, line_ids=None, chunk_size=5000):
+    """Stream routed lines with beneficiary details through a server-side cursor"""
+    if engine is None:
+        return
+    filters, params = [], {}
+    if batch_id:
+        filters.append("AND p.batch_id = :batch_id")
+        params["batch_id"] = batch_id
+    if rail:
+        filters.append("AND p.rail_selected LIKE :rail")
+        params["rail"] = f"{rail.upper()}@%"
+    if line_ids:
+        filters.append("AND p.line_id IN :line_ids")
+        params["line_ids"] = list(line_ids)
+    query = text(DISPATCH_LINES_SQL.format(filters=" ".join(filters)))
+    if line_ids:
+        query = query.bindparams(bindparam("line_ids", expanding=True))
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query, params)
+        for row in result.mappings():
+            yield dict(row)
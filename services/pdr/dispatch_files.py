@@ -0,0 +1,305 @@
+"""
+Bank bulk-upload file builder for routed PDR lines.
+
+Rows are streamed in, grouped per (bank, rail) and written to disk as they
+arrive, rolling over to a new file whenever the bank's record or size limit
+would be exceeded. Each file body is spooled to a .part file and assembled
+with its header/trailer at the end (pain.001 needs the totals up front), so
+memory stays bounded by a single record regardless of batch size. A line
+that cannot be paid (no beneficiary account, IFSC or debit account) aborts
+the run and every file written for it is removed.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+from xml.sax.saxutils import escape
+
+DISPATCH_DIR = os.getenv("PDR_DISPATCH_DIR", os.path.join(tempfile.gettempdir(), "pdr_dispatch"))
+DEBIT_ACCOUNT = os.getenv("PDR_DEBIT_ACCOUNT", "").strip()
+INITIATOR_NAME = os.getenv("PDR_INITIATOR_NAME", "Arealis Gateway")
+
+# Bulk upload limits published by the sponsor banks
+BANK_FILE_LIMITS = {
+    "HDFC": {"max_records": 25000, "max_bytes": 5 * 1024 * 1024},
+    "ICICI": {"max_records": 10000, "max_bytes": 2 * 1024 * 1024},
+    "SBI": {"max_records": 20000, "max_bytes": 4 * 1024 * 1024},
+    "AXIS": {"max_records": 15000, "max_bytes": 3 * 1024 * 1024},
+}
+DEFAULT_FILE_LIMITS = {"max_records": 10000, "max_bytes": 2 * 1024 * 1024}
+
+# Room kept for the header and trailer when checking the size limit
+ENVELOPE_RESERVE_BYTES = 4096
+
+SAFE_BATCH_ID = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+TXN_TYPE_CODES = {"NEFT": "N", "RTGS": "R", "IMPS": "I", "UPI": "U"}
+
+CSV_HEADER = ["Transaction Type", "Beneficiary Name", "Beneficiary Account Number", "IFSC Code", "Amount",
+              "Debit Account Number", "Value Date", "Customer Reference", "Remarks"]
+
+# (field, width) for fixed-width detail records
+FIXED_WIDTH_LAYOUT = [("txn_type", 1), ("beneficiary_name", 35), ("beneficiary_account", 20), ("ifsc", 11),
+                      ("amount_paise", 15), ("debit_account", 20), ("value_date", 8), ("reference", 20), ("remarks", 30)]
+
+
+def _amount(row: Dict[str, Any]) -> Decimal:
+    return Decimal(str(row.get("expected_amount") or 0)).quantize(Decimal("0.01"))
+
+
+def _fields(row: Dict[str, Any], amount: Decimal, ctx: Dict[str, str]) -> Dict[str, str]:
+    debit_account = DEBIT_ACCOUNT or (row.get("debit_account") or "").strip()
+    if not debit_account:
+        raise ValueError(f"No debit account for line {row['line_id']}: set PDR_DEBIT_ACCOUNT")
+    beneficiary_account = (row.get("beneficiary_account") or "").strip()
+    ifsc = (row.get("ifsc") or "").strip()
+    if not beneficiary_account or not ifsc:
+        raise ValueError(f"No beneficiary account or IFSC for line {row['line_id']}: check its intent_table row")
+    return {
+        "txn_type": ctx["txn_type"],
+        "beneficiary_name": row.get("beneficiary_name") or "",
+        "beneficiary_account": beneficiary_account,
+        "ifsc": ifsc,
+        "amount": str(amount),
+        "amount_paise": str(int(amount * 100)),
+        "debit_account": debit_account,
+        "value_date": ctx["value_date"],
+        "reference": row["line_id"],
+        "remarks": row.get("expected_utr") or row.get("purpose") or ""
+    }
+
+
+class CsvFormat:
+    extension = "csv"
+
+    def header(self, info: Dict[str, Any]) -> str:
+        return ",".join(CSV_HEADER) + "\r\n"
+
+    def record(self, row: Dict[str, Any], amount: Decimal, ctx: Dict[str, str]) -> str:
+        f = _fields(row, amount, ctx)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow([
+            f["txn_type"], f["beneficiary_name"], f["beneficiary_account"], f["ifsc"], f["amount"],
+            f["debit_account"], ctx["value_date_dmy"], f["reference"], f["remarks"]
+        ])
+        return buffer.getvalue()
+
+    def trailer(self, info: Dict[str, Any]) -> str:
+        return ""
+
+
+class FixedWidthFormat:
+    extension = "txt"
+
+    def header(self, info: Dict[str, Any]) -> str:
+        return f"H{info['file_id']:<40}{info['bank']:<11}{info['created_at'].strftime('%Y%m%d%H%M%S')}\n"
+
+    def record(self, row: Dict[str, Any], amount: Decimal, ctx: Dict[str, str]) -> str:
+        f = _fields(row, amount, ctx)
+        parts = []
+        for name, width in FIXED_WIDTH_LAYOUT:
+            value = f[name]
+            parts.append(value.rjust(width, "0")[-width:] if name == "amount_paise" else value[:width].ljust(width))
+        return "D" + "".join(parts) + "\n"
+
+    def trailer(self, info: Dict[str, Any]) -> str:
+        return f"T{info['records']:09d}{int(info['control_sum'] * 100):018d}\n"
+
+
+class Pain001Format:
+    """ISO 20022 customer credit transfer initiation (pain.001.001.03)"""
+    extension = "xml"
+
+    def header(self, info: Dict[str, Any]) -> str:
+        created = info["created_at"].strftime("%Y-%m-%dT%H:%M:%S")
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.001.001.03">\n'
+            "<CstmrCdtTrfInitn>\n"
+            f"<GrpHdr><MsgId>{escape(info['file_id'])}</MsgId><CreDtTm>{created}</CreDtTm>"
+            f"<NbOfTxs>{info['records']}</NbOfTxs><CtrlSum>{info['control_sum']}</CtrlSum>"
+            f"<InitgPty><Nm>{escape(INITIATOR_NAME)}</Nm></InitgPty></GrpHdr>\n"
+            f"<PmtInf><PmtInfId>{escape(info['file_id'])}</PmtInfId><PmtMtd>TRF</PmtMtd>"
+            f"<NbOfTxs>{info['records']}</NbOfTxs><CtrlSum>{info['control_sum']}</CtrlSum>"
+            f"<PmtTpInf><LclInstrm><Prtry>{info['rail']}</Prtry></LclInstrm></PmtTpInf>"
+            f"<ReqdExctnDt>{info['value_date'].strftime('%Y-%m-%d')}</ReqdExctnDt>"
+            f"<Dbtr><Nm>{escape(INITIATOR_NAME)}</Nm></Dbtr>"
+            f"<DbtrAcct><Id><Othr><Id>{escape(DEBIT_ACCOUNT)}</Id></Othr></Id></DbtrAcct>"
+            f"<DbtrAgt><FinInstnId><Othr><Id>{escape(info['bank'])}</Id></Othr></FinInstnId></DbtrAgt>\n"
+        )
+
+    def record(self, row: Dict[str, Any], amount: Decimal, ctx: Dict[str, str]) -> str:
+        f = _fields(row, amount, ctx)
+        currency = escape(row.get("expected_currency") or "INR")
+        return (
+            f"<CdtTrfTxInf><PmtId><EndToEndId>{escape(f['reference'])}</EndToEndId></PmtId>"
+            f'<Amt><InstdAmt Ccy="{currency}">{f["amount"]}</InstdAmt></Amt>'
+            f"<CdtrAgt><FinInstnId><ClrSysMmbId><MmbId>{escape(f['ifsc'])}</MmbId></ClrSysMmbId></FinInstnId></CdtrAgt>"
+            f"<Cdtr><Nm>{escape(f['beneficiary_name'])}</Nm></Cdtr>"
+            f"<CdtrAcct><Id><Othr><Id>{escape(f['beneficiary_account'])}</Id></Othr></Id></CdtrAcct>"
+            f"<RmtInf><Ustrd>{escape(f['remarks'])}</Ustrd></RmtInf></CdtTrfTxInf>\n"
+        )
+
+    def trailer(self, info: Dict[str, Any]) -> str:
+        return "</PmtInf>\n</CstmrCdtTrfInitn>\n</Document>\n"
+
+
+FORMATS = {"csv": CsvFormat(), "fixed": FixedWidthFormat(), "pain001": Pain001Format()}
+
+
+class DispatchFileSeries:
+    """Files for one (bank, rail) pair, rolled over at the bank's limits"""
+
+    def __init__(self, directory: str, batch_id: str, bank: str, rail: str, fmt, value_date: datetime):
+        self.directory = directory
+        self.batch_id = batch_id
+        self.bank = bank
+        self.rail = rail
+        self.fmt = fmt
+        self.value_date = value_date
+        self.limits = BANK_FILE_LIMITS.get(bank, DEFAULT_FILE_LIMITS)
+        self.ctx = {
+            "txn_type": TXN_TYPE_CODES.get(rail, "N"),
+            "value_date": value_date.strftime("%Y%m%d"),
+            "value_date_dmy": value_date.strftime("%d/%m/%Y")
+        }
+        self.files: List[Dict[str, Any]] = []
+        self._part = None
+
+    def _open(self):
+        seq = len(self.files) + 1
+        file_id = f"{self.batch_id}_{self.bank}_{self.rail}_{seq:03d}"
+        path = os.path.join(self.directory, f"{file_id}.{self.fmt.extension}")
+        self._info = {"file_id": file_id, "path": path, "bank": self.bank, "rail": self.rail,
+                      "value_date": self.value_date, "records": 0, "control_sum": Decimal("0.00"), "body_bytes": 0}
+        self._part = open(path + ".part", "wb")
+
+    def add(self, row: Dict[str, Any]):
+        amount = _amount(row)
+        data = self.fmt.record(row, amount, self.ctx).encode("utf-8")
+        if self._part is not None and (
+            self._info["records"] >= self.limits["max_records"]
+            or self._info["body_bytes"] + len(data) + ENVELOPE_RESERVE_BYTES > self.limits["max_bytes"]
+        ):
+            self._finish()
+        if self._part is None:
+            self._open()
+        self._part.write(data)
+        self._info["records"] += 1
+        self._info["body_bytes"] += len(data)
+        self._info["control_sum"] += amount
+
+    def _finish(self):
+        info = self._info
+        self._part.close()
+        self._part = None
+        info["created_at"] = datetime.utcnow()
+        digest = hashlib.sha256()
+        size = 0
+        with open(info["path"], "wb") as out:
+            def emit(chunk: bytes):
+                nonlocal size
+                out.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+
+            emit(self.fmt.header(info).encode("utf-8"))
+            with open(info["path"] + ".part", "rb") as body:
+                for chunk in iter(lambda: body.read(1024 * 1024), b""):
+                    emit(chunk)
+            emit(self.fmt.trailer(info).encode("utf-8"))
+        os.remove(info["path"] + ".part")
+
+        self.files.append({
+            "filename": os.path.basename(info["path"]),
+            "bank": self.bank,
+            "rail": self.rail,
+            "records": info["records"],
+            "control_sum": str(info["control_sum"]),
+            "bytes": size,
+            "sha256": digest.hexdigest()
+        })
+
+    def close(self) -> List[Dict[str, Any]]:
+        if self._part is not None:
+            self._finish()
+        return self.files
+
+    def discard(self):
+        """Remove the spooled body and every file finished so far"""
+        paths = [os.path.join(self.directory, entry["filename"]) for entry in self.files]
+        if self._part is not None:
+            self._part.close()
+            self._part = None
+            paths.append(self._info["path"] + ".part")
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self.files = []
+
+
+def build_dispatch_files(rows: Iterable[Dict[str, Any]], batch_id: str, fmt: str = "csv",
+                         directory: Optional[str] = None, value_date: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Write routed lines ({line_id, rail_selected, expected_amount, ...}) as bank
+    bulk-upload files and return the manifest, which is also saved next to them.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported dispatch format: {fmt}")
+    if not SAFE_BATCH_ID.match(batch_id) or batch_id.startswith("."):
+        raise ValueError(f"Invalid batch id: {batch_id}")
+    if fmt == "pain001" and not DEBIT_ACCOUNT:
+        # pain.001 carries one debtor account per payment information block
+        raise ValueError("PDR_DEBIT_ACCOUNT must be set to build pain.001 files")
+    directory = directory or os.path.join(DISPATCH_DIR, batch_id)
+    os.makedirs(directory, exist_ok=True)
+    value_date = value_date or datetime.utcnow()
+
+    series: Dict[tuple, DispatchFileSeries] = {}
+    skipped = 0
+    try:
+        for row in rows:
+            if not row.get("rail_selected"):
+                skipped += 1
+                continue
+            rail, _, bank = row["rail_selected"].partition("@")
+            key = (bank or "DEFAULT", rail)
+            if key not in series:
+                series[key] = DispatchFileSeries(directory, batch_id, key[0], rail, FORMATS[fmt], value_date)
+            series[key].add(row)
+        files = [entry for s in series.values() for entry in s.close()]
+    except BaseException:
+        # No half-written batch is left behind to be uploaded by mistake
+        for s in series.values():
+            s.discard()
+        raise
+    manifest = {
+        "batch_id": batch_id,
+        "format": fmt,
+        "directory": directory,
+        "total_records": sum(f["records"] for f in files),
+        "control_sum": str(sum((Decimal(f["control_sum"]) for f in files), Decimal("0.00"))),
+        "skipped_unrouted": skipped,
+        "files": files,
+        "generated_at": datetime.utcnow().isoformat()
+    }
+    with open(os.path.join(directory, f"{batch_id}_{fmt}_manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def dispatch_file_path(batch_id: str, filename: str) -> Optional[str]:
+    """Resolve a generated file, refusing anything outside the batch directory"""
+    if not SAFE_BATCH_ID.match(batch_id) or batch_id.startswith("."):
+        return None
+    directory = os.path.realpath(os.path.join(DISPATCH_DIR, batch_id))
+    path = os.path.realpath(os.path.join(directory, filename))
+    if os.path.dirname(path) != directory or not os.path.isfile(path):
+        return None
+    return path
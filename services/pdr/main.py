@@ -1,11 +1,22 @@
-from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi import FastAPI, Depends, HTTPException, Header, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import uvicorn
 import requests
 import json
-from datetime import datetime, timedelta
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from database import create_tables, save_pdr_results, iter_dispatch_lines
+from dispatch_files import FORMATS, build_dispatch_files, dispatch_file_path
+from arealis_events import get_event_bus, TOPIC_ACC_DECISIONS
+from pipeline import LiveQueue
+from rail_stats import RailStatsEngine
+from routing_engine import IST, RAILS, RAIL_CONFIG, minutes_to_cutoff, route_lines
 
 app = FastAPI(title="PDR Agent Service", version="1.0")
 
@@ -34,6 +45,64 @@ def verify_api_key(x_api_key: Optional[str] = Header(None)):
         raise HTTPException(status_code=401, detail="Invalid API key")
     return x_api_key
 
+class RouteLine(BaseModel):
+    line_id: str
+    amount: float
+    currency: str = "INR"
+    method: Optional[str] = None
+    batch_id: Optional[str] = None
+
+class RailOutcome(BaseModel):
+    rail: str
+    success: bool
+    latency_seconds: Optional[float] = None
+    timestamp: Optional[datetime] = None
+    error: Optional[str] = None
+
+class RouteRequest(BaseModel):
+    batch_id: Optional[str] = None
+    lines: List[RouteLine]
+    persist: bool = True
+    include_lines: bool = True
+
+# Rolling per-rail outcome statistics, shared by all workers through the database; feeds routing and the rail dashboards
+rail_stats = RailStatsEngine()
+
+# Live queue fed by ACC decision events; when the bus is disabled PDR falls back to polling ACC
+event_bus = get_event_bus()
+live_queue = LiveQueue(
+    event_bus,
+    rail_stats=rail_stats.routing_stats,
+    release_batch_size=int(os.getenv("PDR_RELEASE_BATCH_SIZE", "50")),
+    sla_seconds=float(os.getenv("PDR_SLA_SECONDS", "900")),
+    rescore_interval=float(os.getenv("PDR_RESCORE_INTERVAL_SECONDS", "120")),
+    snapshot_interval=float(os.getenv("PDR_SNAPSHOT_INTERVAL_SECONDS", "30"))
+)
+_pipeline_stop = threading.Event()
+
+@app.on_event("startup")
+async def startup_event():
+    create_tables()
+    await run_in_threadpool(rail_stats.start, float(os.getenv("PDR_RAIL_STATS_REFRESH_SECONDS", "2")))
+    if event_bus.enabled:
+        live_queue.restore_snapshot()
+        for _ in range(int(os.getenv("PDR_CONSUMERS", "1"))):
+            event_bus.subscribe(TOPIC_ACC_DECISIONS, "pdr", live_queue.accept)
+        threading.Thread(
+            target=live_queue.run_releaser,
+            args=(float(os.getenv("PDR_RELEASE_INTERVAL_SECONDS", "5")), _pipeline_stop),
+            daemon=True
+        ).start()
+        print("✅ PDR consuming acc.decisions")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    _pipeline_stop.set()
+    rail_stats.stop()
+    event_bus.close()
+    if event_bus.enabled:
+        live_queue.save_snapshot(release=True)
+
 @app.get("/")
 async def root():
     return {"message": "PDR Agent Service", "status": "running"}
@@ -45,6 +114,9 @@ async def health():
 @app.get("/pdr/live-queue")
 async def get_live_queue(api_key: str = Depends(verify_api_key)):
     """Get live queue data for PDR agent"""
+    if event_bus.enabled:
+        return {"success": True, "data": live_queue.snapshot()}
+
     try:
         # Fetch real data from ACC service
         acc_response = requests.get("http://localhost:8000/acc/vendor-payments", 
@@ -165,81 +237,162 @@ async def get_live_queue(api_key: str = Depends(verify_api_key)):
                 }
             }
 
+@app.post("/pdr/release")
+async def release_queue(max_lines: Optional[int] = None, api_key: str = Depends(verify_api_key)):
+    """Release pending lines to their rails immediately instead of waiting for the next cycle"""
+    if not event_bus.enabled:
+        return {"success": False, "message": "Event bus is not enabled"}
+    dispatched = live_queue.release(max_lines)
+    return {"success": True, "data": {"dispatched_count": len(dispatched), "dispatched": dispatched}}
+
+@app.get("/pdr/queue-metrics")
+async def get_queue_metrics(api_key: str = Depends(verify_api_key)):
+    """Scheduler depth, age percentiles, SLA breaches and dispatch throughput"""
+    if not event_bus.enabled:
+        return {"success": False, "message": "Event bus is not enabled"}
+    return {"success": True, "data": live_queue.scheduler.metrics()}
+
+@app.post("/pdr/rail-outcomes")
+async def record_rail_outcomes(outcomes: List[RailOutcome], api_key: str = Depends(verify_api_key)):
+    """Ingest dispatch outcomes (bank acks/returns) into the rolling rail statistics of every worker"""
+    rows = []
+    for outcome in outcomes:
+        ts = None
+        if outcome.timestamp:
+            # Timestamps without an offset are bank times in UTC, not server-local time
+            stamp = outcome.timestamp
+            ts = (stamp if stamp.tzinfo else stamp.replace(tzinfo=timezone.utc)).timestamp()
+        rows.append({"rail": outcome.rail, "success": outcome.success, "latency_seconds": outcome.latency_seconds,
+                     "ts": ts, "error": outcome.error})
+    recorded = await run_in_threadpool(rail_stats.report, rows)
+    return {"success": True, "data": {"recorded": recorded, "ignored": len(outcomes) - recorded}}
+
+@app.post("/pdr/route")
+async def route_batch(request: RouteRequest, api_key: str = Depends(verify_api_key)):
+    """Select a rail and fallbacks for every line in a batch and persist the plan to pdr_table"""
+    try:
+        started = time.perf_counter()
+        lines = [line.model_dump() for line in request.lines]
+        routed = await run_in_threadpool(route_lines, lines, request.batch_id, rail_stats.routing_stats())
+        routed_ms = (time.perf_counter() - started) * 1000
+        persisted = await run_in_threadpool(save_pdr_results, routed) if request.persist else 0
+
+        status_counts: Dict[str, int] = {}
+        for row in routed:
+            status_counts[row["status"]] = status_counts.get(row["status"], 0) + 1
+
+        return {
+            "success": True,
+            "data": {
+                "batch_id": request.batch_id,
+                "total_lines": len(routed),
+                "status_counts": status_counts,
+                "persisted": persisted,
+                "routing_ms": round(routed_ms, 2),
+                "lines": routed if request.include_lines else []
+            }
+        }
+    except Exception as e:
+        return {"success": False, "message": f"Error routing batch: {str(e)}"}
+
+def format_minutes(minutes: float) -> str:
+    hours, mins = divmod(int(minutes), 60)
+    return f"In {hours}h {mins}m" if hours else f"In {mins}m"
+
 @app.get("/pdr/rail-health")
 async def get_rail_health(api_key: str = Depends(verify_api_key)):
     """Get rail health data for PDR agent"""
+    now = datetime.now(IST)
+    rail_performance, rail_advisories, cutoff_timers = [], [], []
+
+    for rail in RAILS:
+        stats = rail_stats.summary(rail)
+        rail_performance.append({
+            "rail_name": rail,
+            "success_rate": round(stats["success_rate"], 1),
+            "avg_latency": stats["avg_response_time"],
+            "latency_p95": stats["latency_p95"],
+            "samples_10m": stats["samples_10m"],
+            "last_updated": stats["last_updated"]
+        })
+        if stats["samples_10m"] and stats["success_rate"] < 90:
+            rail_advisories.append({"rail_name": rail, "severity": "high", "message": f"success rate {stats['success_rate']:.1f}% over last 10m"})
+
+        minutes = minutes_to_cutoff(rail, now)
+        if minutes is None:
+            cutoff_timers.append({"rail": rail, "time_remaining": "No cut-off", "tone": "success"})
+        elif minutes <= 0:
+            opens_at = RAIL_CONFIG[rail]["window"][0]
+            cutoff_timers.append({"rail": rail, "time_remaining": f"Closed, opens {opens_at} IST", "tone": "warning"})
+            rail_advisories.append({"rail_name": rail, "severity": "medium", "message": f"window closed until {opens_at} IST"})
+        elif minutes <= 60:
+            cutoff_timers.append({"rail": rail, "time_remaining": format_minutes(minutes), "tone": "warning"})
+            rail_advisories.append({"rail_name": rail, "severity": "high", "message": "window closing, route elsewhere"})
+        else:
+            cutoff_timers.append({"rail": rail, "time_remaining": format_minutes(minutes), "tone": "default"})
+
     return {
         "success": True,
         "data": {
-            "rail_performance": [
-                {
-                    "rail_name": "IMPS",
-                    "success_rate": 98.5,
-                    "avg_latency": 0.8,
-                    "last_updated": "2024-01-15T10:25:00Z"
-                },
-                {
-                    "rail_name": "NEFT", 
-                    "success_rate": 92.1,
-                    "avg_latency": 1.2,
-                    "last_updated": "2024-01-15T10:25:00Z"
-                },
-                {
-                    "rail_name": "RTGS",
-                    "success_rate": 99.2,
-                    "avg_latency": 0.5,
-                    "last_updated": "2024-01-15T10:25:00Z"
-                }
-            ],
-            "rail_advisories": [
-                {
-                    "rail_name": "NEFT",
-                    "severity": "high",
-                    "message": "penalty high, window closing"
-                },
-                {
-                    "rail_name": "IMPS",
-                    "severity": "low", 
-                    "message": "prefer for next 30m"
-                }
-            ],
-            "cutoff_timers": [
-                {
-                    "rail": "NEFT",
-                    "time_remaining": "In 22m",
-                    "tone": "warning"
-                },
-                {
-                    "rail": "RTGS",
-                    "time_remaining": "In 2h 10m", 
-                    "tone": "default"
-                },
-                {
-                    "rail": "IMPS",
-                    "time_remaining": "No cut-off",
-                    "tone": "success"
-                }
-            ]
+            "rail_performance": rail_performance,
+            "rail_advisories": rail_advisories,
+            "cutoff_timers": cutoff_timers
         }
     }
 
+# Inline CSV content is only returned for exports small enough to hand to the browser
+EXPORT_INLINE_MAX_BYTES = 5 * 1024 * 1024
+
+@app.post("/pdr/dispatch-files")
+async def create_dispatch_files(batch_id: Optional[str] = None, format_type: str = "csv", rail: Optional[str] = None,
+                                line_id: Optional[List[str]] = Query(None), api_key: str = Depends(verify_api_key)):
+    """Write routed lines of a batch (or explicit line_ids) as bank bulk-upload files (csv, fixed, pain001)"""
+    format_type = format_type.lower()
+    if format_type not in FORMATS:
+        return {"success": False, "message": f"Unsupported format: {format_type}. Use one of {sorted(FORMATS)}"}
+    if not batch_id and not line_id:
+        return {"success": False, "message": "batch_id or line_id is required"}
+    try:
+        label = batch_id or f"LINES-{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}"
+        manifest = await run_in_threadpool(
+            build_dispatch_files, iter_dispatch_lines(batch_id, rail, line_id), label, format_type
+        )
+        for entry in manifest["files"]:
+            entry["download_url"] = f"/pdr/dispatch-files/{label}/{entry['filename']}"
+        return {"success": True, "data": manifest}
+    except Exception as e:
+        return {"success": False, "message": f"Error generating dispatch files: {str(e)}"}
+
+@app.get("/pdr/dispatch-files/{batch_id}/{filename}")
+async def download_dispatch_file(batch_id: str, filename: str, api_key: str = Depends(verify_api_key)):
+    """Download a generated dispatch file"""
+    path = dispatch_file_path(batch_id, filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Dispatch file not found")
+    return FileResponse(path=path, filename=filename)
+
 @app.post("/pdr/export-csv")
-async def export_csv(api_key: str = Depends(verify_api_key)):
-    """Export live queue data as CSV"""
+async def export_csv(batch_id: Optional[str] = None, api_key: str = Depends(verify_api_key)):
+    """Export a batch's routed lines as bank bulk-upload CSV"""
     try:
-        # Generate CSV content for live queue data
-        csv_content = """Trace ID,Status,Amount,Beneficiary,Initiated At,Processing Time
-TRC-2024-001236,Processing,₹15,000,Vendor A,2025-01-06 10:30:00,2.5s
-TRC-2024-001231,Completed,₹25,000,Vendor B,2025-01-06 10:25:00,1.8s
-TRC-2024-001228,Processing,₹35,000,Vendor C,2025-01-06 10:20:00,3.2s
-TRC-2024-001220,Completed,₹100,000,Vendor D,2025-01-06 10:15:00,2.1s"""
-        
+        batch_id = batch_id or f"BATCH-{datetime.utcnow().strftime('%Y%m%d')}"
+        manifest = await run_in_threadpool(build_dispatch_files, iter_dispatch_lines(batch_id), batch_id, "csv")
+
+        csv_content = None
+        if len(manifest["files"]) == 1 and manifest["files"][0]["bytes"] <= EXPORT_INLINE_MAX_BYTES:
+            with open(dispatch_file_path(batch_id, manifest["files"][0]["filename"]), encoding="utf-8") as f:
+                csv_content = f.read()
+        for entry in manifest["files"]:
+            entry["download_url"] = f"/pdr/dispatch-files/{batch_id}/{entry['filename']}"
+
         return {
             "success": True,
             "data": {
                 "csv_content": csv_content,
-                "filename": f"live_queue_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                "generated_at": datetime.now().isoformat()
+                "filename": manifest["files"][0]["filename"] if manifest["files"] else None,
+                "files": manifest["files"],
+                "total_records": manifest["total_records"],
+                "generated_at": manifest["generated_at"]
             }
         }
     except Exception as e:
@@ -365,28 +518,14 @@ async def restart_rail(rail_name: str, api_key: str = Depends(verify_api_key)):
 @app.get("/pdr/rail-metrics/{rail_name}")
 async def get_rail_metrics(rail_name: str, api_key: str = Depends(verify_api_key)):
     """Get detailed metrics for a specific rail"""
-    try:
-        import random
-        
-        metrics = {
-            "rail_name": rail_name,
-            "uptime_percentage": round(random.uniform(95, 99.9), 2),
-            "avg_response_time": round(random.uniform(0.8, 1.5), 2),
-            "success_rate": round(random.uniform(96, 99), 2),
-            "error_count_24h": random.randint(0, 5),
-            "last_error": "None" if random.choice([True, True, True, False]) else "Connection timeout",
-            "last_error_time": None if random.choice([True, True, True, False]) else (datetime.now() - timedelta(hours=random.randint(1, 12))).isoformat(),
-            "current_load": round(random.uniform(60, 95), 1),
-            "peak_load_24h": round(random.uniform(85, 99), 1),
-            "generated_at": datetime.now().isoformat()
-        }
-        
-        return {
-            "success": True,
-            "data": metrics
-        }
-    except Exception as e:
-        return {"success": False, "message": f"Error getting rail metrics: {str(e)}"}
+    metrics = rail_stats.summary(rail_name)
+    if metrics is None:
+        return {"success": False, "message": f"Unknown rail: {rail_name}"}
+    metrics["generated_at"] = datetime.now().isoformat()
+    return {
+        "success": True,
+        "data": metrics
+    }
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8002)
@@ -0,0 +1,195 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from database import save_pdr_results, save_queue_snapshot, claim_queue_snapshot
+from arealis_events import TOPIC_PDR_DISPATCH
+from routing_engine import route_lines
+from scheduler import DispatchScheduler
+
+SLA_WARNING_SECONDS = 300
+# Snapshot rows of a worker that has not written for this many snapshot intervals are taken over
+STALE_SNAPSHOTS = 4
+
+
+def format_inr(amount: float) -> str:
+    return f"₹{amount:,.0f}"
+
+
+def format_age(seconds: float) -> str:
+    if seconds < 60:
+        return f"{int(seconds)}s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}m"
+    return f"{int(seconds // 3600)}h"
+
+
+def sla_status(deadline: float, now: float) -> str:
+    if deadline < now:
+        return "breached"
+    if deadline - now < SLA_WARNING_SECONDS:
+        return "warning"
+    return "on_track"
+
+
+class LiveQueue:
+    """
+    PDR live queue fed by ACC decision events.
+
+    PASS decisions go into a deadline-ordered DispatchScheduler. The releaser
+    dispatches the most urgent lines in batches, re-scores the whole queue
+    periodically and snapshots it to PostgreSQL so a restart resumes it. Each
+    worker process snapshots only its own lines, and restored lines are
+    claimed by one worker, so no line is dispatched twice.
+    Dispatched lines are persisted to pdr_table and published as pdr.dispatch
+    events for ARL.
+    """
+
+    def __init__(self, bus, release_batch_size: int = 50, history: int = 500,
+                 rail_stats: Optional[Callable[[], Dict[str, Dict[str, float]]]] = None,
+                 sla_seconds: float = 900, rescore_interval: float = 120, snapshot_interval: float = 30):
+        self.bus = bus
+        self.release_batch_size = release_batch_size
+        self.rail_stats = rail_stats
+        self.rescore_interval = rescore_interval
+        self.snapshot_interval = snapshot_interval
+        self.scheduler = DispatchScheduler(sla_seconds=sla_seconds, rail_stats=rail_stats)
+        self.dispatched = deque(maxlen=history)
+        self.decisions_seen = 0
+        self.decisions_passed = 0
+        self.last_release_at: Optional[float] = None
+        self.last_snapshot_at: Optional[float] = None
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+
+    def accept(self, event: Dict[str, Any]):
+        """Consumer callback for acc.decisions"""
+        with self._lock:
+            self.decisions_seen += 1
+            if event.get("decision") != "PASS":
+                return
+            self.decisions_passed += 1
+        self.scheduler.enqueue({**event, "queued_at": time.time()})
+
+    def release(self, max_lines: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Route, persist and dispatch the most urgent pending lines"""
+        batch = self.scheduler.pop_due(max_lines or self.release_batch_size)
+        self.last_release_at = time.time()
+        if not batch:
+            return []
+
+        routed = route_lines(batch, rail_stats=self.rail_stats() if self.rail_stats else None)
+        save_pdr_results(routed)
+
+        dispatched = []
+        for line, output in zip(batch, routed):
+            output["queued_at"] = line["queued_at"]
+            output["amount"] = line.get("amount")
+            if output["status"] == "AWAITING_WINDOW":
+                # Every eligible rail closed since the last re-score; wait for the next window
+                self.scheduler.enqueue(line, output)
+                continue
+            if output["status"] == "ROUTED":
+                output["status"] = "DISPATCHED"
+                self.bus.publish(TOPIC_PDR_DISPATCH, output["batch_id"], {"event": "pdr.dispatch", **output})
+            dispatched.append(output)
+
+        self.scheduler.record_release(len(dispatched))
+        with self._lock:
+            self.dispatched.extend(dispatched)
+        return dispatched
+
+    def save_snapshot(self, release: bool = False) -> bool:
+        """Snapshot this worker's queue; release=True (on shutdown) hands it to the next worker to claim"""
+        self.last_snapshot_at = time.time()
+        return save_queue_snapshot(self.owner, self.scheduler.export(), release=release)
+
+    def restore_snapshot(self) -> int:
+        """Take over released lines and those of workers that stopped snapshotting"""
+        stale_before = datetime.utcnow() - timedelta(seconds=self.snapshot_interval * STALE_SNAPSHOTS)
+        lines = claim_queue_snapshot(stale_before)
+        if lines:
+            self.scheduler.restore(lines)
+            print(f"♻️  Restored {len(lines)} pending PDR lines from snapshot")
+        return len(lines)
+
+    def run_releaser(self, interval: float, stop: threading.Event):
+        while not stop.wait(interval):
+            now = time.time()
+            try:
+                if self.scheduler.last_rescore_at is None or now - self.scheduler.last_rescore_at >= self.rescore_interval:
+                    self.scheduler.rescore()
+                self.release()
+                if self.last_snapshot_at is None or now - self.last_snapshot_at >= self.snapshot_interval:
+                    self.restore_snapshot()
+                    self.save_snapshot()
+            except Exception as e:
+                print(f"❌ Error releasing PDR queue: {e}")
+
+    def snapshot(self, limit: int = 20) -> Dict[str, Any]:
+        """Live queue view in the /pdr/live-queue response shape"""
+        now = time.time()
+        with self._lock:
+            dispatched = list(self.dispatched)[-limit:]
+            seen, passed = self.decisions_seen, self.decisions_passed
+
+        metrics = self.scheduler.metrics()
+        in_queue = metrics["depth"]
+        release_queue = min(in_queue, self.release_batch_size)
+        next_release = self.scheduler.peek(min(release_queue, limit))
+        pending = self.scheduler.peek(limit, offset=release_queue)
+
+        last_rescore = self.scheduler.last_rescore_at
+        next_rescore = (last_rescore or now) + self.rescore_interval
+        previous_depth = self.scheduler.depth_at_last_rescore
+
+        return {
+            "queue_metrics": {
+                "in_queue": in_queue,
+                "release_queue": release_queue,
+                "success_rate": round(passed / seen * 100, 1) if seen else 0.0,
+                "queue_change_percent": round((in_queue - previous_depth) / previous_depth * 100, 1) if previous_depth else 0.0,
+                "rescore_in_minutes": max(0, round((next_rescore - now) / 60)),
+                "dispatched": len(self.dispatched),
+                "last_release_at": datetime.utcfromtimestamp(self.last_release_at).isoformat() if self.last_release_at else None,
+                **metrics
+            },
+            "pending_payments": [
+                {
+                    "id": line["line_id"],
+                    "amount": format_inr(line.get("amount") or 0),
+                    "rail_candidate": line["plan"]["rail_selected"] or "-",
+                    "next_action": "Route" if line["plan"]["status"] == "ROUTED" else "Await window",
+                    "age": format_age(now - line["queued_at"]),
+                    "sla_status": sla_status(line["deadline"], now)
+                }
+                for line in pending
+            ],
+            "release_queue_payments": [
+                {
+                    "id": line["line_id"],
+                    "amount": format_inr(line.get("amount") or 0),
+                    "selected_rail": line["plan"]["rail_selected"],
+                    "rescore_at": datetime.fromtimestamp(next_rescore).strftime("%H:%M:%S"),
+                    "shift_possible": "Yes" if line["plan"]["fallbacks"] else "No",
+                    "age": format_age(now - line["queued_at"])
+                }
+                for line in next_release
+            ],
+            "dispatched_payments": [
+                {
+                    "id": line["line_id"],
+                    "amount": format_inr(line.get("expected_amount") or 0),
+                    "rail": line["rail_selected"],
+                    "utr": line["expected_utr"],
+                    "status": line["status"].title(),
+                    "time": line["created_at"].strftime("%H:%M:%S")
+                }
+                for line in reversed(dispatched)
+            ]
+        }
@@ -0,0 +1,284 @@
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from database import engine, rail_outcomes_since, save_rail_outcomes
+from routing_engine import RAILS, DEFAULT_RAIL_STATS
+
+# Pseudo-observations of the prior, so a handful of outcomes cannot swing routing
+PRIOR_WEIGHT = 20
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+class SlidingCounter:
+    """Success/total counts over a sliding time window kept in a fixed ring of buckets"""
+
+    def __init__(self, buckets: int, bucket_seconds: int):
+        self.bucket_seconds = bucket_seconds
+        self._epochs = [-1] * buckets
+        self._success = [0] * buckets
+        self._total = [0] * buckets
+
+    def _slot(self, epoch: int) -> int:
+        slot = epoch % len(self._epochs)
+        if self._epochs[slot] != epoch:
+            self._epochs[slot] = epoch
+            self._success[slot] = 0
+            self._total[slot] = 0
+        return slot
+
+    def add(self, success: bool, ts: float, now: float) -> bool:
+        """Count a sample; samples outside [now - window, now] are dropped so they cannot reset a live bucket"""
+        epoch = int(ts // self.bucket_seconds)
+        current = int(now // self.bucket_seconds)
+        if epoch > current or epoch <= current - len(self._epochs):
+            return False
+        slot = self._slot(epoch)
+        self._total[slot] += 1
+        self._success[slot] += int(success)
+        return True
+
+    def _live(self, now: float):
+        oldest = int(now // self.bucket_seconds) - len(self._epochs) + 1
+        return [i for i, epoch in enumerate(self._epochs) if epoch >= oldest]
+
+    def totals(self, now: float):
+        live = self._live(now)
+        return sum(self._success[i] for i in live), sum(self._total[i] for i in live)
+
+    def peak(self, now: float) -> int:
+        return max((self._total[i] for i in self._live(now)), default=0)
+
+
+class LogHistogram:
+    """
+    HDR-style latency histogram: fixed log-spaced buckets with ~2% relative
+    error between 1ms and 10 minutes, so quantiles cost O(1) memory.
+    """
+
+    def __init__(self, min_value: float = 0.001, max_value: float = 600.0, precision: float = 0.02):
+        self.min_value = min_value
+        self._log_base = math.log1p(precision)
+        self._counts = [0] * (int(math.log(max_value / min_value) / self._log_base) + 2)
+        self.count = 0
+
+    def add(self, value: float):
+        index = 0 if value <= self.min_value else int(math.log(value / self.min_value) / self._log_base) + 1
+        self._counts[min(index, len(self._counts) - 1)] += 1
+        self.count += 1
+
+    def clear(self):
+        self._counts = [0] * len(self._counts)
+        self.count = 0
+
+    def merge(self, other: "LogHistogram"):
+        self._counts = [a + b for a, b in zip(self._counts, other._counts)]
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen > rank:
+                return self.min_value * math.exp(self._log_base * index)
+        return self.min_value * math.exp(self._log_base * (len(self._counts) - 1))
+
+
+class SlidingHistogram:
+    """Latency histogram over a sliding time window: a ring of LogHistograms merged on read"""
+
+    def __init__(self, buckets: int, bucket_seconds: int):
+        self.bucket_seconds = bucket_seconds
+        self._epochs = [-1] * buckets
+        self._histograms = [LogHistogram() for _ in range(buckets)]
+
+    def add(self, value: float, ts: float, now: float) -> bool:
+        epoch = int(ts // self.bucket_seconds)
+        current = int(now // self.bucket_seconds)
+        if epoch > current or epoch <= current - len(self._epochs):
+            return False
+        slot = epoch % len(self._epochs)
+        if self._epochs[slot] != epoch:
+            self._epochs[slot] = epoch
+            self._histograms[slot].clear()
+        self._histograms[slot].add(value)
+        return True
+
+    def window(self, now: float) -> LogHistogram:
+        oldest = int(now // self.bucket_seconds) - len(self._epochs) + 1
+        merged = LogHistogram()
+        for epoch, histogram in zip(self._epochs, self._histograms):
+            if epoch >= oldest and histogram.count:
+                merged.merge(histogram)
+        return merged
+
+
+class RailStatistics:
+    def __init__(self, rail: str, ewma_alpha: float):
+        self.rail = rail
+        self.ewma_alpha = ewma_alpha
+        self.recent = SlidingCounter(buckets=60, bucket_seconds=10)
+        self.daily = SlidingCounter(buckets=24, bucket_seconds=3600)
+        self.latency = SlidingHistogram(buckets=24, bucket_seconds=3600)
+        self.ewma_latency: Optional[float] = None
+        self.total = 0
+        self.failures = 0
+        self.last_updated: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_error_time: Optional[float] = None
+
+    def record(self, success: bool, latency_seconds: Optional[float], ts: float, now: float, error: Optional[str]):
+        self.recent.add(success, ts, now)
+        self.daily.add(success, ts, now)
+        self.total += 1
+        if latency_seconds is not None:
+            self.latency.add(latency_seconds, ts, now)
+            if self.ewma_latency is None:
+                self.ewma_latency = latency_seconds
+            else:
+                self.ewma_latency += self.ewma_alpha * (latency_seconds - self.ewma_latency)
+        if not success:
+            self.failures += 1
+            self.last_error = error or "Dispatch failed"
+            self.last_error_time = ts
+        self.last_updated = max(self.last_updated or ts, ts)
+
+
+class RailStatsEngine:
+    """
+    Streaming per-rail dispatch statistics.
+
+    Keeps a 10-minute sliding success rate, a 24-hour hourly success/volume
+    window, an EWMA of latency and a 24-hour log-bucketed latency histogram
+    per rail. Sample timestamps in the future are clamped to now; samples
+    older than a window only count towards the windows that still cover them.
+    Memory is constant per rail regardless of traffic.
+
+    With a database, outcomes are not kept per process: report() stores them
+    in pdr_rail_outcomes and every worker folds in new rows, together with
+    ARL's reconciliation results for routed lines, on each refresh(), so all
+    workers route on and report the same statistics.
+    """
+
+    def __init__(self, rails: List[str] = RAILS, ewma_alpha: float = 0.2, window_hours: int = 24):
+        self._rails = {rail: RailStatistics(rail, ewma_alpha) for rail in rails}
+        self._lock = threading.Lock()
+        self.window_hours = window_hours
+        self.watermarks = {"outcomes": 0, "recon": 0}
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+
+    def record(self, rail: str, success: bool, latency_seconds: Optional[float] = None,
+               ts: Optional[float] = None, error: Optional[str] = None) -> bool:
+        stats = self._rails.get(rail.split("@")[0].upper())
+        if stats is None:
+            return False
+        now = time.time()
+        ts = now if ts is None else min(ts, now)
+        with self._lock:
+            stats.record(success, latency_seconds, ts, now, error)
+        return True
+
+    def report(self, outcomes: List[Dict[str, Any]]) -> int:
+        """
+        Record outcomes ({rail, success, latency_seconds, ts, error}) for every
+        worker; returns how many named a known rail
+        """
+        known = [o for o in outcomes if o["rail"].split("@")[0].upper() in self._rails]
+        if engine is None:
+            return sum(self.record(o["rail"], o["success"], o.get("latency_seconds"), o.get("ts"), o.get("error"))
+                       for o in known)
+        now = time.time()
+        save_rail_outcomes([
+            {
+                "rail": o["rail"].split("@")[0].upper(),
+                "success": o["success"],
+                "latency_seconds": o.get("latency_seconds"),
+                "error": o.get("error"),
+                "outcome_at": datetime.utcfromtimestamp(min(o["ts"], now) if o.get("ts") is not None else now)
+            }
+            for o in known
+        ])
+        self.refresh()
+        return len(known)
+
+    def refresh(self):
+        """Fold in the outcomes stored since the last refresh"""
+        with self._refresh_lock:
+            since = datetime.utcnow() - timedelta(hours=self.window_hours)
+            rows, self.watermarks = rail_outcomes_since(self.watermarks, since)
+            for row in rows:
+                ts = row["outcome_at"].replace(tzinfo=timezone.utc).timestamp()
+                self.record(row["rail"], row["success"], row["latency_seconds"], ts, row["error"])
+        return len(rows)
+
+    def _run_refresher(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"❌ Error refreshing rail statistics: {e}")
+
+    def start(self, interval: float = 2.0):
+        """Load the last window of outcomes, then follow new ones (database mode only)"""
+        if engine is None or self._refresher is not None:
+            return
+        loaded = self.refresh()
+        self._refresher = threading.Thread(target=self._run_refresher, args=(interval,), daemon=True,
+                                           name="pdr-rail-stats")
+        self._refresher.start()
+        print(f"✅ PDR rail statistics loaded from {loaded} outcomes, refreshed every {interval}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def routing_stats(self) -> Dict[str, Dict[str, float]]:
+        """Success rate and latency per rail for the routing engine, blended with the priors"""
+        now = time.time()
+        result = {}
+        with self._lock:
+            for rail, stats in self._rails.items():
+                prior = DEFAULT_RAIL_STATS[rail]
+                success, total = stats.recent.totals(now)
+                result[rail] = {
+                    "success_rate": (success + prior["success_rate"] * PRIOR_WEIGHT) / (total + PRIOR_WEIGHT),
+                    "latency_seconds": stats.ewma_latency if stats.ewma_latency is not None else prior["latency_seconds"]
+                }
+        return result
+
+    def summary(self, rail: str) -> Optional[Dict[str, Any]]:
+        stats = self._rails.get(rail.upper())
+        if stats is None:
+            return None
+        now = time.time()
+        blended = self.routing_stats()[stats.rail]
+        with self._lock:
+            _, recent_total = stats.recent.totals(now)
+            daily_success, daily_total = stats.daily.totals(now)
+            latency = stats.latency.window(now)
+            return {
+                "rail_name": stats.rail,
+                "success_rate": round(blended["success_rate"] * 100, 2),
+                "uptime_percentage": round(daily_success / daily_total * 100, 2) if daily_total else None,
+                "avg_response_time": round(blended["latency_seconds"], 3),
+                "latency_p50": _round(latency.quantile(0.50)),
+                "latency_p95": _round(latency.quantile(0.95)),
+                "latency_p99": _round(latency.quantile(0.99)),
+                "error_count_24h": daily_total - daily_success,
+                "last_error": stats.last_error or "None",
+                "last_error_time": datetime.utcfromtimestamp(stats.last_error_time).isoformat() if stats.last_error_time else None,
+                "current_load": round(recent_total / 10, 1),
+                "peak_load_24h": round(stats.daily.peak(now) / 60, 1),
+                "samples_10m": recent_total,
+                "samples_total": stats.total,
+                "last_updated": datetime.utcfromtimestamp(stats.last_updated).isoformat() if stats.last_updated else None
+            }
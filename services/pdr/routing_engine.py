@@ -0,0 +1,183 @@
+import hashlib
+import os
+from datetime import datetime, time as dtime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+RAILS = ["IMPS", "NEFT", "RTGS", "UPI"]
+
+# Static rail rules. Cut-off windows are in IST; None means the rail runs 24x7.
+RAIL_CONFIG = {
+    "IMPS": {"min_amount": 1, "max_amount": 500000, "fee_fixed": 5.0, "fee_bps": 0.0, "window": None, "settle_minutes": 1},
+    "NEFT": {"min_amount": 1, "max_amount": float("inf"), "fee_fixed": 2.5, "fee_bps": 0.0, "window": ("08:00", "19:00"), "settle_minutes": 30},
+    "RTGS": {"min_amount": 200000, "max_amount": float("inf"), "fee_fixed": 25.0, "fee_bps": 0.0, "window": ("07:00", "18:00"), "settle_minutes": 5},
+    "UPI": {"min_amount": 1, "max_amount": 100000, "fee_fixed": 0.0, "fee_bps": 0.0, "window": None, "settle_minutes": 1},
+}
+
+# Priors used until the rail statistics have seen real dispatch outcomes
+DEFAULT_RAIL_STATS = {
+    "IMPS": {"success_rate": 0.985, "latency_seconds": 0.8},
+    "NEFT": {"success_rate": 0.921, "latency_seconds": 1.2},
+    "RTGS": {"success_rate": 0.992, "latency_seconds": 0.5},
+    "UPI": {"success_rate": 0.975, "latency_seconds": 0.6},
+}
+
+# Score weights: success probability dominates, then latency, then fees
+WEIGHT_SUCCESS = 100.0
+WEIGHT_LATENCY = 2.0
+WEIGHT_FEE_BPS = 0.5
+PREFERRED_RAIL_BONUS = 1.0
+CLOSING_SOON_PENALTY = 5.0
+
+SPONSOR_BANK = os.getenv("PDR_SPONSOR_BANK", "HDFC")
+
+
+def expected_utr_for(line_id: str) -> str:
+    """Deterministic UTR reference so ARL can match the bank response back to the line"""
+    return "UTR" + hashlib.sha1(line_id.encode("utf-8")).hexdigest()[:13].upper()
+
+
+def _parse_hhmm(value: str) -> dtime:
+    hours, minutes = value.split(":")
+    return dtime(int(hours), int(minutes))
+
+
+def minutes_to_cutoff(rail: str, now: datetime) -> Optional[float]:
+    """Minutes until the rail's window closes; None for 24x7 rails, <= 0 when closed"""
+    window = RAIL_CONFIG[rail]["window"]
+    if window is None:
+        return None
+    now = now.astimezone(IST)
+    start, end = _parse_hhmm(window[0]), _parse_hhmm(window[1])
+    if not (start <= now.time() < end):
+        return 0.0
+    close = now.replace(hour=end.hour, minute=end.minute, second=0, microsecond=0)
+    return (close - now).total_seconds() / 60
+
+
+def rail_schedule(rail: str, now: datetime):
+    """
+    (opens_at, dispatch_by) for the rail's current or next window.
+
+    dispatch_by leaves the rail's settlement time before the cut-off; both are
+    None for 24x7 rails.
+    """
+    window = RAIL_CONFIG[rail]["window"]
+    if window is None:
+        return None, None
+    now = now.astimezone(IST)
+    start, end = _parse_hhmm(window[0]), _parse_hhmm(window[1])
+    opens = now.replace(hour=start.hour, minute=start.minute, second=0, microsecond=0)
+    closes = now.replace(hour=end.hour, minute=end.minute, second=0, microsecond=0)
+    if now >= closes:
+        opens, closes = opens + timedelta(days=1), closes + timedelta(days=1)
+    return max(opens, now), closes - timedelta(minutes=RAIL_CONFIG[rail]["settle_minutes"])
+
+
+def rail_window_state(now: Optional[datetime] = None):
+    """Per-rail open flags and minutes-to-cutoff arrays for a point in time"""
+    now = now or datetime.now(IST)
+    open_now = np.ones(len(RAILS), dtype=bool)
+    remaining = np.full(len(RAILS), np.inf)
+    for j, rail in enumerate(RAILS):
+        minutes = minutes_to_cutoff(rail, now)
+        if minutes is not None:
+            open_now[j] = minutes > 0
+            remaining[j] = minutes
+    return open_now, remaining
+
+
+def score_matrix(amounts: np.ndarray, preferred: np.ndarray, rail_stats: Dict[str, Dict[str, float]],
+                 now: Optional[datetime] = None):
+    """
+    Score every (line, rail) pair at once.
+
+    amounts: (n,) float array; preferred: (n,) int array of rail indices (-1 = none).
+    Returns (scores, open_now): an (n, len(RAILS)) array with -inf where the
+    amount is outside a rail's limits, and the (len(RAILS),) open-window mask.
+    """
+    min_amount = np.array([RAIL_CONFIG[r]["min_amount"] for r in RAILS], dtype=float)
+    max_amount = np.array([RAIL_CONFIG[r]["max_amount"] for r in RAILS], dtype=float)
+    fee_fixed = np.array([RAIL_CONFIG[r]["fee_fixed"] for r in RAILS], dtype=float)
+    fee_bps = np.array([RAIL_CONFIG[r]["fee_bps"] for r in RAILS], dtype=float)
+    settle = np.array([RAIL_CONFIG[r]["settle_minutes"] for r in RAILS], dtype=float)
+    success = np.array([rail_stats.get(r, DEFAULT_RAIL_STATS[r])["success_rate"] for r in RAILS], dtype=float)
+    latency = np.array([rail_stats.get(r, DEFAULT_RAIL_STATS[r])["latency_seconds"] for r in RAILS], dtype=float)
+    open_now, remaining = rail_window_state(now)
+
+    a = amounts[:, None]
+    eligible = (a >= min_amount) & (a <= max_amount)
+
+    # Fee expressed in basis points of the amount so small and large lines compare fairly
+    fee_cost_bps = (fee_fixed / np.maximum(a, 1.0)) * 1e4 + fee_bps
+    scores = WEIGHT_SUCCESS * success - WEIGHT_LATENCY * latency - WEIGHT_FEE_BPS * np.minimum(fee_cost_bps, 100.0)
+    scores = scores - CLOSING_SOON_PENALTY * (open_now & (remaining < 2 * settle))
+    scores = scores + PREFERRED_RAIL_BONUS * (preferred[:, None] == np.arange(len(RAILS)))
+
+    return np.where(eligible, scores, -np.inf), open_now
+
+
+def _rank(scores: np.ndarray) -> np.ndarray:
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.where(np.isfinite(np.take_along_axis(scores, order, axis=1)), order, -1)
+
+
+def route_batch(amounts: np.ndarray, preferred: np.ndarray, rail_stats: Optional[Dict[str, Dict[str, float]]] = None,
+                now: Optional[datetime] = None, max_fallbacks: int = 2):
+    """
+    Pick the best rail and ranked fallbacks for every line.
+
+    Returns (selected, fallbacks, waiting): selected is (n,) rail indices (-1
+    when the amount fits no rail), fallbacks is (n, max_fallbacks) with -1
+    padding, and waiting flags lines whose only eligible rails are outside
+    their cut-off window right now (they are ranked ignoring the window).
+    """
+    scores, open_now = score_matrix(amounts, preferred, rail_stats or DEFAULT_RAIL_STATS, now)
+    ranked_open = _rank(np.where(open_now, scores, -np.inf))
+    waiting = ranked_open[:, 0] < 0
+    ranked = ranked_open
+    if waiting.any():
+        ranked = ranked_open.copy()
+        ranked[waiting] = _rank(scores[waiting])
+        waiting &= ranked[:, 0] >= 0
+    return ranked[:, 0], ranked[:, 1:1 + max_fallbacks], waiting
+
+
+def route_lines(lines: List[Dict[str, Any]], batch_id: Optional[str] = None,
+                rail_stats: Optional[Dict[str, Dict[str, float]]] = None, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Route a batch of lines ({line_id, amount, currency, method, batch_id}) into pdr_table rows"""
+    if not lines:
+        return []
+    rail_index = {rail: j for j, rail in enumerate(RAILS)}
+    n = len(lines)
+    amounts = np.fromiter((float(line.get("amount") or 0) for line in lines), dtype=float, count=n)
+    preferred = np.fromiter((rail_index.get((line.get("method") or "").upper(), -1) for line in lines), dtype=np.int64, count=n)
+    # Only INR lines can go over domestic rails
+    inr = np.fromiter(((line.get("currency") or "INR").upper() == "INR" for line in lines), dtype=bool, count=n)
+    amounts = np.where(inr, amounts, -1.0)
+
+    selected, fallbacks, waiting = route_batch(amounts, preferred, rail_stats, now)
+    labels = [f"{rail}@{SPONSOR_BANK}" for rail in RAILS]
+    alt_keys = ["alt"] + [f"alt{k + 2}" for k in range(fallbacks.shape[1] - 1)]
+    status = np.where(selected < 0, "UNROUTABLE", np.where(waiting, "AWAITING_WINDOW", "ROUTED")).tolist()
+    created_at = (now or datetime.now(IST)).astimezone(timezone.utc).replace(tzinfo=None)
+    default_batch = batch_id or f"BATCH-{created_at.strftime('%Y%m%d')}"
+
+    results = []
+    for line, rail, alts, line_status in zip(lines, selected.tolist(), fallbacks.tolist(), status):
+        line_id = line["line_id"]
+        results.append({
+            "line_id": line_id,
+            "batch_id": line.get("batch_id") or default_batch,
+            "rail_selected": labels[rail] if rail >= 0 else None,
+            "fallbacks": {key: labels[j] for key, j in zip(alt_keys, alts) if j >= 0},
+            "expected_amount": float(line.get("amount") or 0),
+            "expected_currency": line.get("currency") or "INR",
+            "expected_utr": expected_utr_for(line_id) if rail >= 0 else None,
+            "status": line_status,
+            "created_at": created_at
+        })
+    return results
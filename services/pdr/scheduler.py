@@ -0,0 +1,192 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from routing_engine import IST, rail_schedule, route_lines
+
+THROUGHPUT_WINDOW_SECONDS = 300
+
+
+def _rail_of(plan: Dict[str, Any]) -> Optional[str]:
+    return plan["rail_selected"].split("@")[0] if plan.get("rail_selected") else None
+
+
+class DispatchScheduler:
+    """
+    Min-heaps of pending PDR lines keyed by dispatch deadline.
+
+    A line's deadline is the earlier of its SLA deadline and the last moment it
+    can go out on its selected rail before the cut-off, but never earlier than
+    the rail's window opening. Lines wait in a heap keyed by window opening and
+    move to the ready heap (keyed by deadline) once it has passed, so lines on
+    closed rails are never scanned by pop_due. Each line crosses over once and
+    replaced entries are invalidated lazily, so enqueue and dequeue stay
+    O(log n); rescore() re-routes every pending line in one vectorised pass and
+    rebuilds the heaps in O(n).
+    """
+
+    def __init__(self, sla_seconds: float = 900,
+                 rail_stats: Optional[Callable[[], Dict[str, Dict[str, float]]]] = None):
+        self.sla_seconds = sla_seconds
+        self.rail_stats = rail_stats
+        self._waiting: List[tuple] = []  # (not_before, seq, entry)
+        self._ready: List[tuple] = []    # (key, seq, entry) for lines whose window is open
+        self._entries: Dict[str, list] = {}
+        self._seq = itertools.count()
+        self._released = deque()
+        self._lock = threading.Lock()
+        self.rail_shifts = 0
+        self.last_rescore_at: Optional[float] = None
+        self.depth_at_last_rescore = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _stats(self):
+        return self.rail_stats() if self.rail_stats else None
+
+    def _entry(self, line: Dict[str, Any], plan: Dict[str, Any], now: datetime) -> list:
+        deadline = line["queued_at"] + self.sla_seconds
+        not_before = now.timestamp()
+        rail = _rail_of(plan)
+        if rail:
+            opens_at, dispatch_by = rail_schedule(rail, now)
+            if dispatch_by is not None:
+                deadline = min(deadline, dispatch_by.timestamp())
+                not_before = opens_at.timestamp()
+        # [key, seq, line_id, deadline, not_before, line, plan, valid]
+        return [max(deadline, not_before), next(self._seq), line["line_id"], deadline, not_before, line, plan, True]
+
+    def _push(self, entry: list):
+        previous = self._entries.get(entry[2])
+        if previous is not None:
+            previous[7] = False
+        self._entries[entry[2]] = entry
+        heapq.heappush(self._waiting, (entry[4], entry[1], entry))
+
+    def _rebuild(self):
+        """Put every live entry back in the waiting heap; pop_due promotes the open ones"""
+        self._waiting = [(entry[4], entry[1], entry) for entry in self._entries.values()]
+        self._ready = []
+        heapq.heapify(self._waiting)
+
+    def _promote(self, now_ts: float):
+        """Move lines whose rail window has opened to the ready heap"""
+        while self._waiting and self._waiting[0][0] <= now_ts:
+            entry = heapq.heappop(self._waiting)[2]
+            if entry[7]:
+                heapq.heappush(self._ready, (entry[0], entry[1], entry))
+
+    def enqueue(self, line: Dict[str, Any], plan: Optional[Dict[str, Any]] = None, now: Optional[datetime] = None):
+        """Add or replace a line; plan is its routing_engine row (routed here if omitted)"""
+        now = now or datetime.now(IST)
+        line.setdefault("queued_at", time.time())
+        plan = plan or route_lines([line], rail_stats=self._stats(), now=now)[0]
+        with self._lock:
+            self._push(self._entry(line, plan, now))
+
+    def remove(self, line_id: str) -> bool:
+        with self._lock:
+            entry = self._entries.pop(line_id, None)
+            if entry is None:
+                return False
+            entry[7] = False
+            return True
+
+    def pop_due(self, max_lines: int, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Pop up to max_lines lines in deadline order, skipping lines whose rail has not opened yet"""
+        now_ts = (now or datetime.now(IST)).timestamp()
+        batch = []
+        with self._lock:
+            self._promote(now_ts)
+            while self._ready and len(batch) < max_lines:
+                entry = heapq.heappop(self._ready)[2]
+                if not entry[7]:
+                    continue
+                del self._entries[entry[2]]
+                batch.append(entry[5])
+        return batch
+
+    def peek(self, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        """Pending lines in deadline order with their current plan, without removing them"""
+        with self._lock:
+            entries = heapq.nsmallest(offset + limit, self._entries.values())[offset:]
+        return [{**entry[5], "plan": entry[6], "deadline": entry[3], "not_before": entry[4]} for entry in entries]
+
+    def record_release(self, count: int):
+        now = time.time()
+        with self._lock:
+            self._released.append((now, count))
+            while self._released and self._released[0][0] < now - THROUGHPUT_WINDOW_SECONDS:
+                self._released.popleft()
+
+    def rescore(self, now: Optional[datetime] = None) -> int:
+        """Re-route every pending line against current rail windows and stats; returns rail shifts"""
+        now = now or datetime.now(IST)
+        with self._lock:
+            entries = list(self._entries.values())
+        plans = route_lines([entry[5] for entry in entries], rail_stats=self._stats(), now=now)
+
+        with self._lock:
+            shifts = 0
+            for old, plan in zip(entries, plans):
+                # Skip lines released or replaced while routing ran outside the lock
+                if self._entries.get(old[2]) is not old:
+                    continue
+                if _rail_of(plan) != _rail_of(old[6]):
+                    shifts += 1
+                old[7] = False
+                self._entries[old[2]] = self._entry(old[5], plan, now)
+            self._rebuild()
+            self.rail_shifts += shifts
+            self.last_rescore_at = time.time()
+            self.depth_at_last_rescore = len(self._entries)
+        return shifts
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            ages = np.fromiter((now - entry[5]["queued_at"] for entry in self._entries.values()), dtype=float)
+            deadlines = np.fromiter((entry[3] for entry in self._entries.values()), dtype=float)
+            released = sum(count for ts, count in self._released if ts >= now - THROUGHPUT_WINDOW_SECONDS)
+        p50, p90, p99 = np.percentile(ages, [50, 90, 99]).tolist() if ages.size else (0.0, 0.0, 0.0)
+        return {
+            "depth": int(ages.size),
+            "age_p50_seconds": round(p50, 1),
+            "age_p90_seconds": round(p90, 1),
+            "age_p99_seconds": round(p99, 1),
+            "oldest_age_seconds": round(float(ages.max()), 1) if ages.size else 0.0,
+            "sla_breached": int((deadlines < now).sum()),
+            "throughput_per_minute": round(released / (THROUGHPUT_WINDOW_SECONDS / 60), 1),
+            "rail_shifts": self.rail_shifts
+        }
+
+    def export(self) -> List[Dict[str, Any]]:
+        """Rows for the pdr_queue snapshot table"""
+        with self._lock:
+            entries = list(self._entries.values())
+        return [
+            {
+                "line_id": entry[2],
+                "payload": entry[5],
+                "rail_selected": entry[6].get("rail_selected"),
+                "deadline": datetime.utcfromtimestamp(entry[3]),
+                "queued_at": datetime.utcfromtimestamp(entry[5]["queued_at"])
+            }
+            for entry in entries
+        ]
+
+    def restore(self, lines: List[Dict[str, Any]], now: Optional[datetime] = None):
+        """Reload snapshot lines, keeping their original queued_at, and route them in one pass"""
+        now = now or datetime.now(IST)
+        plans = route_lines(lines, rail_stats=self._stats(), now=now)
+        with self._lock:
+            for line, plan in zip(lines, plans):
+                self._entries[line["line_id"]] = self._entry(line, plan, now)
+            self._rebuild()
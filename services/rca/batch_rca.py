@@ -0,0 +1,165 @@
+"""
+Batch RCA: one analysis per failure signature instead of one per line.
+
+The exception lines of a batch (ACC, PDR or ARL status EXCEPTION/FAIL) are
+grouped by signature: the ACC policy violations, the ARL exception or match
+reason, and the rail. Lines that failed the same way share a root cause, so
+each cluster is analysed once from a few representative lines and the
+result is fanned back out to an rca_table row per line.
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+FAILED_STATUSES = {"EXCEPTION", "FAIL", "FAILED"}
+SAMPLE_LINES = 5
+MAX_TEXT = 300
+
+_NUMBERS = re.compile(r"\d+(?:\.\d+)?")
+
+
+def _get(record: Optional[Dict[str, Any]], name: str) -> Any:
+    return record.get(name) if record else None
+
+
+def is_exception(line: Dict[str, Any]) -> bool:
+    return any(
+        str(_get(line.get(source), field) or "").upper() in FAILED_STATUSES
+        for source, field in (("acc", "status"), ("pdr", "status"), ("arl", "match_status"))
+    )
+
+
+def decision_reasons(acc: Optional[Dict[str, Any]]) -> List[str]:
+    """ACC policy violation messages (stored as a JSON list, or plain text on older rows)"""
+    reason = _get(acc, "decision_reason")
+    if not reason:
+        return []
+    try:
+        items = json.loads(reason)
+    except (TypeError, ValueError):
+        items = [reason]
+    if not isinstance(items, list):
+        items = [items]
+    return [str(item).strip() for item in items if item]
+
+
+def violations(acc: Optional[Dict[str, Any]]) -> Tuple[str, ...]:
+    """ACC policy violations, with amounts and ids folded so they cluster"""
+    return tuple(sorted({_NUMBERS.sub("#", item) for item in decision_reasons(acc)}))
+
+
+def arl_reason(arl: Optional[Dict[str, Any]]) -> Optional[str]:
+    metadata = _get(arl, "metadata_info")
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            metadata = None
+    exception = metadata.get("exception") if isinstance(metadata, dict) else None
+    return exception or _get(arl, "match_reason")
+
+
+def signature(line: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "acc_violations": list(violations(line.get("acc"))),
+        "arl_reason": arl_reason(line.get("arl")),
+        "rail": _get(line.get("pdr"), "rail_selected")
+    }
+
+
+def cluster(lines: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Exception lines grouped by signature, largest cluster first"""
+    clusters: Dict[str, Dict[str, Any]] = {}
+    for line_id in sorted(lines):
+        line = lines[line_id]
+        if not is_exception(line):
+            continue
+        sig = signature(line)
+        key = json.dumps(sig, sort_keys=True)
+        clusters.setdefault(key, {"signature": sig, "line_ids": []})["line_ids"].append(line_id)
+    return sorted(clusters.values(), key=lambda c: (-len(c["line_ids"]), c["line_ids"][0]))
+
+
+def _json_text(value: Any) -> Optional[str]:
+    # asyncpg hands json columns back as text
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, default=str)
+
+
+def _text(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > MAX_TEXT:
+        return value[:MAX_TEXT - 1] + "…"
+    return value
+
+
+def sample(lines: Dict[str, Dict[str, Any]], line_ids: List[str]) -> List[Dict[str, Any]]:
+    """Compact view of the first few lines of a cluster for the prompt"""
+    rows = []
+    for line_id in line_ids[:SAMPLE_LINES]:
+        line = lines[line_id]
+        acc, pdr, arl, redis = (line.get(source) or {} for source in ("acc", "pdr", "arl", "redis"))
+        rows.append({
+            "line_id": line_id,
+            "acc_status": acc.get("status"),
+            "amount": pdr.get("expected_amount", acc.get("amount")),
+            "currency": pdr.get("expected_currency"),
+            "pdr_status": pdr.get("status"),
+            "utr": pdr.get("expected_utr") or arl.get("utr"),
+            "match_status": arl.get("match_status"),
+            "system_health": _text(_json_text(redis.get("system_health")))
+        })
+    return rows
+
+
+def cluster_prompt(batch_id: str, query: str, cluster_: Dict[str, Any], lines: Dict[str, Dict[str, Any]]) -> str:
+    line_ids = cluster_["line_ids"]
+    return f"""
+You are a Senior Payment Systems Root Cause Analysis Specialist with expertise in RBI guidelines and banking regulations.
+{len(line_ids)} payment lines in batch {batch_id} failed with the same signature. Analyse them as one incident,
+based ONLY on the data provided.
+
+User Query: {query}
+
+FAILURE SIGNATURE:
+{json.dumps(cluster_["signature"], indent=2)}
+
+REPRESENTATIVE LINES ({min(len(line_ids), SAMPLE_LINES)} of {len(line_ids)}):
+{json.dumps(sample(lines, line_ids), indent=2, default=str)}
+
+Please provide your analysis in the following JSON format:
+{{
+  "root_cause": "Concrete, factual root cause shared by these lines, with the technical mechanism and relevant RBI guidelines.",
+  "failure_category": "Technical|Regulatory|Operational|Risk-based",
+  "recommended_action": "Step-wise numbered recommendations with BANK/SENDER/RECEIVER fault attribution."
+}}
+
+IMPORTANT: Return ONLY the JSON object, no additional text or explanations.
+"""
+
+
+def fan_out(batch_id: str, cluster_: Dict[str, Any], analysis: Dict[str, Any], lines: Dict[str, Dict[str, Any]],
+            created_at: str) -> List[Dict[str, Any]]:
+    """One rca_table row per line of an analysed cluster; rca_ids are assigned when the rows are saved"""
+    # Same storage shape as single-line RCA: structured fields become JSON text
+    analysis = {key: json.dumps(value) if isinstance(value, (dict, list)) else value for key, value in analysis.items()}
+    rows = []
+    for line_id in cluster_["line_ids"]:
+        line = lines[line_id]
+        rows.append({
+            "line_id": line_id,
+            "batch_id": batch_id,
+            "root_cause": analysis.get("root_cause"),
+            "failure_category": analysis.get("failure_category"),
+            "recommended_action": analysis.get("recommended_action"),
+            "evidence_refs": {
+                "batch_rca": True,
+                "cluster_signature": cluster_["signature"],
+                "cluster_size": len(cluster_["line_ids"]),
+                "acc_decision_reason": _get(line.get("acc"), "decision_reason"),
+                "acc_evidence_ref": _get(line.get("acc"), "evidence_ref"),
+                "arl_match_reason": _get(line.get("arl"), "match_reason")
+            },
+            "created_at": created_at
+        })
+    return rows
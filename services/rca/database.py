@@ -0,0 +1,161 @@
+"""
+asyncpg access for the RCA service.
+
+One pool lives for the whole application instead of a connection per call.
+asyncpg prepares each statement once per pooled connection and reuses it from
+its statement cache, and executemany runs its prepared INSERT for all rows in
+one round trip. A line's ACC, PDR, ARL and Redis rows (the latest of each)
+come back from a single query, and the same query takes many line_ids at once.
+rca_table.rca_id is UNIQUE, so ids are drawn from the rca_id_seq sequence
+rather than made up by each request.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ("acc", "pdr", "arl", "redis")
+
+# Latest row of every source table for each k.line_id; a missing row comes back as NULL
+_LATEST_ROWS = """
+    LEFT JOIN LATERAL (SELECT * FROM acc_agent t WHERE t.line_id = k.line_id ORDER BY t.id DESC LIMIT 1) acc ON true
+    LEFT JOIN LATERAL (SELECT * FROM pdr_table t WHERE t.line_id = k.line_id ORDER BY t.id DESC LIMIT 1) pdr ON true
+    LEFT JOIN LATERAL (SELECT * FROM arl_table t WHERE t.line_id = k.line_id ORDER BY t.id DESC LIMIT 1) arl ON true
+    LEFT JOIN LATERAL (SELECT * FROM redis_table t WHERE t.line_id = k.line_id ORDER BY t.id DESC LIMIT 1) redis ON true
+"""
+_SELECT = "SELECT k.line_id, to_jsonb(acc) AS acc, to_jsonb(pdr) AS pdr, to_jsonb(arl) AS arl, to_jsonb(redis) AS redis"
+
+LINES_SQL = f"{_SELECT} FROM unnest($1::text[]) AS k(line_id) {_LATEST_ROWS}"
+BATCH_SQL = f"{_SELECT} FROM (SELECT DISTINCT line_id FROM pdr_table WHERE batch_id = $1) k {_LATEST_ROWS}"
+
+INSERT_RCA_SQL = """
+    INSERT INTO rca_table (rca_id, line_id, batch_id, root_cause, failure_category, recommended_action, evidence_refs, created_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+"""
+
+RCA_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS rca_table (
+    id SERIAL PRIMARY KEY,
+    rca_id INTEGER UNIQUE,
+    line_id VARCHAR(50),
+    batch_id VARCHAR(100),
+    root_cause TEXT,
+    failure_category VARCHAR(100),
+    recommended_action TEXT,
+    evidence_refs JSON,
+    created_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ix_rca_table_line_id ON rca_table (line_id, id);
+CREATE SEQUENCE IF NOT EXISTS rca_id_seq AS integer;
+-- Start past the ids stored before the sequence existed
+SELECT setval('rca_id_seq', m) FROM (SELECT max(rca_id) AS m FROM rca_table) stored
+WHERE m >= (SELECT last_value FROM rca_id_seq);
+"""
+
+NEXT_RCA_IDS_SQL = "SELECT nextval('rca_id_seq')::integer AS rca_id FROM generate_series(1, $1)"
+
+_pool: Optional[asyncpg.Pool] = None
+_pool_lock = asyncio.Lock()
+_schema_ready = False
+
+
+async def init_pool() -> asyncpg.Pool:
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            # Read here rather than at import, after the service has loaded its .env
+            min_size = int(os.getenv("RCA_DB_POOL_MIN", "1"))
+            max_size = int(os.getenv("RCA_DB_POOL_MAX", "10"))
+            _pool = await asyncpg.create_pool(
+                os.getenv("DATABASE_URL"),
+                min_size=min_size,
+                max_size=max_size,
+                statement_cache_size=int(os.getenv("RCA_DB_STATEMENT_CACHE", "100"))
+            )
+            logger.info(f"Database pool ready ({min_size}-{max_size} connections).")
+    return _pool
+
+
+async def get_pool() -> asyncpg.Pool:
+    """The application pool, created on first use if startup has not done it yet"""
+    return _pool if _pool is not None else await init_pool()
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def ensure_rca_schema():
+    """rca_table and its id sequence, created once per process"""
+    global _schema_ready
+    if not _schema_ready:
+        pool = await get_pool()
+        await pool.execute(RCA_SCHEMA_SQL)
+        _schema_ready = True
+
+
+async def next_rca_ids(count: int) -> List[int]:
+    """Reserve count unused rca_ids"""
+    if count <= 0:
+        return []
+    await ensure_rca_schema()
+    pool = await get_pool()
+    return [row["rca_id"] for row in await pool.fetch(NEXT_RCA_IDS_SQL, count)]
+
+
+def _lines(rows) -> Dict[str, Dict[str, Optional[Dict[str, Any]]]]:
+    # asyncpg returns jsonb as text
+    return {
+        row["line_id"]: {source: json.loads(row[source]) if row[source] is not None else None for source in SOURCES}
+        for row in rows
+    }
+
+
+async def fetch_lines(line_ids: Iterable[str]) -> Dict[str, Dict[str, Optional[Dict[str, Any]]]]:
+    """{line_id: {source: latest row or None}} for many lines in one round trip"""
+    line_ids = list(dict.fromkeys(line_ids))
+    if not line_ids:
+        return {}
+    pool = await get_pool()
+    return _lines(await pool.fetch(LINES_SQL, line_ids))
+
+
+async def fetch_line(line_id: str) -> Dict[str, Optional[Dict[str, Any]]]:
+    return (await fetch_lines([line_id]))[line_id]
+
+
+async def fetch_batch(batch_id: str) -> Dict[str, Dict[str, Optional[Dict[str, Any]]]]:
+    """Every line of a batch (by pdr_table.batch_id) with its rows, in one round trip"""
+    pool = await get_pool()
+    return _lines(await pool.fetch(BATCH_SQL, batch_id))
+
+
+def _rca_args(rca: Dict[str, Any]) -> tuple:
+    return (
+        rca["rca_id"],
+        rca["line_id"],
+        rca["batch_id"],
+        rca["root_cause"],
+        rca["failure_category"],
+        rca["recommended_action"],
+        json.dumps(rca["evidence_refs"], default=str),
+        datetime.fromisoformat(rca["created_at"])
+    )
+
+
+async def save_rca_results(rows: List[Dict[str, Any]]) -> List[int]:
+    """Insert the rows (all or none) and return their stored rca_ids"""
+    if not rows:
+        return []
+    pool = await get_pool()
+    await pool.executemany(INSERT_RCA_SQL, [_rca_args(row) for row in rows])
+    return [row["rca_id"] for row in rows]
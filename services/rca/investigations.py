@@ -0,0 +1,374 @@
+"""
+Persistent RCA investigations.
+
+An investigation is one queued RCA for a line, stored in rca_investigations
+and linked to its rca_table row once analysed. Listing is paginated and every
+filter (status, priority, line_id) is served by an index. Workers claim
+queued investigations highest priority first under FOR UPDATE SKIP LOCKED,
+so several service instances can share the queue; an investigation is
+cancelled in the table and, when it is running in this process, its task is
+cancelled too. Leases left RUNNING by a crashed instance go back to QUEUED
+on the next poll cycle of any running instance.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import database
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"high": 1, "medium": 2, "low": 3}
+PRIORITY_NAMES = {value: name for name, value in PRIORITIES.items()}
+STATUSES = ("QUEUED", "RUNNING", "COMPLETED", "FAILED", "CANCELLED")
+OPEN_STATUSES = ("QUEUED", "RUNNING")
+THROUGHPUT_WINDOW_SECONDS = 300
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS rca_investigations (
+    id BIGSERIAL PRIMARY KEY,
+    investigation_id VARCHAR(40) NOT NULL UNIQUE,
+    line_id VARCHAR(50) NOT NULL,
+    query TEXT NOT NULL,
+    deep BOOLEAN NOT NULL DEFAULT false,
+    status VARCHAR(20) NOT NULL,  -- QUEUED / RUNNING / COMPLETED / FAILED / CANCELLED
+    priority SMALLINT NOT NULL,   -- 1 high, 2 medium, 3 low
+    attempts INTEGER NOT NULL DEFAULT 0,
+    assigned_to VARCHAR(100),
+    rca_id INTEGER,
+    error TEXT,
+    cancel_reason TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT (now() at time zone 'utc'),
+    updated_at TIMESTAMP NOT NULL DEFAULT (now() at time zone 'utc'),
+    started_at TIMESTAMP,
+    completed_at TIMESTAMP
+);
+-- Queue claim (status, priority order) and listing by status/priority, newest first
+CREATE INDEX IF NOT EXISTS ix_rca_investigations_status ON rca_investigations (status, priority, id);
+CREATE INDEX IF NOT EXISTS ix_rca_investigations_priority ON rca_investigations (priority, id);
+CREATE INDEX IF NOT EXISTS ix_rca_investigations_line_id ON rca_investigations (line_id, id);
+"""
+
+_NOW = "(now() at time zone 'utc')"
+
+_COLUMNS = """
+    i.*, r.root_cause, r.failure_category, r.recommended_action, pdr.expected_amount, pdr.expected_currency
+"""
+_JOINS = """
+    LEFT JOIN rca_table r ON r.rca_id = i.rca_id
+    LEFT JOIN LATERAL (
+        SELECT expected_amount, expected_currency FROM pdr_table p WHERE p.line_id = i.line_id ORDER BY p.id DESC LIMIT 1
+    ) pdr ON true
+"""
+
+CLAIM_SQL = f"""
+    UPDATE rca_investigations
+    SET status = 'RUNNING', attempts = attempts + 1, assigned_to = $1, started_at = {_NOW}, updated_at = {_NOW}
+    WHERE id = (
+        SELECT id FROM rca_investigations WHERE status = 'QUEUED' ORDER BY priority, id LIMIT 1 FOR UPDATE SKIP LOCKED
+    )
+    RETURNING *
+"""
+
+
+def _record(row) -> Dict[str, Any]:
+    """API shape of an investigation row (with its RCA when joined)"""
+    item = dict(row)
+    amount = item.pop("expected_amount", None)
+    currency = item.pop("expected_currency", None)
+    item.pop("id", None)
+    started, completed = item.get("started_at"), item.get("completed_at")
+    return {
+        **{key: value.isoformat() if isinstance(value, datetime) else value for key, value in item.items()},
+        "priority": PRIORITY_NAMES.get(item["priority"], item["priority"]),
+        "transaction_id": item["line_id"],
+        "primary_cause": item.get("failure_category"),
+        "amount": f"{currency or 'INR'} {float(amount):,.2f}" if amount is not None else None,
+        "duration_seconds": round((completed - started).total_seconds(), 3) if started and completed else None
+    }
+
+
+async def ensure_schema():
+    await database.ensure_rca_schema()
+    pool = await database.get_pool()
+    await pool.execute(SCHEMA_SQL)
+
+
+async def submit(line_id: str, query: str, priority: str = "medium", deep: bool = False) -> Dict[str, Any]:
+    if priority not in PRIORITIES:
+        raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+    investigation_id = f"INV-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    pool = await database.get_pool()
+    row = await pool.fetchrow(
+        "INSERT INTO rca_investigations (investigation_id, line_id, query, deep, status, priority) "
+        "VALUES ($1, $2, $3, $4, 'QUEUED', $5) RETURNING *",
+        investigation_id, line_id, query, deep, PRIORITIES[priority]
+    )
+    return _record(row)
+
+
+async def get(investigation_id: str) -> Optional[Dict[str, Any]]:
+    pool = await database.get_pool()
+    row = await pool.fetchrow(f"SELECT {_COLUMNS} FROM rca_investigations i {_JOINS} WHERE i.investigation_id = $1",
+                              investigation_id)
+    return _record(row) if row else None
+
+
+async def list_investigations(status: Optional[str] = None, priority: Optional[str] = None, line_id: Optional[str] = None,
+                              offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+    """One page of investigations, newest first, with the total matching the filters"""
+    clauses, args = [], []
+    if status:
+        args.append([value.strip().upper() for value in status.split(",")])
+        clauses.append(f"i.status = ANY(${len(args)}::text[])")
+    if priority:
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+        args.append(PRIORITIES[priority])
+        clauses.append(f"i.priority = ${len(args)}")
+    if line_id:
+        args.append(line_id)
+        clauses.append(f"i.line_id = ${len(args)}")
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    pool = await database.get_pool()
+    async with pool.acquire() as conn:
+        total = await conn.fetchval(f"SELECT count(*) FROM rca_investigations i {where}", *args)
+        rows = await conn.fetch(
+            f"SELECT {_COLUMNS} FROM rca_investigations i {_JOINS} {where} "
+            f"ORDER BY i.id DESC OFFSET ${len(args) + 1} LIMIT ${len(args) + 2}",
+            *args, offset, limit
+        )
+    return {"total": total, "offset": offset, "limit": limit, "investigations": [_record(row) for row in rows]}
+
+
+async def cause_categories() -> List[Dict[str, Any]]:
+    """Failure categories of completed investigations, largest first"""
+    pool = await database.get_pool()
+    rows = await pool.fetch(
+        "SELECT r.failure_category AS category, count(*) AS count FROM rca_investigations i "
+        "JOIN rca_table r ON r.rca_id = i.rca_id WHERE i.status = 'COMPLETED' "
+        "GROUP BY r.failure_category ORDER BY count DESC"
+    )
+    total = sum(row["count"] for row in rows)
+    return [
+        {"category": row["category"], "count": row["count"], "percentage": round(row["count"] / total * 100, 1)}
+        for row in rows
+    ]
+
+
+async def retry(investigation_id: str) -> Optional[Dict[str, Any]]:
+    """Queue a finished, failed or cancelled investigation again; None if it does not exist or is still open"""
+    pool = await database.get_pool()
+    row = await pool.fetchrow(
+        f"UPDATE rca_investigations SET status = 'QUEUED', error = NULL, cancel_reason = NULL, assigned_to = NULL, "
+        f"started_at = NULL, completed_at = NULL, updated_at = {_NOW} "
+        f"WHERE investigation_id = $1 AND status <> ALL($2::text[]) RETURNING *",
+        investigation_id, list(OPEN_STATUSES)
+    )
+    return _record(row) if row else None
+
+
+async def cancel(investigation_id: str, reason: str) -> Optional[Dict[str, Any]]:
+    """Mark a queued or running investigation CANCELLED; None if it does not exist or already finished"""
+    pool = await database.get_pool()
+    row = await pool.fetchrow(
+        f"UPDATE rca_investigations SET status = 'CANCELLED', cancel_reason = $2, completed_at = {_NOW}, "
+        f"updated_at = {_NOW} WHERE investigation_id = $1 AND status = ANY($3::text[]) RETURNING *",
+        investigation_id, reason, list(OPEN_STATUSES)
+    )
+    return _record(row) if row else None
+
+
+async def status_counts() -> Dict[str, Any]:
+    pool = await database.get_pool()
+    rows = await pool.fetch("SELECT status, count(*) AS count FROM rca_investigations GROUP BY status")
+    oldest = await pool.fetchval(
+        f"SELECT extract(epoch FROM {_NOW} - min(created_at)) FROM rca_investigations WHERE status = 'QUEUED'"
+    )
+    counts = {status: 0 for status in STATUSES}
+    counts.update({row["status"]: row["count"] for row in rows})
+    return {"by_status": counts, "oldest_queued_age_seconds": round(float(oldest), 1) if oldest is not None else 0.0}
+
+
+class InvestigationWorkerPool:
+    """
+    Async workers draining rca_investigations.
+
+    Each worker claims one investigation at a time and awaits run(investigation),
+    which returns the stored RCA. The row becomes COMPLETED, linked to the
+    rca_id that was stored, or FAILED when the analysis or its save failed,
+    and only if it is still RUNNING under the same claim (attempts is bumped
+    on every claim), so a cancel from any instance, or a retry or lease
+    expiry that re-queued it, wins over a late result.
+    """
+
+    def __init__(self, run: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]], workers: int = 4,
+                 poll_interval: float = 1.0, lease_seconds: int = 600):
+        self.run = run
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.counters = {"completed": 0, "failed": 0, "cancelled": 0}
+        self._completed = deque()
+        self._durations = deque(maxlen=1000)
+        self._running: Dict[str, asyncio.Task] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._ready = False
+        self._ready_lock: Optional[asyncio.Lock] = None
+        self._leases_checked_at = 0.0
+        self._stopping = False
+
+    def start(self):
+        if self._tasks or self.workers <= 0:
+            return
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._ready_lock = asyncio.Lock()
+        # assigned_to names the process too: every instance runs rca-worker-0..N
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks = [asyncio.create_task(self._worker(f"{owner}:rca-worker-{i}")) for i in range(self.workers)]
+        logger.info(f"Started {self.workers} investigation workers.")
+
+    async def stop(self):
+        """Stop the workers; investigations they were running go back to the queue"""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle workers after a submit instead of waiting for the next poll"""
+        if self._wake is not None:
+            self._wake.set()
+
+    def cancel_local(self, investigation_id: str) -> bool:
+        task = self._running.get(investigation_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    async def _prepare(self):
+        async with self._ready_lock:
+            if self._ready:
+                return
+            await ensure_schema()
+            self._ready = True
+
+    async def _check_leases(self):
+        """Release expired leases once per poll interval, whichever worker gets here first"""
+        now = time.monotonic()
+        if now - self._leases_checked_at < self.poll_interval:
+            return
+        self._leases_checked_at = now
+        await self.release_expired_leases()
+
+    async def release_expired_leases(self):
+        """Return investigations leased by a crashed instance to the queue"""
+        pool = await database.get_pool()
+        released = await pool.execute(
+            f"UPDATE rca_investigations SET status = 'QUEUED', assigned_to = NULL, started_at = NULL, updated_at = {_NOW} "
+            f"WHERE status = 'RUNNING' AND started_at < {_NOW} - make_interval(secs => $1)",
+            self.lease_seconds
+        )
+        count = int(released.split()[-1])
+        if count:
+            logger.info(f"Re-queued {count} investigations with expired leases.")
+
+    async def _finish(self, investigation: Dict[str, Any], status: str, rca_id: Optional[int] = None,
+                      error: Optional[str] = None):
+        pool = await database.get_pool()
+        await pool.execute(
+            f"UPDATE rca_investigations SET status = $2, rca_id = $3, error = $4, completed_at = {_NOW}, "
+            f"updated_at = {_NOW} WHERE id = $1 AND status = 'RUNNING' AND attempts = $5",
+            investigation["id"], status, rca_id, error, investigation["attempts"]
+        )
+
+    async def _requeue(self, investigation: Dict[str, Any]):
+        pool = await database.get_pool()
+        await pool.execute(
+            f"UPDATE rca_investigations SET status = 'QUEUED', assigned_to = NULL, started_at = NULL, "
+            f"updated_at = {_NOW} WHERE id = $1 AND status = 'RUNNING' AND attempts = $2",
+            investigation["id"], investigation["attempts"]
+        )
+
+    async def _idle(self):
+        try:
+            await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    async def _execute(self, investigation: Dict[str, Any]):
+        investigation_id = investigation["investigation_id"]
+        started = time.perf_counter()
+        task = asyncio.create_task(self.run(investigation))
+        self._running[investigation_id] = task
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if self._stopping:
+                await asyncio.shield(self._requeue(investigation))
+                raise
+            # Cancelled through cancel(): the row is already CANCELLED
+            self.counters["cancelled"] += 1
+            logger.info(f"Investigation {investigation_id} cancelled while running.")
+            return
+        except Exception as e:
+            self.counters["failed"] += 1
+            logger.warning(f"Investigation {investigation_id} failed: {e}")
+            await self._finish(investigation, "FAILED", error=str(e))
+            return
+        finally:
+            self._running.pop(investigation_id, None)
+
+        # A result that was not stored has no rca_table row to link to
+        error = result.get("error") or result.get("save_error")
+        if error or result.get("rca_id") is None:
+            self.counters["failed"] += 1
+            await self._finish(investigation, "FAILED", error=error or "RCA result was not saved")
+            return
+        await self._finish(investigation, "COMPLETED", rca_id=result["rca_id"])
+        self.counters["completed"] += 1
+        self._completed.append(time.time())
+        self._durations.append(time.perf_counter() - started)
+
+    async def _worker(self, name: str):
+        while True:
+            try:
+                await self._prepare()
+                await self._check_leases()
+                pool = await database.get_pool()
+                row = await pool.fetchrow(CLAIM_SQL, name)
+                if row is None:
+                    await self._idle()
+                    continue
+                await self._execute(dict(row))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Investigation worker {name} error: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        while self._completed and self._completed[0] < now - THROUGHPUT_WINDOW_SECONDS:
+            self._completed.popleft()
+        durations = sorted(self._durations)
+        return {
+            "workers": len(self._tasks),
+            "running": len(self._running),
+            "throughput_per_minute": round(len(self._completed) / (THROUGHPUT_WINDOW_SECONDS / 60), 1),
+            "duration_p50_seconds": round(durations[len(durations) // 2], 3) if durations else 0.0,
+            "duration_max_seconds": round(durations[-1], 3) if durations else 0.0,
+            **self.counters
+        }
\ No newline at end of file
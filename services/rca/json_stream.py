@@ -0,0 +1,88 @@
+"""
+Incremental parser for the JSON object the RCA prompt asks the LLM for.
+
+Chunks are fed as they stream in. Every top-level field is reported as soon
+as its value is complete, so root_cause or failure_category can be shown
+before the model has finished the rest of the object. Text before the first
+"{" (prose, a ```json fence) is skipped, as is anything after the closing
+brace.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.start: Optional[int] = None
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.key: Optional[str] = None
+        self.key_start: Optional[int] = None
+        self.value_start: Optional[int] = None
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk; returns the top-level (key, value) pairs it completed"""
+        completed = []
+        if self.done:
+            return completed
+        self.buffer += chunk
+        while self.pos < len(self.buffer) and not self.done:
+            char = self.buffer[self.pos]
+            if self.start is None:
+                if char == "{":
+                    self.start, self.depth = self.pos, 1
+            elif self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.key_start is not None:
+                        self.key = json.loads(self.buffer[self.key_start:self.pos + 1])
+                        self.key_start = None
+            elif char == '"':
+                self.in_string = True
+                if self.depth == 1 and self.key is None:
+                    self.key_start = self.pos
+            elif char == ":" and self.depth == 1 and self.value_start is None:
+                self.value_start = self.pos + 1
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]" or (char == "," and self.depth == 1):
+                if char != ",":
+                    self.depth -= 1
+                if char == "," or self.depth == 0:
+                    completed.extend(self._close_value())
+                if self.depth == 0:
+                    self.done = True
+            self.pos += 1
+        return completed
+
+    def _close_value(self) -> List[Tuple[str, Any]]:
+        if self.key is None or self.value_start is None:
+            return []
+        raw = self.buffer[self.value_start:self.pos].strip(WHITESPACE)
+        key, self.key, self.value_start = self.key, None, None
+        self.fields[key] = value = json.loads(raw)
+        return [(key, value)]
+
+    def result(self) -> Dict[str, Any]:
+        """The whole object; ValueError if the stream ended before it was closed"""
+        if not self.done:
+            raise ValueError("JSON object is incomplete")
+        return json.loads(self.buffer[self.start:self.pos])
+
+
+def parse_json_output(text: str) -> Dict[str, Any]:
+    """First JSON object in a complete LLM response"""
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    return parser.result()
@@ -1,12 +1,20 @@
 import os
-import asyncpg
+import asyncio
 import logging
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
+from fastapi.responses import StreamingResponse
 from datetime import datetime
 import json
+from contextlib import aclosing
 from dotenv import load_dotenv
+from arealis_events import get_event_bus, TOPIC_ARL_EXCEPTIONS
+import database
+import investigations
+from batch_rca import cluster, cluster_prompt, fan_out, is_exception, sample
+from json_stream import IncrementalJSONParser, parse_json_output
+from arealis_llm import ResponseCache, cache_key, get_llm_client
+from rca_rules import classify
 
 # Load environment variables
 load_dotenv()
@@ -19,14 +27,22 @@ logger = logging.getLogger(__name__)
 DATABASE_URL = os.getenv("DATABASE_URL")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-if not DATABASE_URL or not OPENAI_API_KEY:
+# The local stub backend (LLM_BACKEND=stub) needs no API key
+if not DATABASE_URL or (not OPENAI_API_KEY and os.getenv("LLM_BACKEND", "openai") != "stub"):
     logger.error("Environment variables DATABASE_URL or OPENAI_API_KEY are missing.")
     raise ValueError("Missing required environment variables.")
 
-# Initialize OpenAI client and FastAPI
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Initialize the async LLM client and FastAPI (OPENAI_BASE_URL points it at e.g. scripts/mock_llm_server.py)
+llm = get_llm_client()
+MODEL = "gpt-4"
 app = FastAPI()
 
+# Bump whenever the RCA prompt changes so cached answers to the old prompt are not reused
+PROMPT_VERSION = "rca-1"
+
+# LLM answers keyed on (query, line data, prompt version); new line data means a new key
+llm_cache = ResponseCache()
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -79,150 +95,196 @@ class MockRedisData:
             "current_status": "PROCESSING"
         }
 
-# Fetch data from DB
+def _snapshot(record):
+    """Plain dict of a database row or mock object, for hashing"""
+    if record is None:
+        return None
+    return dict(record) if hasattr(record, "keys") else vars(record)
+
+# Fetch data from DB: the latest ACC, PDR, ARL and Redis rows in one pooled round trip
 async def fetch_all_data(line_id):
     logger.info(f"Fetching data for line_id: {line_id}")
     try:
-        conn = await asyncpg.connect(DATABASE_URL)
-        acc = await conn.fetchrow("SELECT * FROM acc_agent WHERE line_id = $1", line_id)
-        pdr = await conn.fetchrow("SELECT * FROM pdr_table WHERE line_id = $1", line_id)
-        arl = await conn.fetchrow("SELECT * FROM arl_table WHERE line_id = $1", line_id)  # Optional
-        redis = await conn.fetchrow("SELECT * FROM redis_table WHERE line_id = $1", line_id)
-        await conn.close()
+        line = await database.fetch_line(line_id)
         logger.info("Data fetched successfully.")
-        return acc, pdr, arl, redis
+        return line["acc"], line["pdr"], line["arl"], line["redis"]
     except Exception as e:
         logger.exception("Failed to fetch data from database.")
         raise
 
-# Save RCA results to DB
+# Save RCA results to DB; returns the stored rca_id
 async def save_rca_result(rca_dict):
     logger.info(f"Saving RCA result for rca_id: {rca_dict['rca_id']}")
     try:
-        conn = await asyncpg.connect(DATABASE_URL)
-        await conn.execute("""
-            INSERT INTO rca_table (rca_id, line_id, batch_id, root_cause, failure_category, recommended_action, evidence_refs, created_at)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-        """,
-        rca_dict["rca_id"],
-        rca_dict["line_id"],
-        rca_dict["batch_id"],
-        rca_dict["root_cause"],
-        rca_dict["failure_category"],
-        rca_dict["recommended_action"],
-        json.dumps(rca_dict["evidence_refs"]),
-        datetime.fromisoformat(rca_dict["created_at"])  # <-- FIXED here
-        )
-        await conn.close()
+        (rca_id,) = await database.save_rca_results([rca_dict])
         logger.info("RCA result saved successfully.")
+        return rca_id
     except Exception as e:
         logger.exception("Failed to save RCA result.")
         raise
 
+# Fetch every line of a batch with its ACC, PDR, ARL and Redis records
+async def fetch_batch_data(batch_id):
+    logger.info(f"Fetching batch data for batch_id: {batch_id}")
+    lines = await database.fetch_batch(batch_id)
+    logger.info(f"Fetched {len(lines)} lines for batch {batch_id}.")
+    return lines
+
+# Save many RCA results in one round trip
+async def save_rca_results(rows):
+    saved = await database.save_rca_results(rows)
+    logger.info(f"Saved {len(saved)} RCA results.")
+    return saved
+
+# Queued investigations are executed as regular RCAs by the worker pool (see investigations.py)
+async def run_investigation(investigation):
+    return await rca_agent(line_id=investigation["line_id"], query=investigation["query"], deep=investigation["deep"])
+
+investigation_workers = investigations.InvestigationWorkerPool(
+    run_investigation,
+    workers=int(os.getenv("RCA_INVESTIGATION_WORKERS", "4")),
+    poll_interval=float(os.getenv("RCA_INVESTIGATION_POLL_SECONDS", "1")),
+    lease_seconds=int(os.getenv("RCA_INVESTIGATION_LEASE_SECONDS", "600"))
+)
+
+# Reconciliation exceptions streamed from ARL (disabled unless the event bus is configured)
+event_bus = get_event_bus()
+
+@app.on_event("startup")
+async def startup_event():
+    try:
+        await database.init_pool()
+        await investigations.ensure_schema()
+    except Exception as e:
+        # Requests create the pool on first use once the database is reachable
+        logger.warning(f"Database pool not created at startup: {e}")
+    investigation_workers.start()
+    if not event_bus.enabled:
+        return
+    loop = asyncio.get_running_loop()
+
+    def handle_exception(event):
+        reason = event.get("exception") or event.get("match_reason") or "reconciliation exception"
+        query = f"Automatic RCA for reconciliation exception: {reason}"
+        # Block the consumer until the analysis is done so a partition is worked in order
+        asyncio.run_coroutine_threadsafe(rca_agent(line_id=event["line_id"], query=query, deep=False), loop).result()
+
+    for _ in range(int(os.getenv("RCA_CONSUMERS", "1"))):
+        event_bus.subscribe(TOPIC_ARL_EXCEPTIONS, "rca", handle_exception)
+    logger.info("RCA consuming arl.exceptions")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    event_bus.close()
+    await investigation_workers.stop()
+    await llm.close()
+    await database.close_pool()
+
 # RCA endpoints
 @app.get("/")
 async def read_root():
-    return {"message": "RCA Agent Service", "status": "running"}
+    return {"message": "RCA Agent Service", "status": "running", "llm_cache": llm_cache.stats(), "llm": llm.stats()}
+
+@app.post("/rca/investigations")
+async def create_investigation(line_id: str = Body(...), query: str = Body("Root cause analysis of the failed line"),
+                               priority: str = Body("medium"), deep: bool = Body(False)):
+    """Queue an RCA investigation for the worker pool"""
+    try:
+        investigation = await investigations.submit(line_id, query, priority=priority, deep=deep)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    investigation_workers.notify()
+    return {"success": True, "data": investigation}
 
 @app.get("/rca/investigations")
-async def get_investigations():
-    # Placeholder for investigation data
+async def get_investigations(status: str = None, priority: str = None, line_id: str = None, offset: int = 0, limit: int = 50):
+    """Investigations newest first, filtered by status (comma-separated), priority or line_id"""
+    limit = max(1, min(limit, 500))
+    try:
+        page = await investigations.list_investigations(status, priority, line_id, offset=max(0, offset), limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
         "success": True,
         "data": {
-            "active_investigations": [
-                {
-                    "investigation_id": "INV-001",
-                    "transaction_id": "TXN-12345",
-                    "status": "in_progress",
-                    "priority": "high",
-                    "assigned_to": "RCA Team",
-                    "created_at": "2025-01-06T10:00:00Z",
-                    "root_cause": "Payment routing failure",
-                    "failure_category": "Technical",
-                    "primary_cause": "Technical",
-                    "amount": "₹25,000",
-                    "next_step": "Retry"
-                },
-                {
-                    "investigation_id": "INV-002", 
-                    "transaction_id": "TXN-12346",
-                    "status": "completed",
-                    "priority": "medium",
-                    "assigned_to": "RCA Team",
-                    "created_at": "2025-01-06T09:30:00Z",
-                    "root_cause": "Compliance check failure",
-                    "failure_category": "Regulatory",
-                    "primary_cause": "Regulatory",
-                    "amount": "₹15,000",
-                    "next_step": "Request Info"
-                },
-                {
-                    "investigation_id": "INV-003",
-                    "transaction_id": "TXN-12347",
-                    "status": "pending",
-                    "priority": "low",
-                    "assigned_to": "RCA Team",
-                    "created_at": "2025-01-06T11:00:00Z",
-                    "root_cause": "System timeout during processing",
-                    "failure_category": "Operational",
-                    "primary_cause": "Operational",
-                    "amount": "₹45,000",
-                    "next_step": "Retry"
-                },
-                {
-                    "investigation_id": "INV-004",
-                    "transaction_id": "TXN-12348",
-                    "status": "in_progress",
-                    "priority": "high",
-                    "assigned_to": "RCA Team",
-                    "created_at": "2025-01-06T11:30:00Z",
-                    "root_cause": "High risk transaction flagged",
-                    "failure_category": "Risk-based",
-                    "primary_cause": "Risk-based",
-                    "amount": "₹100,000",
-                    "next_step": "Request Info"
-                }
-            ],
-            "cause_categories": [
-                {"category": "Technical", "count": 15, "percentage": 45.5},
-                {"category": "Regulatory", "count": 8, "percentage": 24.2},
-                {"category": "Operational", "count": 7, "percentage": 21.2},
-                {"category": "Risk-based", "count": 3, "percentage": 9.1}
-            ]
+            "active_investigations": page["investigations"],
+            "total": page["total"],
+            "offset": page["offset"],
+            "limit": page["limit"],
+            "cause_categories": await investigations.cause_categories()
         }
     }
 
+@app.get("/rca/investigations/metrics")
+async def get_investigation_metrics():
+    """Queue depth by status, oldest queued age, worker throughput and durations"""
+    counts = await investigations.status_counts()
+    return {
+        "success": True,
+        "data": {"queue_depth": counts["by_status"]["QUEUED"], **counts, "workers": investigation_workers.metrics()}
+    }
+
+@app.get("/rca/investigations/{investigation_id}")
+async def get_investigation(investigation_id: str):
+    investigation = await investigations.get(investigation_id)
+    if not investigation:
+        raise HTTPException(status_code=404, detail="Investigation not found")
+    return {"success": True, "data": investigation}
+
+@app.post("/rca/retry-investigation/{investigation_id}")
+async def retry_investigation(investigation_id: str):
+    """Queue a completed, failed or cancelled investigation again"""
+    investigation = await investigations.retry(investigation_id)
+    if not investigation:
+        if not await investigations.get(investigation_id):
+            raise HTTPException(status_code=404, detail="Investigation not found")
+        return {"success": False, "message": f"Investigation {investigation_id} is already queued or running"}
+    investigation_workers.notify()
+    return {"success": True, "message": f"Investigation {investigation_id} retry initiated", "data": investigation}
+
+@app.post("/rca/cancel-investigation/{investigation_id}")
+async def cancel_investigation(investigation_id: str, reason: str = "Cancelled by user"):
+    """Cancel a queued or running investigation"""
+    investigation = await investigations.cancel(investigation_id, reason)
+    if not investigation:
+        if not await investigations.get(investigation_id):
+            raise HTTPException(status_code=404, detail="Investigation not found")
+        return {"success": False, "message": f"Investigation {investigation_id} has already finished"}
+    # Interrupts the LLM call when this instance is the one running it
+    investigation_workers.cancel_local(investigation_id)
+    return {"success": True, "message": f"Investigation {investigation_id} cancelled", "data": investigation}
+
 @app.options("/rca")
 async def rca_options():
     """Handle CORS preflight requests"""
     return {"message": "OK"}
 
-@app.post("/rca")
-async def rca_agent(line_id: str = Body(...), query: str = Body(...)):
-    logger.info(f"Received RCA request for line_id: {line_id}, query: {query}")
+async def prepare_rca(line_id: str, query: str):
+    """
+    Line data, LLM messages and cache key for one RCA, plus the id and timestamp
+    it will carry and the rule-based result when the line's signals are known
+    """
+    acc, pdr, arl, redis = await fetch_all_data(line_id)
+    # Mock data is only good enough for the LLM demo, not for a deterministic verdict
+    ruled = classify(acc, pdr, arl, redis) if acc and pdr else None
+    if not all([acc, pdr]):
+        logger.warning("Missing required records (acc_agent or pdr_table) in the database. Using mock data for analysis.")
+        # Create mock data for analysis when real data is not available
+        acc = MockAccData(line_id)
+        pdr = MockPdrData(line_id)
+        arl = MockArlData(line_id)
+        redis = MockRedisData(line_id)
     
-    try:
-        acc, pdr, arl, redis = await fetch_all_data(line_id)
-        if not all([acc, pdr]):
-            logger.warning("Missing required records (acc_agent or pdr_table) in the database. Using mock data for analysis.")
-            # Create mock data for analysis when real data is not available
-            acc = MockAccData(line_id)
-            pdr = MockPdrData(line_id)
-            arl = MockArlData(line_id)
-            redis = MockRedisData(line_id)
-        
-        # arl_table is optional - set to None if not found
-        if arl is None:
-            logger.info("No ARL data found for this line_id - proceeding without ARL analysis.")
-
-        # Generate unique RCA ID that fits in int32 range
-        import time
-        import random
-        unique_rca_id = int(time.time()) + random.randint(1, 999)  # Smaller ID that fits in int32
-        
-        # Compose LLM prompt
-        prompt = f"""
+    # arl_table is optional - set to None if not found
+    if arl is None:
+        logger.info("No ARL data found for this line_id - proceeding without ARL analysis.")
+
+    # Reserve the RCA ID from rca_id_seq so concurrent requests and batches never collide
+    unique_rca_id = (await database.next_rca_ids(1))[0]
+    created_at = datetime.utcnow().isoformat()
+    
+    # Compose LLM prompt
+    prompt = f"""
 You are a Senior Payment Systems Root Cause Analysis Specialist with expertise in RBI guidelines and banking regulations. Analyze the provided transaction data and provide concrete, factual analysis based ONLY on the actual data provided.
 
 ANALYSIS PRINCIPLES:
@@ -238,7 +300,7 @@ User Query: {query}
 ACC Agent Decision: {dict(acc)}
 Payment Data Record: {dict(pdr)}
 AML/ARL Screening: {dict(arl) if arl else "No ARL data available"}
-System Health Status: {dict(redis)}
+System Health Status: {dict(redis) if redis else "No system health data available"}
 
 ROOT CAUSE ANALYSIS REQUIREMENTS:
 - Provide a COMPREHENSIVE and DETAILED analysis of the transaction
@@ -278,7 +340,7 @@ Please provide your analysis in the following JSON format:
     "arl_match_reason": "{arl['match_reason'] if arl else 'No ARL data available'}",
     "redis_system_health": {json.dumps(redis['system_health']) if redis else 'null'}
   }},
-  "created_at": "{datetime.utcnow().isoformat()}"
+  "created_at": "{created_at}"
 }}
 
 CRITICAL INSTRUCTIONS:
@@ -290,66 +352,211 @@ CRITICAL INSTRUCTIONS:
 
 IMPORTANT: Return ONLY the JSON object, no additional text or explanations.
 """
-        logger.debug(f"Prompt sent to LLM: {prompt}")
+    logger.debug(f"Prompt sent to LLM: {prompt}")
+
+    messages = [
+        {"role": "system", "content": "You are a Root Cause Analysis agent."},
+        {"role": "user", "content": prompt}
+    ]
+    # rca_id and created_at vary per request, so they stay out of the key and are set in finish_rca
+    line_data = [_snapshot(record) for record in (acc, pdr, arl, redis)]
+    key = cache_key("rca", query, [line_id, line_data], PROMPT_VERSION, MODEL)
+    if ruled is not None:
+        ruled = {"rca_id": unique_rca_id, "line_id": line_id, "batch_id": pdr["batch_id"], **ruled, "created_at": created_at}
+    return messages, key, unique_rca_id, created_at, ruled
+
+async def finish_rca(rca_result, unique_rca_id, created_at):
+    """Stamp the parsed result with this request's id and time, then store it"""
+    rca_result["rca_id"] = unique_rca_id
+    rca_result["created_at"] = created_at
+
+    # Convert complex objects to JSON strings for database storage
+    if isinstance(rca_result.get('root_cause'), dict):
+        rca_result['root_cause'] = json.dumps(rca_result['root_cause'])
+    
+    if isinstance(rca_result.get('recommended_action'), dict):
+        rca_result['recommended_action'] = json.dumps(rca_result['recommended_action'])
 
-        # Send prompt to LLM
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a Root Cause Analysis agent."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0
-        )
+    # Save to database (continue even if save fails, but say so and name no unstored id)
+    try:
+        rca_result["rca_id"] = await save_rca_result(rca_result)
+    except Exception as save_error:
+        logger.warning(f"Failed to save RCA result to database: {save_error}")
+        logger.info("Continuing with response despite save failure.")
+        rca_result["rca_id"] = None
+        rca_result["save_error"] = f"RCA result was not saved: {save_error}"
+    
+    logger.info("RCA processing complete.")
+    return rca_result
+
+@app.post("/rca")
+async def rca_agent(line_id: str = Body(...), query: str = Body(...), deep: bool = Body(False)):
+    """RCA for one line; known failure signals are answered by rules, the rest (or deep=true) by the LLM"""
+    logger.info(f"Received RCA request for line_id: {line_id}, query: {query}")
+    
+    try:
+        messages, key, unique_rca_id, created_at, ruled = await prepare_rca(line_id, query)
+        if ruled is not None and not deep:
+            logger.info(f"Classified by rule {ruled['evidence_refs']['rule']}, no LLM call.")
+            return await finish_rca(ruled, unique_rca_id, created_at)
 
-        output_json = response.choices[0].message.content.strip()
+        # Send prompt to LLM
+        output_json = await llm_cache.aget_or_compute(key, lambda: llm.complete(messages, MODEL), [line_id])
         print(output_json)
         logger.debug(f"Raw LLM output: {output_json}")
 
-        # Parse and validate output - handle cases where LLM returns text before JSON
+        # Parse and validate output - skips any text or code fence around the JSON object
         try:
-            # Try to extract JSON from the response if it's embedded in text
-            if "```json" in output_json:
-                # Extract JSON from markdown code block
-                start = output_json.find("```json") + 7
-                end = output_json.find("```", start)
-                if end != -1:
-                    output_json = output_json[start:end].strip()
-            elif "{" in output_json and "}" in output_json:
-                # Extract JSON object from text
-                start = output_json.find("{")
-                end = output_json.rfind("}") + 1
-                output_json = output_json[start:end]
-            
-            rca_result = json.loads(output_json)
+            rca_result = parse_json_output(output_json)
             logger.info("Successfully parsed LLM response as JSON.")
         except Exception as e:
             logger.error(f"Failed to parse LLM response as JSON. Error: {e}")
             logger.error(f"Raw output: {output_json}")
             return {"error": "LLM did not return valid JSON.", "raw_output": output_json}
 
-        # Convert complex objects to JSON strings for database storage
-        if isinstance(rca_result.get('root_cause'), dict):
-            rca_result['root_cause'] = json.dumps(rca_result['root_cause'])
-        
-        if isinstance(rca_result.get('recommended_action'), dict):
-            rca_result['recommended_action'] = json.dumps(rca_result['recommended_action'])
+        return await finish_rca(rca_result, unique_rca_id, created_at)
+
+    except Exception as e:
+        logger.exception("Unexpected error during RCA processing.")
+        return {"error": "Internal server error."}
 
-        # Save to database (continue even if save fails)
+@app.post("/rca/batch")
+async def rca_batch(batch_id: str = Body(...), query: str = Body("Root cause analysis of the batch's failed lines"),
+                    deep: bool = Body(False)):
+    """
+    RCA for every EXCEPTION/FAIL line of a batch: lines with known failure
+    signals are classified by rules, the rest are clustered by failure
+    signature, each cluster is analysed once, and the result is stored for
+    every line of the cluster. deep=true sends every line to the LLM.
+    """
+    logger.info(f"Received batch RCA request for batch_id: {batch_id}")
+    try:
+        lines = await fetch_batch_data(batch_id)
+        if not lines:
+            return {"error": f"No lines found for batch {batch_id}."}
+        ruled = {}
+        if not deep:
+            for line_id, line in lines.items():
+                if is_exception(line):
+                    result = classify(line["acc"], line["pdr"], line["arl"], line["redis"])
+                    if result is not None:
+                        ruled[line_id] = result
+        clusters = cluster({line_id: line for line_id, line in lines.items() if line_id not in ruled})
+        logger.info(f"{len(ruled)} exception lines classified by rules, "
+                    f"{sum(len(c['line_ids']) for c in clusters)} in {len(clusters)} clusters for the LLM.")
+
+        async def analyse(cluster_):
+            messages = [
+                {"role": "system", "content": "You are a Root Cause Analysis agent."},
+                {"role": "user", "content": cluster_prompt(batch_id, query, cluster_, lines)}
+            ]
+            context = [cluster_["signature"], len(cluster_["line_ids"]), sample(lines, cluster_["line_ids"])]
+            key = cache_key("rca-batch", query, context, PROMPT_VERSION, MODEL)
+            try:
+                output = await llm_cache.aget_or_compute(key, lambda: llm.complete(messages, MODEL), cluster_["line_ids"])
+                return parse_json_output(output)
+            except Exception as e:
+                logger.error(f"Cluster analysis failed for {cluster_['signature']}: {e}")
+                return None
+
+        # Clusters are analysed concurrently, within the LLM client's concurrency limit
+        analyses = await asyncio.gather(*(analyse(cluster_) for cluster_ in clusters))
+
+        created_at = datetime.utcnow().isoformat()
+        rows, report, rules = [], [], {}
+        for line_id in sorted(ruled):
+            rule = ruled[line_id]["evidence_refs"]["rule"]
+            rules[rule] = rules.get(rule, 0) + 1
+            rows.append({"line_id": line_id, "batch_id": batch_id, **ruled[line_id], "created_at": created_at})
+        for cluster_, analysis in zip(clusters, analyses):
+            entry = {"signature": cluster_["signature"], "size": len(cluster_["line_ids"]), "line_ids": cluster_["line_ids"]}
+            if analysis is None:
+                entry["error"] = "LLM did not return valid JSON."
+            else:
+                cluster_rows = fan_out(batch_id, cluster_, analysis, lines, created_at)
+                rows.extend(cluster_rows)
+                entry.update({key: cluster_rows[0][key] for key in ("root_cause", "failure_category", "recommended_action")})
+            report.append(entry)
+
+        saved, save_error = [], None
         try:
-            await save_rca_result(rca_result)
-            logger.info("RCA result saved successfully.")
-        except Exception as save_error:
-            logger.warning(f"Failed to save RCA result to database: {save_error}")
-            logger.info("Continuing with response despite save failure.")
-        
-        logger.info("RCA processing complete.")
-        return rca_result
+            for row, rca_id in zip(rows, await database.next_rca_ids(len(rows))):
+                row["rca_id"] = rca_id
+            saved = await save_rca_results(rows)
+        except Exception as e:
+            logger.warning(f"Failed to save batch RCA results to database: {e}")
+            save_error = f"Batch RCA results were not saved: {e}"
+
+        response = {
+            "batch_id": batch_id,
+            "lines": len(lines),
+            "exception_lines": len(ruled) + sum(entry["size"] for entry in report),
+            "rule_lines": len(ruled),
+            "rules": rules,
+            "llm_calls": len(clusters),
+            "saved": len(saved),
+            "clusters": report
+        }
+        if save_error:
+            response["save_error"] = save_error
+        return response
 
     except Exception as e:
-        logger.exception("Unexpected error during RCA processing.")
+        logger.exception("Unexpected error during batch RCA processing.")
         return {"error": "Internal server error."}
 
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/rca/stream")
+async def rca_stream(line_id: str = Body(...), query: str = Body(...), deep: bool = Body(False)):
+    """
+    Same analysis as /rca, streamed as Server-Sent Events: "token" events with
+    the raw completion text, a "field" event as each top-level JSON field is
+    complete, then "result" with the stored RCA (or "error"). A rule-based
+    result has no tokens, only its fields and the result.
+    """
+    logger.info(f"Received streaming RCA request for line_id: {line_id}, query: {query}")
+
+    async def events():
+        try:
+            messages, key, unique_rca_id, created_at, ruled = await prepare_rca(line_id, query)
+            if ruled is not None and not deep:
+                for name, value in ruled.items():
+                    yield sse("field", {"name": name, "value": value})
+                yield sse("result", await finish_rca(ruled, unique_rca_id, created_at))
+                return
+            stamped = {"rca_id": unique_rca_id, "created_at": created_at}
+            parser, parts = IncrementalJSONParser(), []
+            cached = llm_cache.get(key)
+
+            async def replay():
+                yield cached
+
+            try:
+                # aclosing ends the upstream call (and frees its slot) when the client disconnects
+                async with aclosing(replay() if cached is not None else llm.stream(messages, MODEL)) as chunks:
+                    async for text in chunks:
+                        parts.append(text)
+                        yield sse("token", {"text": text})
+                        for name, value in parser.feed(text):
+                            yield sse("field", {"name": name, "value": stamped.get(name, value)})
+                rca_result = parser.result()
+            except ValueError:
+                output = "".join(parts)
+                logger.error(f"Streamed LLM response was not a complete JSON object: {output}")
+                yield sse("error", {"error": "LLM did not return valid JSON.", "raw_output": output})
+                return
+            if cached is None:
+                llm_cache.put(key, "".join(parts).strip(), [line_id])
+            yield sse("result", await finish_rca(rca_result, unique_rca_id, created_at))
+        except Exception:
+            logger.exception("Unexpected error during streaming RCA processing.")
+            yield sse("error", {"error": "Internal server error."})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting RCA service on port 8001...")
@@ -0,0 +1,184 @@
+"""
+Rule-based RCA: known failure signals mapped to a root cause without a model call.
+
+The signals are the ACC policy violations (the messages of policies/*.rego),
+the ARL reconciliation exception (UTR/Amount/Currency mismatch), the PDR
+routing status and the Redis system_health snapshot. classify() returns an
+RCA in the same shape the LLM produces, or None when no rule applies; only
+those lines, and explicitly requested deep analyses, go to the model.
+"""
+import re
+from typing import Any, Dict, List, Optional
+
+from batch_rca import arl_reason, decision_reasons
+
+RULES_VERSION = "rules-1"
+
+ACC_FAILED = {"FAIL", "FAILED", "REJECTED", "EXCEPTION"}
+ACC_PASSED = {"PASS", "APPROVED"}
+PDR_ROUTED = {"ROUTED", "DISPATCHED", "SUCCESS", "COMPLETED"}
+PDR_FAILED = {"FAILED", "FAIL", "EXCEPTION"}
+CPU_CRITICAL_PERCENT = 90
+MEMORY_CRITICAL_PERCENT = 90
+
+# (rule, pattern over an ACC policy message, category, root cause, recommended action), first match wins
+ACC_RULES = [
+    ("acc_account_verification", re.compile(r"[Bb]ank account verification"), "Operational",
+     "Beneficiary bank account verification did not succeed, so ACC blocked the payment under policy {policy}.",
+     "1) Immediate: hold the payment and notify the sender. "
+     "2) RECEIVER: confirm account number and IFSC through penny-drop verification. "
+     "3) SENDER: update the beneficiary master with the verified details and resubmit. "
+     "4) BANK: keep verification mandatory before release, per RBI KYC Master Direction 2016."),
+    ("acc_kyc", re.compile(r"PAN|Aadhaar|KYC|CIBIL|[Bb]orrower verification"), "Regulatory",
+     "KYC / credit checks required by policy {policy} were not met.",
+     "1) Immediate: keep the payment on hold; do not release without completed KYC. "
+     "2) SENDER: obtain and verify the missing PAN/Aadhaar/CIBIL/borrower details. "
+     "3) BANK: re-run ACC once the records are updated. "
+     "4) Compliance: record the exception per RBI KYC Master Direction 2016 and PMLA requirements."),
+    ("acc_ifsc", re.compile(r"IFSC"), "Operational",
+     "An IFSC code in the instruction has an invalid format, so the payment could not be routed (policy {policy}).",
+     "1) Immediate: reject the line back to the sender. "
+     "2) SENDER/RECEIVER: correct the IFSC against the RBI IFSC directory. "
+     "3) BANK: validate IFSC format at file upload so the error is caught before ACC."),
+    ("acc_limit", re.compile(r"exceeds|limit"), "Regulatory",
+     "The amount exceeds the per-transaction limit enforced by policy {policy}.",
+     "1) Immediate: do not retry on the same rail. "
+     "2) SENDER: split the payment or resubmit for NEFT/RTGS. "
+     "3) BANK: route amounts above the UPI limit to NEFT/RTGS in PDR, per NPCI/RBI rail limits."),
+    ("acc_mandatory_field", re.compile(r"is mandatory|must be specified"), "Regulatory",
+     "Mandatory documentation for this payment type is missing (policy {policy}).",
+     "1) Immediate: return the line to the sender for completion. "
+     "2) SENDER: supply the missing fields (invoice, GSTIN, employee or loan details) and resubmit. "
+     "3) BANK: enforce the mandatory fields in the upload template."),
+    ("acc_invalid_instruction", re.compile(r"must be positive|must be INR|Unknown payment_type"), "Operational",
+     "The payment instruction is invalid (amount, currency or payment type) under policy {policy}.",
+     "1) Immediate: reject the line. "
+     "2) SENDER: correct the amount, currency or payment type and resubmit. "
+     "3) BANK: validate instruction fields at upload."),
+]
+
+ARL_RULES = {
+    "UTR mismatch": (
+        "arl_utr_mismatch", "Operational",
+        "Reconciliation failed: the UTR in the bank response does not match the UTR expected by PDR.",
+        "1) Immediate: keep the line open in reconciliation; do not re-send the payment. "
+        "2) BANK: trace the UTR with the remitting bank / NPCI and confirm the credit. "
+        "3) Post the journal manually once the UTR is confirmed. "
+        "4) Monitoring: alert on repeated UTR mismatches per rail."
+    ),
+    "Amount mismatch": (
+        "arl_amount_mismatch", "Operational",
+        "Reconciliation failed: the settled amount differs from the expected amount by more than the 1% tolerance.",
+        "1) Immediate: block auto-posting for the line. "
+        "2) BANK: obtain the settlement advice and identify charges or short credit. "
+        "3) SENDER/RECEIVER: confirm the amount and raise a claim for any shortfall. "
+        "4) Monitoring: track amount breaks per rail and counterparty."
+    ),
+    "Currency mismatch": (
+        "arl_currency_mismatch", "Operational",
+        "Reconciliation failed: the settlement currency differs from the expected currency.",
+        "1) Immediate: block auto-posting for the line. "
+        "2) BANK: confirm the settlement currency and any conversion with the correspondent. "
+        "3) SENDER: confirm the instructed currency; domestic rails settle only in INR."
+    ),
+}
+
+
+def _get(record: Optional[Dict[str, Any]], name: str) -> Any:
+    return record.get(name) if record else None
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, str):
+        value = value.strip().rstrip("%")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def system_alerts(redis: Optional[Dict[str, Any]]) -> List[str]:
+    """Thresholds breached in Redis system_health (cpu/cpu_usage, memory_usage, circuit breaker)"""
+    health = _get(redis, "system_health")
+    if not isinstance(health, dict):
+        return []
+    alerts = []
+    cpu = _number(health.get("cpu", health.get("cpu_usage")))
+    if cpu is not None and cpu >= CPU_CRITICAL_PERCENT:
+        alerts.append(f"CPU at {cpu:g}%")
+    memory = _number(health.get("memory_usage"))
+    if memory is not None and memory >= MEMORY_CRITICAL_PERCENT:
+        alerts.append(f"memory at {memory:g}%")
+    if str(health.get("circuit_breaker_status", "")).upper() == "OPEN":
+        alerts.append("circuit breaker OPEN")
+    return alerts
+
+
+def _result(rule: str, category: str, root_cause: str, action: str, signals: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "root_cause": root_cause,
+        "failure_category": category,
+        "recommended_action": action,
+        "evidence_refs": {"rule": rule, "rules_version": RULES_VERSION, **signals},
+        "analysis": "rules"
+    }
+
+
+def classify(acc: Optional[Dict[str, Any]], pdr: Optional[Dict[str, Any]], arl: Optional[Dict[str, Any]],
+             redis: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Root cause, category and action from known signals, or None when the line needs the LLM"""
+    acc_status = str(_get(acc, "status") or "").upper()
+    pdr_status = str(_get(pdr, "status") or "").upper()
+    arl_status = str(_get(arl, "match_status") or "").upper()
+    reasons = decision_reasons(acc)
+    exception = arl_reason(arl)
+    alerts = system_alerts(redis)
+    signals = {
+        "acc_status": acc_status or None,
+        "acc_decision_reason": reasons,
+        "acc_evidence_ref": _get(acc, "evidence_ref"),
+        "pdr_status": pdr_status or None,
+        "arl_match_reason": exception,
+        "system_alerts": alerts
+    }
+
+    if acc_status in ACC_FAILED:
+        for rule, pattern, category, cause, action in ACC_RULES:
+            if any(pattern.search(reason) for reason in reasons):
+                policy = _get(acc, "policy_version") or "in force"
+                root_cause = f"{cause.format(policy=policy)} Violations: {'; '.join(reasons)}"
+                return _result(rule, category, root_cause, action, signals)
+
+    if arl_status == "EXCEPTION" and exception in ARL_RULES:
+        rule, category, cause, action = ARL_RULES[exception]
+        return _result(rule, category, cause, action, signals)
+
+    if pdr_status == "UNROUTABLE":
+        return _result(
+            "pdr_unroutable", "Operational",
+            "PDR found no rail eligible for this amount, currency and beneficiary, so the payment was never dispatched.",
+            "1) Immediate: hold the line; nothing was sent. "
+            "2) BANK: check rail availability, limits and cut-offs in the routing configuration. "
+            "3) SENDER: resubmit in the next window or on a rail that supports the amount.",
+            signals
+        )
+
+    # A degraded platform explains a failed dispatch or an unexplained reconciliation break
+    if alerts and (pdr_status in PDR_FAILED or arl_status == "EXCEPTION"):
+        return _result(
+            "system_health", "Technical",
+            f"Processing failed while the platform was degraded: {', '.join(alerts)}.",
+            "1) Immediate: retry the line once system health is back under threshold. "
+            "2) BANK: scale the affected service and review the circuit-breaker trip. "
+            "3) Monitoring: alert before CPU/memory reach critical levels.",
+            signals
+        )
+
+    if acc_status in ACC_PASSED and pdr_status in PDR_ROUTED and arl_status == "MATCHED" and not alerts:
+        return _result(
+            "no_failure", "None",
+            "No failure: ACC passed all policy checks, PDR routed the payment and ARL matched UTR, amount and currency.",
+            "1) No action required. 2) Retain the decision and reconciliation records for audit.",
+            signals
+        )
+    return None
\ No newline at end of file
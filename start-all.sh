@@ -15,6 +15,9 @@ echo "🐳 Starting infrastructure services (Redis, Kafka, Zookeeper)..."
 docker-compose up -d redis kafka zookeeper
 sleep 5
 
+# ACC, PDR, ARL and RCA exchange decision/dispatch/exception events over Kafka
+export KAFKA_BOOTSTRAP_SERVERS=${KAFKA_BOOTSTRAP_SERVERS:-localhost:9092}
+
 # Install dependencies if needed
 echo "📦 Checking dependencies..."
 if [ ! -d "frontend/node_modules" ]; then